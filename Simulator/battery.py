@@ -1,11 +1,24 @@
-# battery.py
+import numpy as np
+
 class Battery:
-    def __init__(self, size_kwh, efficiency, floor=5.0):
+    def __init__(self, size_kwh, efficiency, floor=5.0, soc=100.0):
         self._size = size_kwh
-        self._soc = 100.0
+        self._soc = soc
         self._eff = efficiency
         self._floor = floor
 
+    @property
+    def soc(self):
+        return self._soc
+
+    @soc.setter
+    def soc(self, soc):
+        self._soc = soc
+
+    @property
+    def floor(self):
+        return self._floor
+
     def charge(self, energy):
         stored = energy * self._eff
         max_add = self._size * (100 - self._soc) / 100
@@ -18,3 +31,40 @@ class Battery:
         actual = min(energy / self._eff, usable)
         self._soc -= 100 * actual / self._size
         return actual
+
+    def snapshot(self):
+        return {"soc": float(self._soc)}
+
+    def restore(self, state):
+        self._soc = state["soc"]
+
+
+class BatteryBank:
+    """Many batteries at once (homes, scenarios...): same API as Battery, one array element per battery"""
+    __slots__ = ("_size", "_soc", "_eff", "_floor")
+
+    def __init__(self, size_kwh, efficiency, floor=5.0, soc=100.0):
+        self._size = np.asarray(size_kwh, dtype=np.float64)
+        self._soc = np.full(len(self._size), soc, dtype=np.float64)
+        self._eff = efficiency
+        self._floor = floor
+
+    def __len__(self):
+        return len(self._size)
+
+    @property
+    def soc(self):
+        return self._soc
+
+    def charge(self, energy):
+        stored = energy * self._eff
+        max_add = self._size * (100 - self._soc) / 100
+        actual = np.minimum(stored, max_add)
+        self._soc += 100 * actual / self._size
+        return actual
+
+    def discharge(self, energy):
+        usable = self._size * (self._soc - self._floor) / 100
+        actual = np.minimum(energy / self._eff, usable)
+        self._soc -= 100 * actual / self._size
+        return actual
@@ -0,0 +1,380 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import main
+import profiling
+import simulator
+import vectorized
+from utils import steps_per_day
+from log_buffer import LOG_COLUMNS, LogBuffer
+from log_store import save_column_store
+from run_stats import RunStatistics
+
+try:
+    import resource
+except ImportError:  # Unix only; peak RSS is then left out of the results
+    resource = None
+
+BENCHMARK_RESULTS_PATH = main.BASE_DIR.joinpath("benchmark_results.json")
+
+# Metrics checked for regressions: name -> True when higher is better
+REGRESSION_METRICS = {
+    "ticks_per_sec": True,
+    "peak_memory_mb": False,
+    "json_seconds": False,
+    "report_seconds": False,
+}
+
+def _sample_row(i):
+    """A representative log row (15 numbers + 2 flags)"""
+    x = float(i)
+    return (
+        50.0, x, x, x, x, False, x, x,
+        x, x, x, x, x, 0.0, x, False
+    )
+
+def bench_dataframe_append(n_ticks):
+    """Old logging path: grow the DataFrame one row at a time with .loc"""
+    df = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in LOG_COLUMNS.items()})
+    start = time.perf_counter()
+    for i in range(n_ticks):
+        df.loc[len(df)] = list(_sample_row(i))
+    return time.perf_counter() - start
+
+def bench_log_buffer(n_ticks):
+    """New logging path: preallocated column arrays, one DataFrame build at the end"""
+    start = time.perf_counter()
+    log = LogBuffer(n_ticks)
+    for i in range(n_ticks):
+        log.append(_sample_row(i))
+    log.to_dataframe()
+    return time.perf_counter() - start
+
+def bench_logging(tick_counts):
+    """Print ticks/sec of both logging paths for each run length"""
+    print(f"{'Ticks':>10} {'DataFrame .loc':>18} {'LogBuffer':>18} {'Speedup':>10}")
+    for n_ticks in tick_counts:
+        before = bench_dataframe_append(n_ticks)
+        after = bench_log_buffer(n_ticks)
+        print(f"{n_ticks:>10} {n_ticks / before:>14.0f} t/s {n_ticks / after:>14.0f} t/s {before / after:>9.1f}x")
+
+def bench_engines(days):
+    """Print ticks/sec of the SimPy and vectorized engines for every strategy"""
+    config = main.load_config_from_json(main.DEFAULT_CONFIG_PATH)
+    config["SIM_DURATION_DAY"] = days
+    n_ticks = days * steps_per_day(config["TIME_STEP_MIN"])
+    # Warm-up so a JIT-compiled dispatch kernel is not timed while compiling
+    vectorized.run(dict(config, SIM_DURATION_DAY=1), 0)
+
+    print(f"{'Strategy':>18} {'SimPy':>16} {'Vectorized':>16} {'Speedup':>10}")
+    for priority, name in main.PRIORITIES.items():
+        start = time.perf_counter()
+        main.run_simulation(config, priority, "simpy")
+        before = time.perf_counter() - start
+        start = time.perf_counter()
+        main.run_simulation(config, priority, "vectorized")
+        after = time.perf_counter() - start
+        print(f"{name:>18} {n_ticks / before:>12.0f} t/s {n_ticks / after:>12.0f} t/s {before / after:>9.1f}x")
+
+def bench_step(n_steps, priorities, seed):
+    """Print per-call latency percentiles of Simulator.step, with modelled and with measured inputs"""
+    config = main.load_config_from_json(main.DEFAULT_CONFIG_PATH, resolve_random=False)
+    config["SIM_DURATION_DAY"] = -(-n_steps // steps_per_day(config["TIME_STEP_MIN"]))
+    # Stand-in telemetry: a drawn run's solar and load as power readings, built before timing
+    step_hours = config["TIME_STEP_MIN"] / 60
+    inputs = vectorized.draw_inputs(main.resolve_random_values(config), np.random.default_rng(seed))
+    telemetry = [
+        {"solar_kw": solar / step_hours, "load_kw": load / step_hours, "inverter_down": down}
+        for solar, load, down in zip(inputs["solar"].tolist(), inputs["load"].tolist(),
+                                     inputs["inverter_down"].tolist())
+    ][:n_steps]
+
+    clock = time.perf_counter_ns
+    print(f"{'Strategy':>18} {'Inputs':>10} {'Mean us':>9} " + " ".join(f"{f'p{p} us':>8}" for p in profiling.PERCENTILES)
+          + f" {'Max us':>8}")
+    for priority in priorities:
+        for mode in ("modelled", "measured"):
+            sim = simulator.Simulator(config, priority, random.Random(seed))
+            step = sim.step
+            samples = np.empty(n_steps, dtype=np.int64)
+            for k in range(n_steps):
+                step_inputs = telemetry[k] if mode == "measured" else None
+                start = clock()
+                step(step_inputs)
+                samples[k] = clock() - start
+            latency = samples / 1000
+            percentiles = np.percentile(latency, profiling.PERCENTILES)
+            print(f"{main.PRIORITIES[priority]:>18} {mode:>10} {latency.mean():>9.2f} "
+                  + " ".join(f"{value:>8.2f}" for value in percentiles) + f" {latency.max():>8.1f}")
+
+def import_times(module):
+    """Cumulative import time (ms) of module, and of each import it pulls in directly, in a fresh interpreter"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=main.BASE_DIR, capture_output=True, text=True, check=True)
+    children = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested imports listed first, indented
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1000
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative) / 1000, children
+            children = {}
+    raise ValueError(f"No import time reported for {module}")
+
+def bench_startup(days, repeat, top):
+    """Print import time of main and the wall time of a short headless run, best of repeat"""
+    totals = []
+    for _ in range(repeat):
+        total, children = import_times("main")
+        totals.append(total)
+    heaviest = sorted(((ms, name) for name, ms in children.items()), reverse=True)[:top]
+
+    config = main.load_config_from_json(main.DEFAULT_CONFIG_PATH, resolve_random=False)
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp).joinpath("config.json")
+        with open(config_path, "w") as f:
+            json.dump(dict(config, SIM_DURATION_DAY=days), f)
+        command = [sys.executable, "main.py", "--config", str(config_path), "--seed", "0", "--summary-only",
+                   "--no-report", "--summary", str(Path(tmp).joinpath("summary.json"))]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=main.BASE_DIR, capture_output=True, check=True)
+            runs.append(time.perf_counter() - start)
+
+    print(f"import main: {min(totals):.0f} ms")
+    for ms, name in heaviest:
+        print(f"  {name:<24} {ms:>8.1f} ms")
+    print(f"Headless {days}-day run (--summary-only --no-report): {min(runs):.2f} s")
+
+class _Timed:
+    """Wraps a function and adds up the wall time spent in it"""
+    def __init__(self, func):
+        self.func = func
+        self.seconds = 0.0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+@contextlib.contextmanager
+def _patched(module, **values):
+    """Temporarily replace module attributes (e.g. output paths)"""
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def bench_case(config, priority, engine, days, step_min, seed, out_dir, with_report=True):
+    """Time one headless run and its log serialization and report"""
+    config = dict(config, SIM_DURATION_DAY=days, TIME_STEP_MIN=step_min)
+    n_ticks = days * steps_per_day(step_min)
+
+    # Time spent writing log rows, split out from the dispatch loop
+    log_module, log_func = (simulator, "write_to_df") if engine == "simpy" else (vectorized, "build_log")
+    timed_log = _Timed(getattr(log_module, log_func))
+    stats = RunStatistics.from_config(config)
+    with _patched(log_module, **{log_func: timed_log}):
+        start = time.perf_counter()
+        log = main.run_simulation(config, priority, engine, seed, stats=stats)
+        seconds = time.perf_counter() - start
+
+    # Peak memory from a second, untimed run: tracing slows everything down
+    tracemalloc.start()
+    main.run_simulation(config, priority, engine, seed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "engine": engine,
+        "priority": main.PRIORITIES[priority],
+        "days": days,
+        "step_min": step_min,
+        "ticks": n_ticks,
+        "seconds": seconds,
+        "ticks_per_sec": n_ticks / seconds,
+        "log_seconds": timed_log.seconds,
+        "dispatch_seconds": seconds - timed_log.seconds,
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+
+    log_df = log.to_dataframe()
+    with _patched(main, LOG_JSON_PATH=out_dir.joinpath("log.json")):
+        start = time.perf_counter()
+        main.save_log_to_json(log_df)
+        result["json_seconds"] = time.perf_counter() - start
+
+    if with_report:
+        import reporting
+        save_column_store(log_df, out_dir.joinpath("log_store"), {"config": config})
+        summary = stats.summary()
+        summary["logged"] = True
+        with open(out_dir.joinpath("log_summary.json"), "w") as f:
+            json.dump(summary, f)
+        outputs = {
+            "LOG_FILE_PATH": out_dir.joinpath("log.csv"),
+            "LOG_STORE_PATH": out_dir.joinpath("log_store"),
+            "LOG_SUMMARY_PATH": out_dir.joinpath("log_summary.json"),
+            "SOC_CHART_PATH": out_dir.joinpath("report_soc.png"),
+            "ENERGY_CHART_PATH": out_dir.joinpath("report_energy.png"),
+            "FINANCIAL_CHART_PATH": out_dir.joinpath("report_financial.png"),
+            "TARIFF_CHART_PATH": out_dir.joinpath("report_tariffs.png"),
+            "REPORT_CACHE_PATH": out_dir.joinpath("report_cache.json"),
+        }
+        with _patched(reporting, **outputs), contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            reporting.generate_report()
+            result["report_seconds"] = time.perf_counter() - start
+    return result
+
+def bench_suite(horizons, steps, priorities, engine, seed, with_report=True):
+    """Run every horizon x time step x strategy case and collect the results"""
+    if with_report:
+        # Charts are written to files only
+        import matplotlib
+        matplotlib.use("Agg")
+    config = main.load_config_from_json(main.DEFAULT_CONFIG_PATH, resolve_random=False)
+    # Warm-up so a JIT-compiled dispatch kernel is not timed while compiling
+    main.run_simulation(dict(config, SIM_DURATION_DAY=1), 0, engine, seed)
+
+    cases = []
+    print(f"{'Strategy':>18} {'Days':>6} {'Step':>6} {'Ticks/s':>10} {'Log %':>7} {'Peak MB':>9} {'JSON s':>8} {'Report s':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for days in horizons:
+            for step_min in steps:
+                for priority in priorities:
+                    case = bench_case(config, priority, engine, days, step_min, seed, Path(tmp), with_report)
+                    cases.append(case)
+                    report = f"{case['report_seconds']:>9.2f}" if with_report else f"{'-':>9}"
+                    print(f"{case['priority']:>18} {days:>6} {step_min:>6} {case['ticks_per_sec']:>10.0f} "
+                          f"{100 * case['log_seconds'] / case['seconds']:>6.1f}% {case['peak_memory_mb']:>9.1f} "
+                          f"{case['json_seconds']:>8.2f} {report}")
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": cases,
+    }
+
+def _case_key(case):
+    return (case["engine"], case["priority"], case["days"], case["step_min"])
+
+def compare_results(baseline, current, threshold):
+    """Print metric changes against a baseline; return the regressions beyond threshold (a fraction)"""
+    baseline_cases = {_case_key(case): case for case in baseline["cases"]}
+    regressions = []
+    print(f"{'Case':<40} {'Metric':<16} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+    for case in current["cases"]:
+        before = baseline_cases.get(_case_key(case))
+        if before is None:
+            continue
+        name = "{} {}d {}min {}".format(case["priority"], case["days"], case["step_min"], case["engine"])
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            if metric not in case or metric not in before or not before[metric]:
+                continue
+            change = (case[metric] - before[metric]) / before[metric]
+            worse = -change if higher_is_better else change
+            flag = " REGRESSION" if worse > threshold else ""
+            print(f"{name:<40} {metric:<16} {before[metric]:>10.2f} {case[metric]:>10.2f} {100 * change:>+7.1f}%{flag}")
+            if flag:
+                regressions.append((name, metric, change))
+    return regressions
+
+def load_results(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulator micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+    logging_parser = subparsers.add_parser("logging", help="Per-tick logging cost")
+    logging_parser.add_argument("--ticks", type=int, nargs="+", default=[720, 8760],
+                                help="Run lengths to benchmark (720 = 30 days hourly)")
+    engines_parser = subparsers.add_parser("engines", help="SimPy vs vectorized engine throughput")
+    engines_parser.add_argument("--days", type=int, default=3650, help="Simulated days")
+    step_parser = subparsers.add_parser("step", help="Per-step latency of the library Simulator.step()")
+    step_parser.add_argument("--steps", type=int, default=100_000, help="Steps timed per case")
+    step_parser.add_argument("--priorities", type=int, nargs="+", choices=sorted(main.PRIORITIES),
+                             default=sorted(main.PRIORITIES), help="Strategies to run")
+    step_parser.add_argument("--seed", type=int, default=0, help="Seed")
+    suite_parser = subparsers.add_parser("suite", help="Full headless suite, results saved as JSON")
+    suite_parser.add_argument("--days", type=int, nargs="+", default=[30, 365, 3650], help="Horizons (days)")
+    suite_parser.add_argument("--steps", type=int, nargs="+", default=[60, 15], help="TIME_STEP_MIN values")
+    suite_parser.add_argument("--priorities", type=int, nargs="+", choices=sorted(main.PRIORITIES),
+                              default=sorted(main.PRIORITIES), help="Strategies to run")
+    suite_parser.add_argument("--engine", choices=["simpy", "vectorized"], default="simpy", help="Simulation engine")
+    suite_parser.add_argument("--seed", type=int, default=0, help="Seed, so runs compare like for like")
+    suite_parser.add_argument("--no-report", action="store_true", help="Skip timing generate_report")
+    suite_parser.add_argument("--output", default=str(BENCHMARK_RESULTS_PATH), help="Results JSON file")
+    suite_parser.add_argument("--baseline", default=None, help="Results JSON to check for regressions against")
+    suite_parser.add_argument("--threshold", type=float, default=0.25,
+                              help="Allowed slowdown/growth as a fraction (0.25 = 25%%)")
+    startup_parser = subparsers.add_parser("startup", help="Import time and headless run wall time")
+    startup_parser.add_argument("--days", type=int, default=1, help="Simulated days of the headless run")
+    startup_parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept)")
+    startup_parser.add_argument("--top", type=int, default=8, help="Heaviest imports to list")
+    compare_parser = subparsers.add_parser("compare", help="Regression check between two results files")
+    compare_parser.add_argument("baseline", help="Baseline results JSON")
+    compare_parser.add_argument("current", help="Current results JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.25,
+                                help="Allowed slowdown/growth as a fraction (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.bench == "logging":
+        bench_logging(args.ticks)
+    elif args.bench == "engines":
+        bench_engines(args.days)
+    elif args.bench == "step":
+        bench_step(args.steps, args.priorities, args.seed)
+    elif args.bench == "startup":
+        bench_startup(args.days, args.repeat, args.top)
+    elif args.bench in ("suite", "compare"):
+        if args.bench == "suite":
+            current = bench_suite(args.days, args.steps, args.priorities, args.engine, args.seed, not args.no_report)
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+            print(f"Benchmark results saved to: {args.output}")
+            baseline = load_results(args.baseline) if args.baseline else None
+        else:
+            current = load_results(args.current)
+            baseline = load_results(args.baseline)
+        if baseline is not None:
+            regressions = compare_results(baseline, current, args.threshold)
+            if regressions:
+                print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+                sys.exit(1)
+            print("No regressions.")
@@ -0,0 +1,106 @@
+# checkpoint.py
+import json
+import os
+import shutil
+import numpy as np
+from log_buffer import LogBuffer
+from log_store import ColumnStore, ColumnStoreWriter, StreamingLogWriter
+
+STATE_FILE = "state.json"
+# Rows of an in-memory log, saved alongside the state
+LOG_DIR = "log"
+CHECKPOINT_VERSION = 1
+
+
+class Checkpointer:
+    """Saves a running Simulator to a directory every interval_days, so a crashed run can resume
+
+    A checkpoint is the simulator's snapshot() plus the position of its log:
+    a StreamingLogWriter is already on disk, so only its position is kept;
+    the rows of an in-memory LogBuffer are appended to a column store in the
+    checkpoint directory. The state file is replaced last, so a crash while
+    saving leaves the previous checkpoint usable.
+    """
+    def __init__(self, directory, interval_days=30):
+        self.directory = directory
+        self._interval_days = interval_days
+        self._next_tick = None
+        self._log_writer = None
+        # The loaded checkpoint, when resuming
+        self.state = None
+
+    def exists(self):
+        return self.directory.joinpath(STATE_FILE).exists()
+
+    def load(self):
+        """Read the saved checkpoint: {"config", "priority", "state", "log"}"""
+        with open(self.directory.joinpath(STATE_FILE), "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Checkpoint {self.directory} has an unsupported version: {checkpoint.get('version')}")
+        self.state = checkpoint
+        return checkpoint
+
+    def restore_log(self, config):
+        """A LogBuffer holding the rows the loaded checkpoint had logged"""
+        rows = self.state["log"]["rows"]
+        log = LogBuffer.from_config(config)
+        if rows:
+            store = ColumnStore(self.directory.joinpath(LOG_DIR))
+            # The store may hold rows saved after the state file was last replaced
+            log.append_columns({name: np.asarray(store.column(name)[:rows]) for name in store.columns})
+        return log
+
+    def restore(self, sim):
+        """Bring a Simulator built from the checkpoint's config to the loaded checkpoint"""
+        sim.restore(self.state["state"])
+        self._next_tick = None
+
+    def maybe_save(self, sim):
+        """Save when the run has passed the next interval (call between steps)"""
+        if self._next_tick is None:
+            self._next_tick = self._following_tick(sim)
+        if sim.tick >= self._next_tick and sim.tick < sim.total_steps:
+            self.save(sim)
+            self._next_tick = self._following_tick(sim)
+
+    def _following_tick(self, sim):
+        interval = max(1, int(self._interval_days * sim.steps_per_day))
+        return (sim.tick // interval + 1) * interval
+
+    def save(self, sim):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "config": sim.config,
+            "priority": sim.priority,
+            "state": sim.snapshot(),
+            "log": self._save_log(sim.log),
+        }
+        # Write-then-rename so a crash mid-save keeps the last complete checkpoint
+        tmp_path = self.directory.joinpath(STATE_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.directory.joinpath(STATE_FILE))
+
+    def _save_log(self, log):
+        """Persist what the state file needs to get the log back, and return its position"""
+        if isinstance(log, StreamingLogWriter):
+            return log.position()
+        if not isinstance(log, LogBuffer):
+            return {"rows": 0}
+        if self._log_writer is None:
+            # Continue the store of the checkpoint this run resumed from, if it had rows
+            resume_rows = (self.state["log"]["rows"] or None) if self.state is not None else None
+            self._log_writer = ColumnStoreWriter(self.directory.joinpath(LOG_DIR), resume_rows=resume_rows)
+        new_rows = log.columns(start=len(self._log_writer))
+        if len(new_rows["Battery state of charge"]):
+            self._log_writer.write(new_rows)
+        return {"rows": len(log)}
+
+    def clear(self):
+        """Delete the checkpoint, e.g. once the run has finished"""
+        if self._log_writer is not None:
+            self._log_writer.close()
+            self._log_writer = None
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import main
+from log_buffer import NullLog
+from results_store import ResultsStore, is_cacheable
+from run_stats import RunStatistics
+
+ENSEMBLE_SUMMARY_PATH = main.BASE_DIR.joinpath("ensemble_summary.json")
+
+# Two-sided 95% normal quantile for the confidence interval of the mean
+Z_95 = 1.959963984540054
+
+def spawn_seeds(seed_sequence, n_runs):
+    """n_runs integer seeds spawned from a NumPy SeedSequence"""
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in seed_sequence.spawn(n_runs)]
+
+def replication_seeds(seed, n_runs):
+    """Independent per-run seeds spawned from one master seed"""
+    return spawn_seeds(np.random.SeedSequence(seed), n_runs)
+
+def run_replication(config, priority, engine, seed, antithetic=False):
+    """Run one seeded replication and return its summary metrics
+
+    With RESULTS_STORE set, replications already in the store are not re-run
+    and new ones are added to it.
+    """
+    store = None
+    if config.get("RESULTS_STORE") and is_cacheable(config, seed):
+        store = ResultsStore.from_config(config, main.BASE_DIR)
+        cached = store.get(config, priority, engine, seed, with_log=False, antithetic=antithetic)
+        if cached is not None:
+            store.close()
+            summary = cached["summary"]
+            del summary["statistics"]
+            return summary
+    stats = RunStatistics.from_config(config)
+    # Summary-only: per-tick rows are never logged
+    main.run_simulation(config, priority, engine, seed, log=NullLog(), stats=stats, antithetic=antithetic)
+    summary = stats.summary()
+    if store is not None:
+        store.put(config, priority, engine, seed, summary, antithetic=antithetic)
+        store.close()
+    # Per-series distributions are kept out of the merged ensemble metrics
+    del summary["statistics"]
+    return summary
+
+def flatten_summary(summary, prefix=""):
+    """{"battery": {"avg_soc": x}} -> {"battery.avg_soc": x}"""
+    flat = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            flat.update(flatten_summary(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def unit_values(values, paired=False):
+    """The independent values behind a metric's confidence interval: each run, or each antithetic pair's mean"""
+    return values.reshape(-1, 2).mean(axis=1) if paired else values
+
+def per_run_variance(values, paired=False):
+    """Variance of the metric's mean times the number of runs: the spread one run adds to the estimate"""
+    units = unit_values(values, paired)
+    if len(units) < 2:
+        return 0.0
+    return float(units.var(ddof=1) * len(values) / len(units))
+
+def merge_summaries(summaries, paired=False):
+    """Mean, spread, percentiles and a 95% confidence interval of each metric across runs
+
+    With paired set, summaries are antithetic pairs (plain run, mirrored run)
+    and the interval is taken over the pair means, which are independent.
+    """
+    flat = [flatten_summary(summary) for summary in summaries]
+    n_runs = len(flat)
+    merged = {}
+    for metric in flat[0]:
+        values = np.array([run[metric] for run in flat], dtype=np.float64)
+        mean = values.mean()
+        std = values.std(ddof=1) if n_runs > 1 else 0.0
+        half_width = Z_95 * np.sqrt(per_run_variance(values, paired) / n_runs)
+        p5, p50, p95 = np.percentile(values, [5, 50, 95])
+        merged[metric] = {
+            "mean": mean,
+            "std": std,
+            "min": values.min(),
+            "p5": p5,
+            "p50": p50,
+            "p95": p95,
+            "max": values.max(),
+            "ci95_low": mean - half_width,
+            "ci95_high": mean + half_width,
+        }
+    # Plain floats so the result is JSON serializable
+    return {metric: {k: float(v) for k, v in stats.items()} for metric, stats in merged.items()}
+
+def replicate(executor, config, priority, engine, seeds, antithetic, workers):
+    """Summaries of one run per seed, or of a plain and a mirrored run per seed when antithetic"""
+    flags = [False, True] if antithetic else [False]
+    seeds = [seed for seed in seeds for _ in flags]
+    flags = flags * (len(seeds) // len(flags))
+    return list(executor.map(
+        run_replication, repeat(config), repeat(priority), repeat(engine), seeds, flags,
+        chunksize=max(1, len(seeds) // (4 * workers)),
+    ))
+
+def run_ensemble(config, priority, n_runs, seed=None, engine="simpy", workers=None, antithetic=False):
+    """Run n_runs independent replications of one config in parallel worker processes
+
+    Antithetic, the runs are n_runs / 2 pairs of a plain and a mirrored run.
+    """
+    seeds = replication_seeds(seed, n_runs // 2 if antithetic else n_runs)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = replicate(executor, config, priority, engine, seeds, antithetic, workers)
+    return {
+        "runs": len(summaries),
+        "priority": main.PRIORITIES[priority],
+        "engine": engine,
+        "antithetic": antithetic,
+        "stratified": bool(config.get("CLOUD_STRATIFIED", False)),
+        "seeds": seeds,
+        "metrics": merge_summaries(summaries, antithetic),
+    }
+
+def run_to_target(config, priority, metric, half_width, seed=None, engine="simpy", workers=None,
+                  antithetic=False, batch_runs=20, max_runs=2000, pilot_runs=0):
+    """Add batches of replications until the 95% CI half-width of metric is at most half_width
+
+    The result also reports the variance reduction: the per-run variance of
+    plain i.i.d. runs (from pilot_runs plain runs, or from the antithetic runs
+    themselves when the clouds are not stratified, since mirroring leaves each
+    run's distribution unchanged) over the per-run variance achieved, and how
+    many plain runs the same half-width would have taken.
+    """
+    main_sequence, pilot_sequence = np.random.SeedSequence(seed).spawn(2)
+    seeds = spawn_seeds(main_sequence, max_runs // 2 if antithetic else max_runs)
+    per_batch = max(1, batch_runs // 2) if antithetic else max(2, batch_runs)
+    workers = workers or os.cpu_count()
+    summaries = []
+    used = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        plain_variance = None
+        if pilot_runs > 1:
+            plain_config = dict(config, CLOUD_STRATIFIED=False)
+            pilot = replicate(executor, plain_config, priority, engine, spawn_seeds(pilot_sequence, pilot_runs),
+                              False, workers)
+            plain_variance = per_run_variance(np.array([flatten_summary(run)[metric] for run in pilot]))
+        while used < len(seeds):
+            batch = seeds[used:used + per_batch]
+            used += len(batch)
+            summaries += replicate(executor, config, priority, engine, batch, antithetic, workers)
+            values = np.array([flatten_summary(run)[metric] for run in summaries])
+            achieved = Z_95 * np.sqrt(per_run_variance(values, antithetic) / len(values))
+            if len(unit_values(values, antithetic)) > 1 and achieved <= half_width:
+                break
+
+    variance = per_run_variance(values, antithetic)
+    if plain_variance is None and not config.get("CLOUD_STRATIFIED"):
+        plain_variance = float(values.var(ddof=1))
+    reduction = None
+    if plain_variance is not None:
+        reduction = {
+            "plain_variance": plain_variance,
+            "variance": variance,
+            "factor": plain_variance / variance if variance > 0 else float("inf"),
+            "plain_runs_needed": int(np.ceil((Z_95 / half_width) ** 2 * plain_variance)),
+            "pilot_runs": pilot_runs if pilot_runs > 1 else 0,
+        }
+    return {
+        "runs": len(summaries),
+        "priority": main.PRIORITIES[priority],
+        "engine": engine,
+        "antithetic": antithetic,
+        "stratified": bool(config.get("CLOUD_STRATIFIED", False)),
+        "seeds": seeds[:used],
+        "target": {
+            "metric": metric,
+            "half_width": half_width,
+            "achieved": float(achieved),
+            "reached": bool(achieved <= half_width),
+        },
+        "variance_reduction": reduction,
+        "metrics": merge_summaries(summaries, antithetic),
+    }
+
+def print_ensemble(result):
+    """Print the mean and 95% CI of every metric"""
+    print("\n" + "="*72)
+    print(f"   ENSEMBLE OF {result['runs']} RUNS - {result['priority']} ({result['engine']} engine)")
+    print("="*72)
+    print(f"{'Metric':<34} {'Mean':>11} {'95% CI':>24}")
+    for metric, stats in result["metrics"].items():
+        ci = f"[{stats['ci95_low']:.2f}, {stats['ci95_high']:.2f}]"
+        print(f"{metric:<34} {stats['mean']:>11.2f} {ci:>24}")
+    print("="*72)
+    sampling = [name for name in ("antithetic", "stratified") if result.get(name)]
+    if sampling:
+        print(f"Sampling: {' + '.join(sampling)}")
+    target = result.get("target")
+    if target is not None:
+        status = "reached" if target["reached"] else "NOT reached"
+        print(f"Target: {target['metric']} 95% CI half-width <= {target['half_width']:g} "
+              f"({status}: {target['achieved']:.3f} after {result['runs']} runs)")
+        reduction = result["variance_reduction"]
+        if reduction is not None:
+            source = f"{reduction['pilot_runs']} plain pilot runs" if reduction["pilot_runs"] else "the runs themselves"
+            print(f"Variance reduction: {reduction['factor']:.2f}x (per-run variance {reduction['variance']:.4g} "
+                  f"vs {reduction['plain_variance']:.4g} plain, estimated from {source})")
+            print(f"Plain i.i.d. runs needed for the same half-width: about {reduction['plain_runs_needed']}")
+    print()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run independent seeded replications of one configuration")
+    parser.add_argument("--config", default=str(main.DEFAULT_CONFIG_PATH), help="Configuration JSON file")
+    parser.add_argument("--priority", type=int, choices=sorted(main.PRIORITIES), default=0,
+                        help="Strategy: " + ", ".join(f"{k}={v}" for k, v in main.PRIORITIES.items()))
+    parser.add_argument("--runs", type=int, default=20, help="Number of replications")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed (random if omitted)")
+    parser.add_argument("--engine", choices=["simpy", "vectorized"], default=None,
+                        help="Simulation engine (defaults to the config's ENGINE)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="Run mirrored pairs: each seed once plain and once with its uniforms mirrored (vectorized engine)")
+    parser.add_argument("--stratified", action="store_true",
+                        help="Stratify each season's daily cloud categories (vectorized engine)")
+    parser.add_argument("--metric", default="financial.net_profit",
+                        help="Summary metric of the --half-width target, e.g. unmet_load_count")
+    parser.add_argument("--half-width", type=float, default=None,
+                        help="Add batches of --runs runs until the metric's 95%% CI half-width is at most this")
+    parser.add_argument("--max-runs", type=int, default=2000, help="Run budget when a --half-width is set")
+    parser.add_argument("--pilot-runs", type=int, default=0,
+                        help="Plain runs to estimate the variance reduction against (needed with --stratified)")
+    args = parser.parse_args()
+
+    # "random" values are drawn per replication from that run's own generator
+    config = main.load_config_from_json(args.config, resolve_random=False)
+    if config is None:
+        exit(1)
+    engine = args.engine or config.get("ENGINE", "simpy")
+    if (args.stratified or args.antithetic) and engine != "vectorized":
+        print("Error: --antithetic and --stratified need the vectorized engine (--engine vectorized)")
+        exit(1)
+    if args.stratified:
+        config["CLOUD_STRATIFIED"] = True
+    if args.antithetic and args.runs < 2:
+        print("Error: --antithetic needs at least 2 runs (one pair)")
+        exit(1)
+
+    if args.half_width is not None:
+        # Metrics as merged: the per-series statistics are left out
+        known = RunStatistics().summary()
+        del known["statistics"]
+        if args.metric not in flatten_summary(known):
+            print(f"Error: unknown metric: {args.metric}")
+            exit(1)
+        result = run_to_target(config, args.priority, args.metric, args.half_width, args.seed, engine, args.workers,
+                               args.antithetic, args.runs, max(2, args.max_runs), args.pilot_runs)
+    else:
+        result = run_ensemble(config, args.priority, args.runs, args.seed, engine, args.workers, args.antithetic)
+    print_ensemble(result)
+    with open(ENSEMBLE_SUMMARY_PATH, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Ensemble summary saved to: {ENSEMBLE_SUMMARY_PATH}")
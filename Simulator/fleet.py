@@ -0,0 +1,312 @@
+# fleet.py
+import argparse
+import math
+import numpy as np
+import pandas as pd
+import main
+import vectorized
+from battery import BatteryBank
+from grid import CommunityGrid
+from house_load import APPLIANCES
+from strategies import STRATEGIES
+from run_stats import RunStatistics
+from utils import DAYS_PER_YEAR, MINUTES_PER_DAY, step_probability
+
+FLEET_HOMES_PATH = main.BASE_DIR.joinpath("fleet_homes.csv")
+FLEET_STORE_PATH = main.BASE_DIR.joinpath("fleet_store")
+FLEET_FEEDER_PATH = main.BASE_DIR.joinpath("fleet_feeder.csv")
+
+# Per-home series kept by HomeLog, one (ticks x homes) array each
+HOME_SERIES = ["soc", "solar", "load", "grid_import", "grid_export", "unmet", "export_curtailed", "import_curtailed"]
+
+
+class SolarFleet:
+    """Solar panels of every home; the feeder shares the daily cloud base, clouds vary per home"""
+    def __init__(self, capacity, rng):
+        self._capacity = np.asarray(capacity, dtype=np.float64)
+        self._rng = rng
+        self._hourly_cloud = None
+        self._clock_hour = None
+
+    def generate(self, hour, daily_cloud_base, inverter_limit, inverter_down):
+        n_homes = len(self._capacity)
+        # Sub-hourly steps share their clock hour's cloud cover
+        if int(hour) != self._clock_hour:
+            self._clock_hour = int(hour)
+            self._hourly_cloud = None
+
+        if hour < 6 or hour > 18:
+            return np.zeros(n_homes)
+
+        if self._hourly_cloud is None:
+            # Hourly cloud variation, plus brief heavy clouds (10% chance per hour)
+            hourly_cloud = np.clip(daily_cloud_base + self._rng.uniform(-0.3, 0.3, n_homes), 0.0, 0.95)
+            heavy = self._rng.random(n_homes) < 0.1
+            self._hourly_cloud = np.where(
+                heavy, np.minimum(0.95, hourly_cloud + self._rng.uniform(0.2, 0.5, n_homes)), hourly_cloud
+            )
+
+        raw = self._capacity * math.sin((hour - 6) * (math.pi / 12))
+        clipped = np.minimum(raw, inverter_limit)
+        return np.where(inverter_down, 0.0, clipped * (1 - self._hourly_cloud))
+
+
+class InverterFleet:
+    """Inverter of every home: one down-until time (simulation minutes) per home"""
+    def __init__(self, failure_freq, failure_duration, rng, step_hours=1):
+        self._failure_duration = np.asarray(failure_duration) * 60 # Hours -> simulation minutes
+        self._down_until = np.full(len(self._failure_duration), -1.0)
+        self._failure_prob = step_probability(failure_freq / 24, step_hours)
+        self._rng = rng
+
+    def is_down(self, now):
+        down = now < self._down_until
+        failed = ~down & (self._rng.random(len(down)) < self._failure_prob)
+        self._down_until[failed] = now + self._failure_duration[failed]
+        return down | failed
+
+
+class HouseLoadFleet:
+    """House load of every home; active appliances are a (homes x appliances) matrix of remaining steps"""
+    def __init__(self, base_load, spikes_max, rng, step_hours=1):
+        self._base = np.asarray(base_load, dtype=np.float64)
+        self._spikes_max = spikes_max
+        self._rng = rng
+        self._power = np.array([power for power, _, _ in APPLIANCES.values()])
+        self._duration = np.array([math.ceil(duration / step_hours) for _, duration, _ in APPLIANCES.values()])
+        self._prob = np.array([step_probability(prob, step_hours) for _, _, prob in APPLIANCES.values()])
+        self._remaining = np.zeros((len(self._base), len(APPLIANCES)), dtype=np.int64)
+        self._spike = np.zeros(len(self._base))
+        self._clock_hour = None
+
+    def demand(self, hour, day_of_week, season):
+        n_homes = len(self._base)
+        weekend = day_of_week >= 5
+        factor = 1.3 if weekend else 1.0
+        if season == "Summer":
+            factor *= 1.5
+        elif season == "Winter":
+            factor *= 1.6
+        load = self._base * factor
+
+        # Random noise
+        load += np.maximum(0.0, self._rng.normal(0.0, 0.1, n_homes))
+
+        # Evening spikes, drawn once per clock hour and held for its sub-hourly steps
+        if int(hour) != self._clock_hour:
+            self._clock_hour = int(hour)
+            self._spike = np.zeros(n_homes)
+            if 18 <= hour <= 21:
+                hit = self._rng.random(n_homes) < (0.6 if weekend else 0.4)
+                self._spike = np.where(hit, self._rng.uniform(0.5, self._spikes_max, n_homes), 0.0)
+        load += self._spike
+
+        return load + self._appliance_load(weekend)
+
+    def _appliance_load(self, weekend):
+        remaining = self._remaining
+        np.maximum(remaining - 1, 0, out=remaining)
+        prob = self._prob * 1.5 if weekend else self._prob
+        start = (remaining == 0) & (self._rng.random(remaining.shape) < prob)
+        np.copyto(remaining, self._duration, where=start)
+        return (remaining > 0) @ self._power
+
+
+def draw_home_parameters(config, n_homes, spread, rng):
+    """Per-home battery size, PV capacity, base load and inverter outage length, +/- spread around the config"""
+    def around(value):
+        return value * rng.uniform(1 - spread, 1 + spread, n_homes)
+
+    duration = config["INVERTER_FAILURE_DURATION"]
+    return {
+        "battery_size": around(config["BATTERY_SIZE"]),
+        "solar_capacity": around(config["PEAK_SOLAR_GENERATION"]),
+        "base_load": around(config["ENERGY_BASE_LOAD"]),
+        "inverter_failure_duration": (
+            rng.integers(4, 73, n_homes) if duration == "random" else np.full(n_homes, duration)
+        ),
+    }
+
+
+class HomeLog:
+    """Per-home per-tick log: one memory-mapped .npy file (ticks x homes, float32) per series"""
+    def __init__(self, directory, n_ticks, n_homes):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self._arrays = {
+            name: np.lib.format.open_memmap(
+                directory.joinpath(f"{name}.npy"), mode="w+", dtype=np.float32, shape=(n_ticks, n_homes)
+            )
+            for name in HOME_SERIES
+        }
+
+    def write(self, k, values):
+        for name, array in self._arrays.items():
+            array[k] = values[name]
+
+    def close(self):
+        for array in self._arrays.values():
+            array.flush()
+
+
+def run_fleet(config, priority, n_homes, spread=0.2, seed=None, log=None, stats=None, home_log_dir=None,
+              feeder_export_limit=None, feeder_import_limit=None, fairness="equal"):
+    """Simulate n_homes homes on one feeder, every tick advancing all homes in one batched step
+
+    Returns the feeder log (homes summed, SOC averaged, in the usual log
+    columns), a DataFrame of each home's parameters and run totals, and a
+    DataFrame of the feeder's per-tick flows, curtailment and utilisation
+    of the feeder limits (kW, None for no limit).
+    """
+    rng = np.random.default_rng(seed)
+    params = draw_home_parameters(config, n_homes, spread, rng)
+    step_hours = config["TIME_STEP_MIN"] / 60
+
+    batteries = BatteryBank(params["battery_size"], config["BATTERY_ROUND_TRIP_EFFICIENCY"])
+    panels = SolarFleet(params["solar_capacity"], rng)
+    loads = HouseLoadFleet(params["base_load"], config["RANDOM_SPIKES_MAX"], rng, step_hours)
+    inverters = InverterFleet(
+        config["INVERTER_FAILURE_FREQUENCY"], params["inverter_failure_duration"], rng, step_hours
+    )
+    grid = CommunityGrid(
+        n_homes, config["GRID_MAX_EXPORT_LIMIT"], config["GRID_MAX_IMPORT_LIMIT"], config["IS_ZERO_EXPORT"],
+        feeder_export_limit, feeder_import_limit, fairness, step_hours,
+    )
+
+    # The same dispatch kernel as a single home, on arrays of homes
+    dispatch = STRATEGIES[priority].step
+
+    now = vectorized.tick_times(config)
+    n_ticks = len(now)
+    day_idx = now // MINUTES_PER_DAY
+    days = config["SIM_START_DAY"] + np.arange(day_idx[-1] + 1)
+    seasons = vectorized.season_index(days % DAYS_PER_YEAR)
+    cloud_base = vectorized.draw_cloud_bases(seasons, rng)
+
+    # Feeder aggregates per tick
+    feeder = {name: np.empty(n_ticks) for name in HOME_SERIES}
+    feeder_down = np.empty(n_ticks, dtype=bool)
+    # Per-home run totals
+    totals = {name: np.zeros(n_homes) for name in HOME_SERIES if name != "soc"}
+    unmet_events = np.zeros(n_homes, dtype=np.int64)
+    down_ticks = np.zeros(n_homes, dtype=np.int64)
+    home_log = HomeLog(home_log_dir, n_ticks, n_homes) if home_log_dir is not None else None
+
+    for k in range(n_ticks):
+        hour = (now[k] % MINUTES_PER_DAY) / 60
+        day = int(days[day_idx[k]])
+        season = vectorized.SEASONS[seasons[day_idx[k]]]
+
+        inverter_down = inverters.is_down(now[k])
+        solar = panels.generate(hour, cloud_base[day_idx[k]], config["INVERTER_MAX_OUTPUT_LIMIT"], inverter_down)
+        load = loads.demand(hour, day % 7, season)
+        solar *= step_hours
+        load *= step_hours
+        grid_import, grid_export, unmet = dispatch(solar, load, batteries, grid)
+
+        values = {
+            "soc": batteries.soc, "solar": solar, "load": load,
+            "grid_import": grid_import, "grid_export": grid_export, "unmet": unmet,
+            "export_curtailed": grid.export_curtailed, "import_curtailed": grid.import_curtailed,
+        }
+        for name, home_values in values.items():
+            if name == "soc":
+                feeder[name][k] = home_values.mean()
+            else:
+                feeder[name][k] = home_values.sum()
+                totals[name] += home_values
+        feeder_down[k] = inverter_down.any()
+        unmet_events += unmet > 0
+        down_ticks += inverter_down
+        if home_log is not None:
+            home_log.write(k, values)
+
+    if home_log is not None:
+        home_log.close()
+
+    inputs = {"solar": feeder["solar"], "load": feeder["load"], "inverter_down": feeder_down}
+    flows = {name: feeder[name] for name in ("soc", "grid_import", "grid_export", "unmet")}
+    if stats is not None:
+        stats.update_many({
+            "soc": feeder["soc"],
+            "solar": feeder["solar"],
+            "load": feeder["load"],
+            "grid_import": feeder["grid_import"],
+            "grid_export": feeder["grid_export"],
+            "unmet": feeder["unmet"],
+            "revenue": feeder["grid_export"] * config["COST_ENERGY_EXPORTED"],
+            "cost": feeder["grid_import"] * config["COST_ENERGY_IMPORTED"],
+        }, feeder_down)
+    log = vectorized.build_log(config, inputs, flows, log)
+
+    homes = pd.DataFrame(params)
+    homes.index.name = "home"
+    homes["final_soc"] = batteries.soc
+    for name, values in totals.items():
+        homes[f"total_{name}"] = values
+    homes["revenue"] = totals["grid_export"] * config["COST_ENERGY_EXPORTED"]
+    homes["cost"] = totals["grid_import"] * config["COST_ENERGY_IMPORTED"]
+    homes["unmet_load_count"] = unmet_events
+    homes["inverter_down_ticks"] = down_ticks
+
+    feeder_flows = pd.DataFrame({
+        "minute": now,
+        "grid_import": feeder["grid_import"],
+        "grid_export": feeder["grid_export"],
+        "export_curtailed": feeder["export_curtailed"],
+        "import_curtailed": feeder["import_curtailed"],
+    })
+    # Share of the feeder limits in use each tick (left empty without a limit)
+    for direction, cap in (("export", grid.feeder_export_limit), ("import", grid.feeder_import_limit)):
+        feeder_flows[f"{direction}_utilisation"] = feeder[f"grid_{direction}"] / cap if cap else np.nan
+    return log, homes, feeder_flows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a whole feeder of homes in one batched run")
+    parser.add_argument("--config", default=str(main.DEFAULT_CONFIG_PATH), help="Configuration JSON file")
+    parser.add_argument("--priority", type=int, choices=sorted(main.PRIORITIES), default=0,
+                        help="Strategy: " + ", ".join(f"{k}={v}" for k, v in main.PRIORITIES.items()))
+    parser.add_argument("--homes", type=int, default=1000, help="Number of homes on the feeder")
+    parser.add_argument("--spread", type=float, default=0.2,
+                        help="Per-home battery/PV/base load spread around the config values (0.2 = +/-20%%)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed (random if omitted)")
+    parser.add_argument("--feeder-export-limit", type=float, default=None,
+                        help="Transformer export limit for the whole feeder, kW (default: none)")
+    parser.add_argument("--feeder-import-limit", type=float, default=None,
+                        help="Transformer import limit for the whole feeder, kW (default: none)")
+    parser.add_argument("--fairness", choices=["equal", "proportional"], default="equal",
+                        help="How curtailment is shared when a feeder limit binds")
+    parser.add_argument("--log-homes", action="store_true",
+                        help=f"Also keep every home's per-tick series in {FLEET_STORE_PATH.name}/")
+    args = parser.parse_args()
+
+    # "random" values are drawn per home
+    config = main.load_config_from_json(args.config, resolve_random=False)
+    if config is None:
+        exit(1)
+
+    print(f"Simulating {args.homes} homes ({main.PRIORITIES[args.priority]})...")
+    stats = RunStatistics.from_config(config)
+    log, homes, feeder_flows = run_fleet(
+        config, args.priority, args.homes, args.spread, args.seed,
+        stats=stats, home_log_dir=FLEET_STORE_PATH if args.log_homes else None,
+        feeder_export_limit=args.feeder_export_limit, feeder_import_limit=args.feeder_import_limit,
+        fairness=args.fairness,
+    )
+    # The feeder aggregate is the run's log, so reporting.py reports on the feeder
+    main.save_log(log, config)
+    summary = stats.summary()
+    summary["logged"] = True
+    summary["homes"] = args.homes
+    main.save_summary_to_json(summary)
+    homes.to_csv(FLEET_HOMES_PATH)
+    print(f"Per-home totals saved to: {FLEET_HOMES_PATH}")
+    feeder_flows.to_csv(FLEET_FEEDER_PATH, index=False)
+    print(f"Feeder flows and utilisation saved to: {FLEET_FEEDER_PATH}")
+    for direction in ("export", "import"):
+        curtailed = homes[f"total_{direction}_curtailed"].sum()
+        if curtailed > 0:
+            print(f"Feeder {direction} curtailed: {curtailed:.2f} kWh "
+                  f"(peak utilisation {feeder_flows[f'{direction}_utilisation'].max():.0%})")
+    if args.log_homes:
+        print(f"Per-home log saved to: {FLEET_STORE_PATH}")
@@ -1,11 +1,82 @@
+import numpy as np
+
 class Grid:
-    def __init__(self, grid_max_export_limit: float, is_zero_export: bool, grid_max_import_limit: float):
-        self._max_export_limit = grid_max_export_limit
+    def __init__(self, grid_max_export_limit: float, is_zero_export: bool, grid_max_import_limit: float,
+                 step_hours: float = 1.0):
+        # Limits are power (kW); per step they cap the energy moved in step_hours
+        self._max_export_limit = grid_max_export_limit * step_hours
         self._is_zero_export = is_zero_export
-        self._import_limit = grid_max_import_limit
+        self._import_limit = grid_max_import_limit * step_hours
+    @property
+    def is_zero_export(self) -> bool:
+        return self._is_zero_export
     def export(self, energy: float) -> float:
         if self._is_zero_export:
             return 0.0
         return min(energy, self._max_export_limit)
     def import_energy(self, energy: float) -> float:
         return min(energy, self._import_limit)
+    def export_surplus(self, energy: float) -> float:
+        # Load Priority spills its surplus without the export limit
+        return energy
+
+
+def water_fill(requests, cap):
+    """Max-min fair shares of cap: every home gets min(request, level), with the level set so the shares sum to cap"""
+    if cap is None or requests.sum() <= cap:
+        return requests
+    ordered = np.sort(requests)
+    n = len(ordered)
+    # Level if the i smallest requests are met in full and the others split what is left equally
+    met_in_full = np.concatenate(([0.0], np.cumsum(ordered)[:-1]))
+    levels = (cap - met_in_full) / (n - np.arange(n))
+    level = levels[np.argmax(levels <= ordered)]
+    return np.minimum(requests, level)
+
+
+class CommunityGrid:
+    """Grid connection of a whole feeder: each home's own limits plus shared transformer limits
+
+    Per step, the homes' combined export (and import) is capped at the
+    feeder limit and the capacity is shared out fairly: "equal" gives every
+    home the same share unless it asks for less (max-min fairness),
+    "proportional" scales every home by the same factor. The amounts cut
+    are kept per home as curtailment.
+    """
+    def __init__(self, n_homes, home_export_limit, home_import_limit, is_zero_export,
+                 feeder_export_limit=None, feeder_import_limit=None, fairness="equal", step_hours=1.0):
+        # Limits are power (kW); per step they cap the energy moved in step_hours
+        self.export_limit = home_export_limit * step_hours
+        self.import_limit = home_import_limit * step_hours
+        self.is_zero_export = is_zero_export
+        self.feeder_export_limit = feeder_export_limit * step_hours if feeder_export_limit is not None else None
+        self.feeder_import_limit = feeder_import_limit * step_hours if feeder_import_limit is not None else None
+        self._share = water_fill if fairness == "equal" else self._proportional
+        self.export_curtailed = np.zeros(n_homes)
+        self.import_curtailed = np.zeros(n_homes)
+
+    @staticmethod
+    def _proportional(requests, cap):
+        total = requests.sum()
+        if cap is None or total <= cap:
+            return requests
+        return requests * (cap / total)
+
+    def export(self, requests):
+        """Export allowed for each home this step, given what each home wants to export"""
+        if self.is_zero_export:
+            return self.export_surplus(np.zeros(len(requests)))
+        return self.export_surplus(np.minimum(requests, self.export_limit))
+
+    def export_surplus(self, requests):
+        """Like export, without the per-home limit (Load Priority spills its surplus); the feeder limit still applies"""
+        allowed = self._share(requests, self.feeder_export_limit)
+        self.export_curtailed = requests - allowed
+        return allowed
+
+    def import_energy(self, requests):
+        """Import supplied to each home this step, given what each home needs"""
+        requests = np.minimum(requests, self.import_limit)
+        supplied = self._share(requests, self.feeder_import_limit)
+        self.import_curtailed = requests - supplied
+        return supplied
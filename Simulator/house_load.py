@@ -1,10 +1,30 @@
 # house_load.py
+import math
 import random
+import numpy as np
+from utils import step_probability
+
+# name -> (power kW, duration hours, start probability per hour)
+APPLIANCES = {
+    "washing_machine": (1.5, 2, 0.02),   # 1.5kW for 2 hours, 2% chance per hour
+    "dishwasher": (1.2, 1.5, 0.03),      # 1.2kW for 1.5 hours, 3% chance per hour
+    "ev_charger": (7.0, 4, 0.01)         # 7kW for 4 hours, 1% chance per hour
+}
 
 class HouseLoad:
-    def __init__(self, base_load, spikes_max):
+    def __init__(self, base_load, spikes_max, rng=None, step_hours=1):
         self._base = base_load
         self._spikes_max = spikes_max
+        # Any object with the random module's API (e.g. a seeded random.Random)
+        self._rng = rng if rng is not None else random
+        # Appliance start chance and run length (in steps) at this step size
+        self._appliances = {
+            name: (power, math.ceil(duration / step_hours), step_probability(prob, step_hours))
+            for name, (power, duration, prob) in APPLIANCES.items()
+        }
+        self._spike = 0.0
+        self._clock_hour = None
+        self._active_appliances = {}
 
     def demand(self, hour, day_of_week, season):
         load = self._base
@@ -20,16 +40,19 @@ class HouseLoad:
             load *= 1.6
         
         # Random noise
-        noise = max(0.0, random.normalvariate(0.0, 0.1))
+        noise = max(0.0, self._rng.normalvariate(0.0, 0.1))
         load += noise
         
-        # Evening spikes
-        spike = 0.0
-        if 18 <= hour <= 21:
-            spike_prob = 0.6 if day_of_week >= 5 else 0.4
-            if random.random() < spike_prob:
-                spike = random.uniform(0.5, self._spikes_max)
-        load += spike
+        # Evening spikes, drawn once per clock hour and held for its sub-hourly steps
+        if int(hour) != self._clock_hour:
+            self._clock_hour = int(hour)
+            spike = 0.0
+            if 18 <= hour <= 21:
+                spike_prob = 0.6 if day_of_week >= 5 else 0.4
+                if self._rng.random() < spike_prob:
+                    spike = self._rng.uniform(0.5, self._spikes_max)
+            self._spike = spike
+        load += self._spike
         
         appliance_load = self._get_appliance_load(hour, day_of_week)
         load += appliance_load
@@ -38,15 +61,6 @@ class HouseLoad:
     
     def _get_appliance_load(self, hour, day_of_week):
         """Generate random appliance usage events"""
-        appliances = {
-            "washing_machine": (1.5, 2, 0.02),   # 1.5kW for 2 hours, 2% chance per hour
-            "dishwasher": (1.2, 1.5, 0.03),      # 1.2kW for 1.5 hours, 3% chance per hour
-            "ev_charger": (7.0, 4, 0.01)         # 7kW for 4 hours, 1% chance per hour
-        }
-        
-        if not hasattr(self, '_active_appliances'):
-            self._active_appliances = {}
-        
         finished = []
         for appliance, (remaining, power) in self._active_appliances.items():
             remaining -= 1
@@ -59,13 +73,79 @@ class HouseLoad:
         for appliance in finished:
             del self._active_appliances[appliance]
         
-        # Start new appliances
-        for appliance, (power, duration, prob) in appliances.items():
+        # Start new appliances (remaining time is counted in steps)
+        for appliance, (power, duration_steps, prob) in self._appliances.items():
             if appliance not in self._active_appliances:
                 actual_prob = prob * 1.5 if day_of_week >= 5 else prob
-                if random.random() < actual_prob:
-                    self._active_appliances[appliance] = (duration, power)
+                if self._rng.random() < actual_prob:
+                    self._active_appliances[appliance] = (duration_steps, power)
         
         total_load = sum(power for _, power in self._active_appliances.values())
         
         return total_load
+
+    def snapshot(self):
+        return {
+            "spike": float(self._spike),
+            "clock_hour": self._clock_hour,
+            "active_appliances": {name: list(running) for name, running in self._active_appliances.items()},
+        }
+
+    def restore(self, state):
+        self._spike = state["spike"]
+        self._clock_hour = state["clock_hour"]
+        self._active_appliances = {name: tuple(running) for name, running in state["active_appliances"].items()}
+
+    def demand_span(self, hours, day_of_week, season, rng):
+        """demand() for consecutive steps of one day at once, drawing from a NumPy generator"""
+        n_steps = len(hours)
+        load = self._base
+        if day_of_week >= 5:
+            load *= 1.3
+        if season == "Summer":
+            load *= 1.5
+        elif season == "Winter":
+            load *= 1.6
+        load = np.full(n_steps, load)
+        load += np.maximum(0.0, rng.normal(0.0, 0.1, n_steps))
+
+        # Evening spikes: drawn on the first step of each clock hour, held until the next one
+        clock_hours = hours.astype(np.int64)
+        previous = np.concatenate(([-1 if self._clock_hour is None else self._clock_hour], clock_hours[:-1]))
+        new_hour = clock_hours != previous
+        spike_prob = 0.6 if day_of_week >= 5 else 0.4
+        drawn = new_hour & (hours >= 18) & (hours <= 21)
+        hit = rng.random(n_steps) < spike_prob
+        new_spike = np.where(drawn & hit, rng.uniform(0.5, self._spikes_max, n_steps), 0.0)
+        last_new = np.maximum.accumulate(np.where(new_hour, np.arange(n_steps), -1))
+        spike = np.where(last_new >= 0, new_spike[np.maximum(last_new, 0)], self._spike)
+        self._clock_hour = int(clock_hours[-1])
+        self._spike = float(spike[-1])
+        load += spike
+
+        load += self._appliance_span(n_steps, day_of_week, rng)
+        return load
+
+    def _appliance_span(self, n_steps, day_of_week, rng):
+        """_get_appliance_load for consecutive steps, carrying running appliances in and out"""
+        total = np.zeros(n_steps + 1)
+        for appliance, (power, duration_steps, prob) in self._appliances.items():
+            actual_prob = prob * 1.5 if day_of_week >= 5 else prob
+            # A running appliance counts down once more on each step and stops when it reaches 0
+            running = self._active_appliances.pop(appliance, None)
+            free_at = 0
+            remaining = 0
+            if running is not None:
+                free_at = max(0, running[0] - 1)
+                total[0] += power
+                total[min(free_at, n_steps)] -= power
+                remaining = running[0] - n_steps
+            for k in np.flatnonzero(rng.random(n_steps) < actual_prob).tolist():
+                if k >= free_at:
+                    total[k] += power
+                    total[min(k + duration_steps, n_steps)] -= power
+                    free_at = k + duration_steps
+                    remaining = duration_steps - (n_steps - 1 - k)
+            if remaining > 0:
+                self._active_appliances[appliance] = (remaining, power)
+        return np.cumsum(total[:n_steps])
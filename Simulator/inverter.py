@@ -1,19 +1,74 @@
 # inverter.py
+import math
 import random
+import numpy as np
+from utils import step_probability
 
 class Inverter:
-    def __init__(self, output_limit, failure_freq, failure_duration):
+    def __init__(self, output_limit, failure_freq, failure_duration, rng=None, step_hours=1, event_driven=False):
         self._limit = output_limit
         self._failure_freq = failure_freq # Already in hours
-        self._failure_duration = failure_duration
+        self._failure_duration = failure_duration * 60 # Hours -> simulation minutes
+        self._failure_prob = step_probability(failure_freq / 24, step_hours)
         self._down_until = -1
+        self._rng = rng if rng is not None else random
+        # Event-driven: the next failure is drawn once as a time, not as a coin flip every step
+        self._event_driven = event_driven
+        self._step_min = step_hours * 60
+        self._next_failure = None
 
     def is_down(self, env):
         if env.now < self._down_until:
             return True
 
-        if random.random() < self._failure_freq / 24:
+        if self._event_driven:
+            if self._next_failure is None:
+                self._next_failure = env.now + self._failure_gap() * self._step_min
+            if env.now < self._next_failure:
+                return False
+            self._fail(self._next_failure)
+            return bool(env.now < self._down_until)
+
+        if self._rng.random() < self._failure_prob:
             self._down_until = env.now + self._failure_duration
             return True
 
         return False
+
+    def down_span(self, times):
+        """Event-driven is_down for consecutive step times at once, moving the failure process past them"""
+        down = np.zeros(len(times), dtype=bool)
+        k = 0
+        while k < len(times):
+            if times[k] < self._down_until:
+                end = np.searchsorted(times, self._down_until, side="left")
+                down[k:end] = True
+                k = end
+                continue
+            if self._next_failure is None:
+                self._next_failure = int(times[k]) + self._failure_gap() * self._step_min
+            if self._next_failure > times[-1]:
+                break
+            k = np.searchsorted(times, self._next_failure, side="left")
+            self._fail(self._next_failure)
+        return down
+
+    def snapshot(self):
+        next_failure = float(self._next_failure) if self._next_failure is not None else None
+        return {"down_until": float(self._down_until), "next_failure": next_failure}
+
+    def restore(self, state):
+        self._down_until = state["down_until"]
+        self._next_failure = state["next_failure"]
+
+    def _fail(self, start):
+        self._down_until = start + self._failure_duration
+        self._next_failure = None
+
+    def _failure_gap(self):
+        """Steps before the next failure: the failures of a per-step coin flip, drawn as one geometric variate"""
+        if self._failure_prob <= 0:
+            return math.inf
+        if self._failure_prob >= 1:
+            return 0
+        return math.floor(math.log(1.0 - self._rng.random()) / math.log1p(-self._failure_prob))
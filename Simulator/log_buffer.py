@@ -0,0 +1,126 @@
+# log_buffer.py
+import numpy as np
+
+# Log schema: column name -> dtype, in the order written to log.csv / log.json
+LOG_COLUMNS = {
+    "Battery state of charge": np.float64,
+    "Solar generation": np.float64,
+    "Load demand": np.float64,
+    "Grid import": np.float64,
+    "Grid export": np.float64,
+    "Unmet load": np.bool_,
+    "Revenue from exported energy": np.float64,
+    "Cost of imported energy": np.float64,
+    "Daily solar generation": np.float64,
+    "Daily revenue": np.float64,
+    "Daily import": np.float64,
+    "Daily export": np.float64,
+    "Daily cost": np.float64,
+    "Daily unmet load (count)": np.float64,
+    "Daily load": np.float64,
+    "Inverter status": np.bool_,
+}
+
+def expected_rows(config):
+    """Number of log rows a run with this config will produce"""
+    if config["LOG_FREQUENCY"]:
+        return config["SIM_DURATION_DAY"]
+    ticks_per_day = (24 * 60) // config["TIME_STEP_MIN"]
+    return config["SIM_DURATION_DAY"] * ticks_per_day
+
+
+class LogBuffer:
+    """Preallocated column arrays for the simulation log, turned into a DataFrame once at the end"""
+    def __init__(self, capacity):
+        self._capacity = max(1, int(capacity))
+        self._columns = {
+            name: np.empty(self._capacity, dtype=dtype) for name, dtype in LOG_COLUMNS.items()
+        }
+        self._arrays = list(self._columns.values())
+        self._len = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(expected_rows(config))
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Wrap whole columns computed up front (e.g. by the vectorized engine)"""
+        n_rows = len(columns["Battery state of charge"])
+        log = cls(n_rows)
+        for name, array in log._columns.items():
+            array[:n_rows] = columns[name]
+        log._len = n_rows
+        return log
+
+    def __len__(self):
+        return self._len
+
+    def append(self, row):
+        """Write one row, values given in LOG_COLUMNS order"""
+        if self._len == self._capacity:
+            self._grow()
+        i = self._len
+        for array, value in zip(self._arrays, row):
+            array[i] = value
+        self._len += 1
+
+    def append_columns(self, columns):
+        """Write many rows given as column name -> array"""
+        n_rows = len(columns["Battery state of charge"])
+        while self._len + n_rows > self._capacity:
+            self._grow()
+        for name, array in self._columns.items():
+            array[self._len:self._len + n_rows] = columns[name]
+        self._len += n_rows
+
+    def clear(self):
+        """Drop all rows but keep the allocated arrays"""
+        self._len = 0
+
+    def copy(self):
+        """Independent buffer with the same rows and capacity"""
+        log = LogBuffer(self._capacity)
+        for name, array in log._columns.items():
+            array[:self._len] = self._columns[name][:self._len]
+        log._len = self._len
+        return log
+
+    def columns(self, start=0):
+        """Views of the filled rows from start on, as column name -> array"""
+        return {name: array[start:self._len] for name, array in self._columns.items()}
+
+    def _grow(self):
+        # Only hit when the run is longer than the config predicted
+        self._capacity *= 2
+        for name, array in self._columns.items():
+            grown = np.empty(self._capacity, dtype=array.dtype)
+            grown[:self._len] = array[:self._len]
+            self._columns[name] = grown
+        self._arrays = list(self._columns.values())
+
+    def to_dataframe(self):
+        """Build the log DataFrame from the filled part of the buffer"""
+        # pandas takes longer to import than a short run takes; summary-only runs never need it
+        import pandas as pd
+        return pd.DataFrame({name: array[:self._len] for name, array in self._columns.items()})
+
+
+class NullLog:
+    """Log sink that drops every row, for summary-only runs"""
+    def __len__(self):
+        return 0
+
+    def append(self, row):
+        pass
+
+    def append_columns(self, columns):
+        pass
+
+
+def iter_log_chunks(csv_path, chunk_size=50_000, columns=None):
+    """Read a CSV log back as typed DataFrame chunks, optionally only some columns"""
+    import pandas as pd
+    dtypes = {name: dtype for name, dtype in LOG_COLUMNS.items() if columns is None or name in columns}
+    yield from pd.read_csv(csv_path, usecols=list(dtypes), dtype=dtypes, chunksize=chunk_size,
+                           float_precision="round_trip")
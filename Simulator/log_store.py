@@ -0,0 +1,234 @@
+# log_store.py
+import json
+import os
+import re
+import numpy as np
+from log_buffer import LOG_COLUMNS, LogBuffer
+
+HEADER_FILE = "header.json"
+STORE_VERSION = 1
+
+BOOL_COLUMNS = [name for name, dtype in LOG_COLUMNS.items() if dtype is np.bool_]
+
+def column_file(name):
+    """File name of a column ("Grid import" -> grid_import.bin)"""
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") + ".bin"
+
+
+class ColumnStoreWriter:
+    """Typed columnar log: one raw binary file per column plus a small JSON header
+
+    Chunks are appended to the column files and the header's row count is
+    only advanced once a chunk is fully on disk, so a crashed run leaves a
+    readable store of every completed chunk. With resume_rows, an existing
+    store is cut back to its first resume_rows rows and appended to. The
+    columns are the log's unless another schema (name -> dtype) is given.
+    """
+    def __init__(self, directory, metadata=None, resume_rows=None, schema=None):
+        self._dir = directory
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._n_rows = 0
+        self._metadata = metadata or {}
+        self._schema = schema or LOG_COLUMNS
+        if resume_rows is None:
+            self._files = {name: open(self._dir.joinpath(column_file(name)), "wb") for name in self._schema}
+        else:
+            self._files = {}
+            for name, dtype in self._schema.items():
+                path = self._dir.joinpath(column_file(name))
+                os.truncate(path, resume_rows * np.dtype(dtype).itemsize)
+                self._files[name] = open(path, "ab")
+            self._n_rows = resume_rows
+        self._write_header()
+
+    def __len__(self):
+        return self._n_rows
+
+    def write(self, columns):
+        """Append a chunk given as column name -> array"""
+        n_rows = len(columns[next(iter(self._schema))])
+        for name, dtype in self._schema.items():
+            np.ascontiguousarray(columns[name], dtype=dtype).tofile(self._files[name])
+            self._files[name].flush()
+        self._n_rows += n_rows
+        self._write_header()
+
+    def _write_header(self):
+        header = {
+            "version": STORE_VERSION,
+            "n_rows": self._n_rows,
+            "columns": {
+                name: {"file": column_file(name), "dtype": np.dtype(dtype).str}
+                for name, dtype in self._schema.items()
+            },
+            "metadata": self._metadata,
+        }
+        # Write-then-rename so readers never see a half-written header
+        tmp_path = self._dir.joinpath(HEADER_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp_path, self._dir.joinpath(HEADER_FILE))
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+def save_column_store(columns, directory, metadata=None, schema=None):
+    """Write a whole log (column name -> array, or a DataFrame) as a column store"""
+    writer = ColumnStoreWriter(directory, metadata, schema=schema)
+    writer.write(columns)
+    writer.close()
+
+
+class ColumnStore:
+    """Read side of the column store; columns are memory-mapped on first access"""
+    def __init__(self, directory):
+        self._dir = directory
+        with open(directory.joinpath(HEADER_FILE), "r") as f:
+            self.header = json.load(f)
+        self.n_rows = self.header["n_rows"]
+        self.metadata = self.header.get("metadata", {})
+        self._mapped = {}
+
+    @classmethod
+    def exists(cls, directory):
+        return directory.joinpath(HEADER_FILE).exists()
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def columns(self):
+        return list(self.header["columns"])
+
+    def column(self, name):
+        """Memory-mapped view of one column; only the pages actually read are loaded"""
+        if name not in self._mapped:
+            info = self.header["columns"][name]
+            if self.n_rows == 0:
+                self._mapped[name] = np.empty(0, dtype=info["dtype"])
+            else:
+                self._mapped[name] = np.memmap(
+                    self._dir.joinpath(info["file"]), dtype=info["dtype"], mode="r", shape=(self.n_rows,)
+                )
+        return self._mapped[name]
+
+    def read_columns(self, columns=None):
+        """Some or all columns as in-memory arrays (column name -> array)"""
+        return {name: np.array(self.column(name)) for name in columns or self.columns}
+
+    def iter_chunks(self, chunk_size=50_000, columns=None):
+        """DataFrame chunks over some or all columns"""
+        import pandas as pd
+        names = columns or self.columns
+        for start in range(0, self.n_rows, chunk_size):
+            yield pd.DataFrame({name: self.column(name)[start:start + chunk_size] for name in names})
+
+    def to_dataframe(self, columns=None):
+        import pandas as pd
+        names = columns or self.columns
+        return pd.DataFrame({name: np.asarray(self.column(name)) for name in names})
+
+
+class StreamingLogWriter:
+    """Log sink that flushes fixed-size chunks to the column store, and optionally CSV/NDJSON, during the run
+
+    Only one chunk is held in memory, and every flushed chunk is complete on
+    disk, so a crashed run still leaves a usable partial log. A position()
+    taken during the run lets a later writer resume from that point: every
+    output is cut back to it and appended to.
+    """
+    def __init__(self, chunk_size, store_dir, csv_path=None, ndjson_path=None, metadata=None, resume=None):
+        self._chunk = LogBuffer(chunk_size)
+        self._chunk_size = max(1, int(chunk_size))
+        self._store = ColumnStoreWriter(store_dir, metadata, resume["rows"] if resume else None)
+        self.paths = [path for path in (store_dir, csv_path, ndjson_path) if path is not None]
+
+        if resume:
+            self._csv = self._reopen(csv_path, resume.get("csv_bytes"))
+            self._ndjson = self._reopen(ndjson_path, resume.get("ndjson_bytes"))
+            return
+        self._csv = open(csv_path, "w", newline="") if csv_path is not None else None
+        if self._csv is not None:
+            self._csv.write(",".join(LOG_COLUMNS) + "\n")
+        self._ndjson = open(ndjson_path, "w") if ndjson_path is not None else None
+
+    @staticmethod
+    def _reopen(path, n_bytes):
+        if path is None:
+            return None
+        if n_bytes is None:
+            raise ValueError(f"{path} was not part of the log being resumed")
+        os.truncate(path, n_bytes)
+        return open(path, "a", newline="")
+
+    @classmethod
+    def from_config(cls, config, store_dir, csv_path, ndjson_path, metadata=None, resume=None):
+        formats = config.get("LOG_EXPORT_FORMATS", ["csv", "json"])
+        # A streamed log cannot be one indented JSON list, so "json" is exported as NDJSON
+        wants_ndjson = "json" in formats or "ndjson" in formats
+        return cls(
+            config.get("LOG_CHUNK_SIZE", 4096), store_dir,
+            csv_path if "csv" in formats else None,
+            ndjson_path if wants_ndjson else None,
+            metadata,
+            resume,
+        )
+
+    def __len__(self):
+        return len(self._store) + len(self._chunk)
+
+    def append(self, row):
+        """Write one row, values given in LOG_COLUMNS order"""
+        self._chunk.append(row)
+        if len(self._chunk) == self._chunk_size:
+            self.flush()
+
+    def append_columns(self, columns):
+        """Write whole columns (e.g. from the vectorized engine) chunk by chunk"""
+        import pandas as pd
+        self.flush()
+        n_rows = len(columns["Battery state of charge"])
+        for start in range(0, n_rows, self._chunk_size):
+            stop = min(start + self._chunk_size, n_rows)
+            self._write(pd.DataFrame({name: columns[name][start:stop] for name in LOG_COLUMNS}))
+
+    def position(self):
+        """Flush, then return the rows and bytes written so far, for resuming with resume="""
+        self.flush()
+        return {
+            "rows": len(self._store),
+            "csv_bytes": self._csv.tell() if self._csv is not None else None,
+            "ndjson_bytes": self._ndjson.tell() if self._ndjson is not None else None,
+        }
+
+    def flush(self):
+        """Write the buffered chunk to every output"""
+        if len(self._chunk):
+            self._write(self._chunk.to_dataframe())
+            self._chunk.clear()
+
+    def _write(self, chunk_df):
+        if self._csv is not None:
+            chunk_df.to_csv(self._csv, header=False, index=False)
+            self._csv.flush()
+
+        if self._ndjson is not None:
+            records = chunk_df.to_dict(orient="records")
+            for record in records:
+                for name in BOOL_COLUMNS:
+                    record[name] = bool(record[name])
+            self._ndjson.writelines(json.dumps(record) + "\n" for record in records)
+            self._ndjson.flush()
+
+        # The store goes last: its header only counts rows that are on disk everywhere
+        self._store.write(chunk_df)
+
+    def close(self):
+        """Flush the last partial chunk and close the files"""
+        self.flush()
+        self._store.close()
+        for f in (self._csv, self._ndjson):
+            if f is not None:
+                f.close()
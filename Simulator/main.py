@@ -1,19 +1,22 @@
+import argparse
 import random
 import json
-import simpy
-import pandas as pd
-import solar_panel
-import house_load
-import grid
-import inverter
-import battery
+import shutil
+import numpy as np
+import vectorized
+import profiling
 from pathlib import Path
-from utils import (
-    hour_of_day,
-    day_of_year,
-    season_from_day,
-    daily_cloud_coverage,
-)
+from checkpoint import Checkpointer
+from log_buffer import LogBuffer, NullLog
+from results_store import ResultsStore, is_cacheable
+from rollups import ROLLUP_STORE_PATH, Rollups
+from run_stats import RunStatistics
+from sampling import AntitheticGenerator
+from simulator import Simulator, resolve_random_values
+from strategies import STRATEGIES
+from log_store import ColumnStore, StreamingLogWriter, save_column_store
+from traces import Trace, TraceRecorder
+from utils import MINUTES_PER_DAY, steps_per_day
 
 # Get the base directory where this script is located
 BASE_DIR = Path(__file__).resolve().parent
@@ -22,44 +25,27 @@ DEFAULT_CONFIG_PATH = BASE_DIR.joinpath("config_default.json")
 USER_CONFIG_PATH = BASE_DIR.joinpath("config_user.json")
 LOG_FILE_PATH = BASE_DIR.joinpath("log.csv")
 LOG_JSON_PATH = BASE_DIR.joinpath("log.json")
+LOG_NDJSON_PATH = BASE_DIR.joinpath("log.ndjson")
+LOG_STORE_PATH = BASE_DIR.joinpath("log_store")
+LOG_SUMMARY_PATH = BASE_DIR.joinpath("log_summary.json")
+PROFILE_PATH = BASE_DIR.joinpath("log_profile.json")
+TRACE_PATH = BASE_DIR.joinpath("trace_store")
 
-# DataFrame for logging results
-LOG_DF = pd.DataFrame({
-    "Battery state of charge": pd.Series(dtype=float),
-    "Solar generation": pd.Series(dtype=float),
-    "Load demand": pd.Series(dtype=float),
-    "Grid import": pd.Series(dtype=float),
-    "Grid export": pd.Series(dtype=float),
-    "Unmet load": pd.Series(dtype=bool),
-    "Revenue from exported energy": pd.Series(dtype=float),
-    "Cost of imported energy": pd.Series(dtype=float),
-    "Daily solar generation": pd.Series(dtype=float),
-    "Daily revenue": pd.Series(dtype=float),
-    "Daily import": pd.Series(dtype=float),
-    "Daily export": pd.Series(dtype=float),
-    "Daily cost": pd.Series(dtype=float),
-    "Daily unmet load (count)": pd.Series(dtype=float),
-    "Daily load": pd.Series(dtype=float),
-    "Inverter status": pd.Series(dtype=bool)
-})
+# Every registered dispatch strategy, by priority number
+PRIORITIES = {priority: strategy.name for priority, strategy in STRATEGIES.items()}
 
-PRIORITIES = {0: "LOAD_PRIORITY", 1: "CHARGE_PRIORITY", 2: "PRODUCE_PRIORITY"}
-
-SEASON_CLOUD_PROBS = {
-    "Spring": [0.1, 0.3, 0.4, 0.2],
-    "Summer": [0.05, 0.15, 0.3, 0.5],
-    "Fall": [0.2, 0.4, 0.3, 0.1],
-    "Winter": [0.3, 0.4, 0.2, 0.1],
-}
-
-def load_config_from_json(file_path):
+def load_config_from_json(file_path, rng=random, resolve_random=True):
     """Load configuration from a JSON file"""
     try:
         with open(file_path, "r") as f:
             config = json.load(f)
         
-        if config.get("INVERTER_FAILURE_DURATION") == "random":
-            config["INVERTER_FAILURE_DURATION"] = random.randint(4, 72)
+        if resolve_random:
+            config = resolve_random_values(config, rng)
+        
+        if MINUTES_PER_DAY % config["TIME_STEP_MIN"]:
+            print(f"Error: TIME_STEP_MIN ({config['TIME_STEP_MIN']}) must divide a day ({MINUTES_PER_DAY} minutes) evenly.")
+            return None
         
         config["SIM_DURATION_MIN"] = config["SIM_DURATION_DAY"] * 24 * 60
         
@@ -71,7 +57,7 @@ def load_config_from_json(file_path):
         print(f"Error: {file_path} is not valid JSON.")
         return None
 
-def get_user_config():
+def get_user_config(resolve_random=True):
     """Get configuration from JSON files"""
     print("\n--- Configuration Selection ---")
     print("1: Use Default Configuration (config_default.json)")
@@ -81,7 +67,7 @@ def get_user_config():
         choice = input("Enter your choice (1 or 2): ").strip()
         
         if choice == '1':
-            config = load_config_from_json(DEFAULT_CONFIG_PATH)
+            config = load_config_from_json(DEFAULT_CONFIG_PATH, resolve_random=resolve_random)
             if config:
                 print("Loaded default configuration.")
                 return config
@@ -90,7 +76,7 @@ def get_user_config():
                 exit(1)
         
         elif choice == '2':
-            config = load_config_from_json(USER_CONFIG_PATH)
+            config = load_config_from_json(USER_CONFIG_PATH, resolve_random=resolve_random)
             if config:
                 print("Loaded custom configuration from config_user.json")
                 return config
@@ -101,152 +87,75 @@ def get_user_config():
         else:
             print("Invalid choice. Please enter 1 or 2.")
 
-def home_energy_system(env, battery, panel, load, inverter, grid, priorities, config):
-    """Main simulation function"""
-    for i in range(3):
-        print(f"{i}: {priorities[i]}")
+def get_user_priority(priorities):
+    """Ask which energy management strategy to simulate"""
+    for i, name in priorities.items():
+        print(f"{i}: {name}")
+    choices = ", ".join(str(i) for i in priorities)
     
     while True:
         try:
-            priority = int(input("Enter your priority (0, 1, or 2): "))
+            priority = int(input(f"Enter your priority ({choices}): "))
             if priority in priorities:
-                break
+                return priority
             else:
-                print("Please enter 0, 1, or 2.")
+                print(f"Please enter one of {choices}.")
         except ValueError:
             print("Please enter a valid number.")
-    
-    print(f"You have chosen {priorities[priority]} \nStarting Simulation...")
-    
-    current_day = -1
-    current_season = None
-    daily_cloud_base = 0.0
-    daily_solar = 0.0
-    revenue_energy_exported = 0.0
-    cost_energy_imported = 0.0
-    daily_import = 0.0
-    daily_export = 0.0
-    daily_cost = 0.0
-    daily_unmet = 0.0
-    daily_revenue = 0.0
-    daily_load = 0.0
-
-    sim_duration_days = config["SIM_DURATION_DAY"]
-    
-    for i in range(sim_duration_days):
-        for j in range(24):
-            hour = hour_of_day(env)
-            day = day_of_year(env, config["SIM_START_DAY"])
-            
-            # Calculate day of week (0=Monday, 6=Sunday)
-            # Assuming day 0 is Jan 1st, 2024 (which was a Monday)
-            day_of_week = day % 7
-
-            if day != current_day:
-                current_day = day
-                current_season = season_from_day(day)
-                daily_cloud_base = daily_cloud_coverage(SEASON_CLOUD_PROBS[current_season])
-            
-            inverter_down = inverter.is_down(env)
-            # Pass daily_cloud_base for hourly cloud variation
-            solar_kw = panel.generate(hour, daily_cloud_base, config["INVERTER_MAX_OUTPUT_LIMIT"], inverter_down)
-            # Pass day_of_week and season to demand
-            load_kw = load.demand(hour, day_of_week, current_season)
 
-            solar_kwh = solar_kw
-            load_kwh = load_kw
-            grid_import = grid_export = unmet = 0.0
+def home_energy_system(env, sim, checkpointer=None):
+    """SimPy process: advance the simulator and sleep for the simulated time it covered
 
-            if priority == 0:  # Load Priority
-                net = solar_kwh - load_kwh
-                if net >= 0:
-                    charged = battery.charge(net)
-                    if grid._is_zero_export and battery._soc == 100:
-                        grid_export = 0.0
-                    else:
-                        grid_export = max(0.0, net - charged)
-                else:
-                    supplied = battery.discharge(-net)
-                    deficit = -net - supplied
-                    if deficit > 0:
-                        grid_import = min(deficit, grid._import_limit)
-                        unmet = deficit - grid_import
-            
-            elif priority == 1:  # Charge Priority
-                charge_remainder = solar_kwh - battery.charge(solar_kwh)
-                net_after_battery = charge_remainder - load_kwh
+    Event-driven runs cover a whole dark span per wake-up, otherwise it is
+    one TIME_STEP_MIN step. A Checkpointer saves the run at its interval.
+    """
+    while sim.tick < sim.total_steps:
+        n_steps = sim.advance()
+        if checkpointer is not None:
+            checkpointer.maybe_save(sim)
+        yield env.timeout(n_steps * sim.step_min)
 
-                if net_after_battery >= 0:
-                    if grid._is_zero_export and battery._soc == 100:
-                        grid_export = 0.0
-                    else:
-                        grid_export = grid.export(net_after_battery)
-                else:
-                    grid_import = min(-net_after_battery, grid._import_limit)
-                    unmet = -net_after_battery - grid_import
-
-            elif priority == 2:  # Produce Priority
-                if grid._is_zero_export and battery._soc == 100:
-                    grid_export = 0.0
-                else:
-                    grid_export = grid.export(solar_kwh)
-                
-                remainder = solar_kwh - grid_export
-                charged = battery.charge(remainder)
-                reminder_for_load = remainder - charged
-                net_deficit = max(0, load_kwh - reminder_for_load)
+def save_log(log, config, profiler=None):
+    """Save the log to the column store and the configured export formats (CSV/JSON)"""
+    if isinstance(log, StreamingLogWriter):
+        with profiling.phase(profiler, "save_log.close_stream"):
+            log.close()
+        for path in log.paths:
+            print(f"Log saved to: {path}")
+        return
 
-                provided = battery.discharge(net_deficit)
-                still_needed = net_deficit - provided
-                grid_import = min(still_needed, grid._import_limit)
-                unmet = still_needed - grid_import
+    # Build the DataFrame once from the preallocated log buffer
+    with profiling.phase(profiler, "save_log.dataframe"):
+        log_df = log.to_dataframe()
+    formats = config.get("LOG_EXPORT_FORMATS", ["csv", "json"])
 
-            revenue_energy_exported = grid_export * config["COST_ENERGY_EXPORTED"]
-            cost_energy_imported = grid_import * config["COST_ENERGY_IMPORTED"]
-            total_revenue = revenue_energy_exported - cost_energy_imported
-            
-            daily_solar += solar_kwh
-            daily_import += grid_import
-            daily_export += grid_export
-            daily_revenue += total_revenue
-            daily_cost += cost_energy_imported
-            daily_unmet += 1 if unmet > 0 else 0
-            daily_load += load_kwh
-            
-            log_freq = config["LOG_FREQUENCY"]
-            if j == 23 and log_freq:
-                write_to_df(battery, solar_kwh, load_kwh, grid_import, grid_export, unmet, 
-                          revenue_energy_exported, cost_energy_imported, daily_solar, 
-                          daily_revenue, daily_import, daily_export, daily_cost, 
-                          daily_unmet, daily_load, inverter_down)
-                # Reset accumulators after logging daily values
-                daily_solar = 0.0
-                daily_import = 0.0
-                daily_export = 0.0
-                daily_cost = 0.0
-                daily_revenue = 0.0
-                daily_unmet = 0.0
-                daily_load = 0.0
-            elif not log_freq:
-                write_to_df(battery, solar_kwh, load_kwh, grid_import, grid_export, unmet, 
-                          revenue_energy_exported, cost_energy_imported, daily_solar, 
-                          daily_revenue, daily_import, daily_export, daily_cost, 
-                          daily_unmet, daily_load, inverter_down)
-                
-            yield env.timeout(config["TIME_STEP_MIN"])
+    # Primary store: typed column files that reporting memory-maps
+    with profiling.phase(profiler, "save_log.store"):
+        save_column_store(log_df, LOG_STORE_PATH, {"config": config})
+    print(f"Log saved to: {LOG_STORE_PATH}")
 
     # Save log file in CSV format
-    LOG_DF.to_csv(LOG_FILE_PATH, index=False)
-    print(f"Log saved to: {LOG_FILE_PATH}")
+    if "csv" in formats:
+        with profiling.phase(profiler, "save_log.csv"):
+            log_df.to_csv(LOG_FILE_PATH, index=False)
+        print(f"Log saved to: {LOG_FILE_PATH}")
     
     # Save log file in JSON format
-    save_log_to_json()
-    print(f"Log saved to: {LOG_JSON_PATH}")
+    if "json" in formats:
+        with profiling.phase(profiler, "save_log.json"):
+            save_log_to_json(log_df)
+        print(f"Log saved to: {LOG_JSON_PATH}")
+
+def streaming_log(config, resume=None):
+    """StreamingLogWriter for the log files of a LOG_STREAMING run"""
+    return StreamingLogWriter.from_config(
+        config, LOG_STORE_PATH, LOG_FILE_PATH, LOG_NDJSON_PATH, {"config": config}, resume=resume
+    )
 
-def save_log_to_json():
+def save_log_to_json(log_df):
     """Convert DataFrame to JSON and save"""
     # Convert DataFrame to list of dictionaries
-    log_data = LOG_DF.to_dict(orient='records')
+    log_data = log_df.to_dict(orient='records')
     
     for record in log_data:
         if 'Unmet load' in record:
@@ -257,100 +166,238 @@ def save_log_to_json():
     # Save to JSON file
     with open(LOG_JSON_PATH, 'w') as f:
         json.dump(log_data, f, indent=2, default=str)
-    
-    save_summary_to_json(log_data)
 
-def save_summary_to_json(log_data):
+def save_summary_to_json(summary, summary_path=LOG_SUMMARY_PATH):
     """Save summary statistics in a separate JSON file for quick access"""
-    if not log_data:
+    if not summary:
         return
     
-    # Calculate summary statistics
-    battery_soc = [record['Battery state of charge'] for record in log_data]
-    solar_gen = [record['Solar generation'] for record in log_data]
-    load_demand = [record['Load demand'] for record in log_data]
-    grid_import = [record['Grid import'] for record in log_data]
-    grid_export = [record['Grid export'] for record in log_data]
-    revenue = [record['Revenue from exported energy'] for record in log_data]
-    cost = [record['Cost of imported energy'] for record in log_data]
-    
-    summary = {
-        "total_hours": len(log_data),
-        "simulation_days": len(log_data) // 24 if len(log_data) > 24 else 1,
-        "battery": {
-            "avg_soc": sum(battery_soc) / len(battery_soc),
-            "min_soc": min(battery_soc),
-            "max_soc": max(battery_soc)
-        },
-        "energy": {
-            "total_solar": sum(solar_gen),
-            "total_load": sum(load_demand),
-            "total_grid_import": sum(grid_import),
-            "total_grid_export": sum(grid_export),
-            "net_grid_import": sum(grid_import) - sum(grid_export)
-        },
-        "financial": {
-            "total_revenue": sum(revenue),
-            "total_cost": sum(cost),
-            "net_profit": sum(revenue) - sum(cost)
-        },
-        "unmet_load_count": sum(1 for record in log_data if record['Unmet load']),
-        "inverter_down_ticks": sum(1 for record in log_data if record['Inverter status'])
-    }
-    
-    summary_path = BASE_DIR.joinpath("log_summary.json")
     with open(summary_path, 'w') as f:
         json.dump(summary, f, indent=2)
     print(f"Summary saved to: {summary_path}")
 
-def write_to_df(battery, solar_kwh, load_kwh, grid_import, grid_export, unmet, 
-                revenue_energy_exported, cost_energy_imported, daily_solar, 
-                daily_revenue, daily_import, daily_export, daily_cost, 
-                daily_unmet, daily_load, inverter_status):
-    """Write data to DataFrame"""
-    unmet_bool = True if unmet > 0 else False
-    LOG_DF.loc[len(LOG_DF)] = [
-        battery._soc, solar_kwh, load_kwh,
-        grid_import, grid_export, unmet_bool,
-        revenue_energy_exported, cost_energy_imported,
-        daily_solar, daily_revenue, daily_import, 
-        daily_export, daily_cost, daily_unmet, 
-        daily_load, inverter_status
-    ]
+def instrument_components(profiler, sim):
+    """Time every component call the per-tick loop makes"""
+    bat, panel, load, inv, grd = sim.battery, sim.panel, sim.load, sim.inverter, sim.grid
+    log, stats = sim.log, sim.stats
+    for obj, method in ((panel, "generate"), (load, "demand"), (inv, "is_down"),
+                        (load, "demand_span"), (inv, "down_span"),
+                        (bat, "charge"), (bat, "discharge"), (grd, "export"), (grd, "import_energy"),
+                        (log, "append"), (log, "append_columns")):
+        profiler.instrument(obj, method)
+    # Called from inside HouseLoad.demand, so it is not counted against the loop
+    profiler.instrument(load, "_get_appliance_load", within=None)
+    if stats is not None:
+        profiler.instrument(stats, "update")
 
-if __name__ == "__main__":
-    # GET CONFIG
-    config = get_user_config()
+def run_simpy(config, priority, rng=random, log=None, stats=None, profiler=None, recorder=None, trace=None,
+              checkpointer=None):
+    """Run the SimPy per-tick engine and return the filled log
 
-    # SETTING UP ENVIRONMENT
+    When the checkpointer has loaded a checkpoint, the run resumes from it.
+    """
+    # Only this engine needs SimPy, so the vectorized engine and headless runs never load it
+    import simpy
     env = simpy.Environment()
+    if log is None:
+        log = LogBuffer.from_config(config)
+    sim = Simulator(config, priority, rng, log, stats, recorder, trace)
+    if checkpointer is not None and checkpointer.state is not None:
+        checkpointer.restore(sim)
+    if profiler is not None:
+        instrument_components(profiler, sim)
+    env.process(home_energy_system(env, sim, checkpointer))
+    env.run()
+    return log
 
-    # INITIALIZING INSTANCES
-    battery = battery.Battery(
-        size_kwh=config["BATTERY_SIZE"], 
-        efficiency=config["BATTERY_ROUND_TRIP_EFFICIENCY"]
-    )
-    panel = solar_panel.SolarPanel(
-        capacity=config["PEAK_SOLAR_GENERATION"]
-    )
-    load = house_load.HouseLoad(
-        base_load=config["ENERGY_BASE_LOAD"], 
-        spikes_max=config["RANDOM_SPIKES_MAX"]
-    )
-    inverter = inverter.Inverter(
-        output_limit=config["INVERTER_MAX_OUTPUT_LIMIT"], 
-        failure_freq=config["INVERTER_FAILURE_FREQUENCY"], 
-        failure_duration=config["INVERTER_FAILURE_DURATION"]
-    )
-    grid = grid.Grid(
-        grid_max_export_limit=config["GRID_MAX_EXPORT_LIMIT"], 
-        is_zero_export=config["IS_ZERO_EXPORT"], 
-        grid_max_import_limit=config["GRID_MAX_IMPORT_LIMIT"]
+def run_simulation(config, priority, engine="simpy", seed=None, log=None, stats=None, profiler=None,
+                   recorder=None, trace=None, checkpointer=None, antithetic=False):
+    """Run one simulation with the chosen engine ("simpy" or "vectorized")
+
+    With a seed the run draws from its own generators instead of the global
+    random module, so it is reproducible and safe to run alongside others.
+    Rows go to log (e.g. a StreamingLogWriter) or to a new in-memory LogBuffer,
+    and every tick is folded into stats (a RunStatistics) when one is given.
+    A Profiler, when given, times the component calls and engine phases.
+    A TraceRecorder collects the run's solar, load and inverter inputs, and a
+    Trace replays recorded inputs instead of drawing them (ValueError if the
+    config's sizes or clock differ from the ones it was recorded with).
+    A Checkpointer (SimPy engine only) saves the run as it goes and, once it
+    has loaded a checkpoint, resumes from there. SHARD_DAYS needs the
+    vectorized engine.
+    With antithetic set (vectorized engine), the run draws the mirror image
+    of the seed's random stream (see sampling.py), the partner of the plain
+    run with that seed.
+    """
+    if engine not in ("simpy", "vectorized"):
+        raise ValueError(f"Unknown engine: {engine}")
+    if checkpointer is not None and engine != "simpy":
+        raise ValueError("Checkpoints need the simpy engine")
+    if config.get("SHARD_DAYS") and engine != "vectorized":
+        raise ValueError("Sharded runs need the vectorized engine")
+    if (config.get("CLOUD_STRATIFIED") or antithetic) and engine != "vectorized":
+        # The SimPy engine's draws branch, so a mirrored stream would drift out of step with its partner
+        raise ValueError("Stratified and antithetic sampling need the vectorized engine")
+    if antithetic and (seed is None or trace is not None):
+        raise ValueError("An antithetic run needs a seed and drawn inputs")
+    if trace is not None:
+        config = trace.apply(config)
+    rng = random.Random(seed) if seed is not None else random
+    config = resolve_random_values(config, rng)
+    if recorder is not None:
+        recorder.config = config
+    with profiling.phase(profiler, "simulation"):
+        if engine == "simpy":
+            return run_simpy(config, priority, rng, log, stats, profiler, recorder, trace, checkpointer)
+        np_rng = np.random.default_rng(seed)
+        if antithetic:
+            np_rng = AntitheticGenerator(np_rng)
+        return vectorized.run(config, priority, np_rng, log, stats, profiler, recorder, trace)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Simulate a home energy system. Without --config, the configuration and strategy are asked for."
     )
+    parser.add_argument("--config", default=None, help="Configuration JSON file: run headless, without prompts")
+    parser.add_argument("--priority", type=int, choices=sorted(PRIORITIES), default=0,
+                        help="Strategy for headless runs: " + ", ".join(f"{k}={v}" for k, v in PRIORITIES.items()))
+    parser.add_argument("--engine", choices=["simpy", "vectorized"], default=None,
+                        help="Simulation engine (defaults to the config's ENGINE)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed (random if omitted)")
+    parser.add_argument("--formats", nargs="+", choices=["csv", "json", "ndjson"], default=None,
+                        help="Log export formats (defaults to the config's LOG_EXPORT_FORMATS)")
+    parser.add_argument("--summary-only", action="store_true", help="Keep only the run summary, no log")
+    parser.add_argument("--summary", default=str(LOG_SUMMARY_PATH), help="Summary JSON file")
+    parser.add_argument("--no-report", action="store_true", help="Skip the text report and the charts")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    headless = args.config is not None
+
+    # GET CONFIG
+    # "random" values are left to run_simulation, which draws them from the run's own generator
+    # once a replayed trace has supplied its own
+    if headless:
+        config = load_config_from_json(args.config, resolve_random=False)
+        if config is None:
+            exit(1)
+    else:
+        config = get_user_config(resolve_random=False)
+    if args.engine is not None:
+        config["ENGINE"] = args.engine
+    if args.formats is not None:
+        config["LOG_EXPORT_FORMATS"] = args.formats
+    if args.summary_only:
+        config["LOG_SUMMARY_ONLY"] = True
+    if config.get("SHARD_DAYS") and config.get("ENGINE", "simpy") != "vectorized":
+        print("Error: sharded runs need the vectorized engine.")
+        exit(1)
+    checkpointer = None
+    checkpoint = None
+    if config.get("CHECKPOINT_DIR"):
+        if config.get("ENGINE", "simpy") != "simpy":
+            print("Error: checkpoints need the simpy engine.")
+            exit(1)
+        checkpointer = Checkpointer(BASE_DIR.joinpath(config["CHECKPOINT_DIR"]),
+                                    config.get("CHECKPOINT_INTERVAL_DAYS", 30))
+        if checkpointer.exists():
+            # An unfinished run goes on exactly as it was started: same resolved config and strategy
+            checkpoint = checkpointer.load()
+            config = checkpoint["config"]
+    trace = None
+    if config.get("TRACE_REPLAY"):
+        trace = Trace(BASE_DIR.joinpath(config["TRACE_REPLAY"]))
+        mismatched = trace.mismatched_keys(config)
+        if mismatched:
+            print(f"Error: the trace was recorded with different {', '.join(mismatched)}.")
+            exit(1)
+        config = trace.apply(config)
+        print(f"Replaying trace: {trace.directory}")
+    recorder = TraceRecorder() if config.get("TRACE_RECORD") else None
+    if checkpoint is not None and recorder is not None:
+        print("Error: a resumed run cannot record a trace, its first part was not recorded.")
+        exit(1)
+    engine = config.get("ENGINE", "simpy")
+    if checkpoint is not None:
+        priority = checkpoint["priority"]
+        day = checkpoint["state"]["tick"] // steps_per_day(config["TIME_STEP_MIN"])
+        print(f"Resuming {PRIORITIES[priority]} from the checkpoint at day {day} of {config['SIM_DURATION_DAY']}...")
+    else:
+        priority = args.priority if headless else get_user_priority(PRIORITIES)
+        print(f"You have chosen {PRIORITIES[priority]} \nStarting Simulation ({engine} engine)...")
 
     # CALLING SIM METHOD
-    env.process(home_energy_system(env, battery, panel, load, inverter, grid, PRIORITIES, config))
-    env.run()
-    print("Simulation finished. Generating report...")
-    import reporting
-    reporting.generate_report()
+    log = None
+    summary_only = config.get("LOG_SUMMARY_ONLY", False)
+    profiler = profiling.Profiler() if config.get("PROFILE", False) else None
+    store = None
+    if config.get("RESULTS_STORE") and checkpoint is None and recorder is None and is_cacheable(config, args.seed):
+        store = ResultsStore.from_config(config, BASE_DIR)
+    cached = store.get(config, priority, engine, args.seed, with_log=not summary_only) if store is not None else None
+    if cached is not None:
+        print(f"Found in the results store ({cached['key'][:12]}), not re-run.")
+        summary = cached["summary"]
+        rollups = None
+        if not summary_only:
+            log = cached["log"]
+            if config.get("LOG_STREAMING", False):
+                # Exported as a fresh run would be: "json" as NDJSON
+                log = streaming_log(config)
+                log.append_columns(cached["log"].columns())
+            save_log(log, config, profiler)
+            if not config["LOG_FREQUENCY"]:
+                rollups = Rollups.from_log(config, cached["log"].columns())
+    else:
+        if summary_only:
+            log = NullLog()
+        elif config.get("LOG_STREAMING", False):
+            log = streaming_log(config, resume=checkpoint["log"] if checkpoint is not None else None)
+        elif checkpoint is not None:
+            log = checkpointer.restore_log(config)
+        stats = RunStatistics.from_config(config, rollups=True)
+        log = run_simulation(config, priority, engine, args.seed, log=log, stats=stats, profiler=profiler,
+                             recorder=recorder, trace=trace, checkpointer=checkpointer)
+        if not summary_only:
+            save_log(log, config, profiler)
+        if checkpointer is not None:
+            # The run is complete, so there is nothing left to resume
+            checkpointer.clear()
+        if recorder is not None:
+            trace_path = BASE_DIR.joinpath(config["TRACE_RECORD"])
+            recorder.save(trace_path)
+            print(f"Trace saved to: {trace_path}")
+        summary = stats.summary()
+        rollups = stats.rollups
+        if store is not None:
+            # A streamed log is read back from the column store save_log finished
+            log_columns = None if summary_only else ColumnStore(LOG_STORE_PATH).read_columns()
+            store.put(config, priority, engine, args.seed, summary, log_columns)
+            print(f"Run saved to the results store: {store.directory}")
+    if store is not None:
+        store.close()
+
+    with profiling.phase(profiler, "save_rollups"):
+        if rollups is not None:
+            rollups.save(ROLLUP_STORE_PATH)
+            print(f"Rollups saved to: {ROLLUP_STORE_PATH}")
+        elif ROLLUP_STORE_PATH.exists():
+            # Rollups on disk belong to an older run
+            shutil.rmtree(ROLLUP_STORE_PATH)
+    with profiling.phase(profiler, "save_summary"):
+        summary["logged"] = not summary_only
+        summary["rollups"] = rollups is not None
+        save_summary_to_json(summary, Path(args.summary))
+    if args.no_report:
+        print("Simulation finished.")
+    else:
+        print("Simulation finished. Generating report...")
+        # Plotting libraries are only loaded when a report is wanted
+        import reporting
+        with profiling.phase(profiler, "report"):
+            reporting.generate_report(Path(args.summary))
+
+    if profiler is not None:
+        profiler.save(PROFILE_PATH)
+        profiler.print_report()
+        print(f"Profile saved to: {PROFILE_PATH}")
@@ -0,0 +1,246 @@
+# optimal.py
+import argparse
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pathlib import Path
+import vectorized
+from sharding import FLOW_NAMES
+
+BASE_DIR = Path(__file__).resolve().parent
+
+TARIFFS_PATH = BASE_DIR.joinpath("tariffs.json")
+
+# Points of the state of charge grid between the floor and a full battery
+OPTIMAL_LEVELS = 101
+# Ticks whose transition costs are computed in one go
+CHUNK_TICKS = 256
+# $ per kWh of unmet load: high enough that the optimal schedule serves every kWh it can
+VALUE_OF_LOST_LOAD = 1000.0
+# Strategies that spill their surplus past the export limit (Grid.export_surplus): they are
+# compared with the optimum under the same rule
+SPILLING_STRATEGIES = {"LOAD_PRIORITY"}
+
+def tick_prices(config, n_ticks, tariff=None):
+    """Import and export price per kWh of every tick: the config's flat rates, or a time-of-use tariff's
+
+    A tariff's daily charge is the same for every schedule and is left out;
+    tiered rates, demand charges and export caps do not price ticks one by
+    one and are refused.
+    """
+    if tariff is None:
+        return np.full(n_ticks, float(config["COST_ENERGY_IMPORTED"])), \
+            np.full(n_ticks, float(config["COST_ENERGY_EXPORTED"]))
+    # Lazy import: tariffs loads pandas
+    import tariffs
+    export = tariff.get("export", 0.0)
+    if tariff.get("demand_charge") or isinstance(export, dict) and export.get("cap_kw") is not None:
+        raise ValueError(f"Tariff {tariff.get('name', 'unnamed')} has a demand charge or an export cap")
+    clock = tariffs.log_clock(config, n_ticks)
+    prices = []
+    for schedule in (tariff.get("import", 0.0), export):
+        if not isinstance(schedule, dict):
+            prices.append(np.full(n_ticks, float(schedule)))
+        elif "tiers" in schedule:
+            raise ValueError(f"Tariff {tariff.get('name', 'unnamed')} has tiered rates")
+        else:
+            prices.append(tariffs.time_of_use_rates(schedule, clock))
+    return prices[0], prices[1]
+
+def transition_cost(delta, surplus, eff, export_cap, import_cap, import_price, export_price):
+    """Cost of one tick that moves the stored energy by delta (kWh), given the solar surplus over the load
+
+    As in Battery, charging stores all it takes and discharging delivers
+    eff of what it removes. What the house cannot use is exported up to the
+    export limit (the rest is curtailed), what it lacks is imported up to
+    the import limit, and the rest is unmet at VALUE_OF_LOST_LOAD.
+    """
+    net = surplus - np.where(delta > 0, delta, delta * eff)
+    grid_export = np.clip(net, 0.0, export_cap)
+    grid_import = np.clip(-net, 0.0, import_cap)
+    unmet = np.maximum(-net - import_cap, 0.0)
+    return import_price * grid_import - export_price * grid_export + VALUE_OF_LOST_LOAD * unmet
+
+def breakpoint_deltas(surplus, eff, export_cap, import_cap):
+    """Moves of the stored energy where a tick's cost changes slope: no grid flow, export or import at its limit"""
+    targets = np.array([0.0, export_cap, -import_cap])
+    gap = surplus - targets
+    return np.where(gap > 0, gap, gap / eff)
+
+def optimal_dispatch(solar, load, config, import_price, export_price, soc=100.0, floor=5.0, levels=OPTIMAL_LEVELS,
+                     export_limit=True):
+    """Minimum-cost flows over known solar/load series (perfect foresight), in vectorized.dispatch's layout
+
+    Dynamic programming over a grid of levels stored energies between the
+    floor and a full battery: the cost-to-go of every grid point is found
+    backwards in time, one vectorized step per tick over all points, and
+    the schedule is then followed forwards from soc. Between grid points
+    the cost-to-go is interpolated linearly, and besides every grid point
+    each tick also tries the moves where its own cost changes slope, so a
+    schedule can store a surplus exactly instead of rounding it to the grid.
+    Leftover energy at the end is worth nothing. Without export_limit, only
+    a zero-export grid limits the export.
+    """
+    solar = np.asarray(solar, dtype=np.float64)
+    load = np.asarray(load, dtype=np.float64)
+    import_price = np.asarray(import_price, dtype=np.float64)
+    export_price = np.asarray(export_price, dtype=np.float64)
+    size = float(config["BATTERY_SIZE"])
+    eff = float(config["BATTERY_ROUND_TRIP_EFFICIENCY"])
+    step_hours = config["TIME_STEP_MIN"] / 60
+    if config["IS_ZERO_EXPORT"]:
+        export_cap = 0.0
+    else:
+        export_cap = config["GRID_MAX_EXPORT_LIMIT"] * step_hours if export_limit else np.inf
+    import_cap = config["GRID_MAX_IMPORT_LIMIT"] * step_hours
+    surplus = solar - load
+    n_ticks = len(surplus)
+
+    energy = np.linspace(size * floor / 100, size, levels)
+    # Every move between two grid points, from levels - 1 points down to levels - 1 points up
+    moves = (np.arange(2 * levels - 1) - levels + 1) * (energy[1] - energy[0])
+
+    # cost_to_go[k, i]: least cost of ticks k.. from grid point i
+    cost_to_go = np.zeros((n_ticks + 1, levels))
+    kink_moves = breakpoint_deltas(surplus[:, None], eff, export_cap, import_cap)
+    for stop in range(n_ticks, 0, -CHUNK_TICKS):
+        # The costs of a chunk of ticks do not depend on the cost-to-go, so they are computed for all of it at once
+        ticks = slice(max(0, stop - CHUNK_TICKS), stop)
+        chunk_surplus = surplus[ticks, None]
+        chunk_import, chunk_export = import_price[ticks, None], export_price[ticks, None]
+        stage = transition_cost(moves, chunk_surplus, eff, export_cap, import_cap, chunk_import, chunk_export)
+        # Row j of a tick's windows (a view, nothing is copied) holds the costs of the moves from point j to each point
+        windows = sliding_window_view(stage, levels, axis=1)[:, ::-1]
+        targets = np.clip(energy[:, None] + kink_moves[ticks, None, :], energy[0], energy[-1])
+        kink_costs = transition_cost(targets - energy[:, None], chunk_surplus[:, :, None], eff, export_cap, import_cap,
+                                     chunk_import[:, :, None], chunk_export[:, :, None])
+        for i in range(stop - ticks.start - 1, -1, -1):
+            next_cost = cost_to_go[ticks.start + i + 1]
+            best = (windows[i] + next_cost).min(axis=1)
+            kinks = (kink_costs[i] + np.interp(targets[i], energy, next_cost)).min(axis=1)
+            cost_to_go[ticks.start + i] = np.minimum(best, kinks)
+
+    flows = {name: np.empty(n_ticks) for name in FLOW_NAMES}
+    stored = size * soc / 100
+    for k in range(n_ticks):
+        kinks = np.clip(stored + kink_moves[k], energy[0], energy[-1])
+        # The last candidate is staying put, for a start off the grid (e.g. below the floor)
+        targets = np.concatenate((energy, kinks, [stored]))
+        delta = targets - stored
+        totals = (transition_cost(delta, surplus[k], eff, export_cap, import_cap, import_price[k], export_price[k])
+                  + np.interp(targets, energy, cost_to_go[k + 1]))
+        move = delta[np.argmin(totals)]
+        stored += move
+        net = surplus[k] - (move if move > 0 else move * eff)
+        flows["soc"][k] = 100 * stored / size
+        flows["grid_export"][k] = min(max(net, 0.0), export_cap)
+        flows["grid_import"][k] = min(max(-net, 0.0), import_cap)
+        flows["unmet"][k] = max(-net - import_cap, 0.0)
+    return flows
+
+def net_profit(flows, import_price, export_price):
+    """Export revenue minus import cost of a run's flows"""
+    return float((flows["grid_export"] * export_price).sum() - (flows["grid_import"] * import_price).sum())
+
+def follows_export_limit(priority):
+    """Whether a strategy keeps to the grid's export limit"""
+    from strategies import STRATEGIES
+    return STRATEGIES[priority].name not in SPILLING_STRATEGIES
+
+def optimal_net_profit(config, inputs, export_limit=True, tariff=None, levels=OPTIMAL_LEVELS):
+    """Net profit and unmet load of the optimal schedule over the inputs"""
+    import_price, export_price = tick_prices(config, len(inputs["solar"]), tariff)
+    flows = optimal_dispatch(inputs["solar"], inputs["load"], config, import_price, export_price, levels=levels,
+                             export_limit=export_limit)
+    return net_profit(flows, import_price, export_price), float(flows["unmet"].sum())
+
+def optimality_gaps(config, inputs, priorities, tariff=None, levels=OPTIMAL_LEVELS):
+    """Net profit of each strategy over the inputs, next to the optimal schedule's, and the gap between them
+
+    The optimum is solved once per export rule the strategies follow.
+    Returns one row per strategy. A gap can come out slightly negative:
+    Battery.discharge delivers the last energy above the floor without the
+    efficiency loss, which the optimum does not get.
+    """
+    # Lazy import: strategies is only needed to name the rows
+    from strategies import STRATEGIES
+    import_price, export_price = tick_prices(config, len(inputs["solar"]), tariff)
+    optima = {}
+    rows = []
+    for priority in priorities:
+        export_limit = follows_export_limit(priority)
+        if export_limit not in optima:
+            optima[export_limit] = optimal_net_profit(config, inputs, export_limit, tariff, levels)
+        optimum, optimal_unmet = optima[export_limit]
+        flows = vectorized.dispatch(priority, inputs["solar"], inputs["load"], config)
+        profit = net_profit(flows, import_price, export_price)
+        rows.append({
+            "strategy": STRATEGIES[priority].name,
+            "net_profit": profit,
+            "unmet": float(flows["unmet"].sum()),
+            "optimal_net_profit": optimum,
+            "optimal_unmet": optimal_unmet,
+            "gap": optimum - profit,
+            # Share of the strategy's net cost the optimum saves (the optimum's own can be close to zero)
+            "gap_pct": 100 * (optimum - profit) / abs(profit) if profit else float("nan"),
+        })
+    return rows
+
+def print_gaps(rows):
+    print("\n" + "=" * 78)
+    print("   OPTIMALITY GAP (perfect-foresight optimum)")
+    print("=" * 78)
+    print(f"{'Strategy':<20} {'Net profit':>12} {'Optimum':>12} {'Gap':>10} {'Gap %':>8} {'Unmet kWh':>10}")
+    for row in rows:
+        print(f"{row['strategy']:<20} {row['net_profit']:>12.2f} {row['optimal_net_profit']:>12.2f} "
+              f"{row['gap']:>10.2f} {row['gap_pct']:>8.2f} {row['unmet']:>10.2f}")
+    print("=" * 78 + "\n")
+
+if __name__ == "__main__":
+    import json
+    import random
+    import main
+    from strategies import STRATEGIES
+    from traces import Trace
+
+    parser = argparse.ArgumentParser(description="Compare the dispatch strategies with the perfect-foresight optimum")
+    parser.add_argument("--trace", default=None, help="Recorded trace to dispatch (see traces.py)")
+    parser.add_argument("--config", default=str(main.DEFAULT_CONFIG_PATH), help="Configuration JSON file")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for drawing the inputs when there is no trace")
+    parser.add_argument("--priorities", type=int, nargs="+", choices=sorted(STRATEGIES), default=sorted(STRATEGIES),
+                        help="Strategies: " + ", ".join(f"{k}={v.name}" for k, v in STRATEGIES.items()))
+    parser.add_argument("--tariff", default=None, help="Price the ticks with this time-of-use tariff of tariffs.json")
+    parser.add_argument("--levels", type=int, default=OPTIMAL_LEVELS, help="State of charge grid points")
+    args = parser.parse_args()
+
+    config = main.load_config_from_json(args.config, resolve_random=False)
+    if config is None:
+        exit(1)
+    if args.trace is not None:
+        trace = Trace(Path(args.trace))
+        try:
+            config = trace.apply(config)
+        except ValueError as error:
+            print(f"Error: {error}")
+            exit(1)
+        config = main.resolve_random_values(config)
+        inputs = trace.inputs()
+    else:
+        config = main.resolve_random_values(config, random.Random(args.seed))
+        inputs = vectorized.draw_inputs(config, np.random.default_rng(args.seed))
+    tariff = None
+    if args.tariff is not None:
+        with open(TARIFFS_PATH, "r") as f:
+            tariff = next((t for t in json.load(f) if t.get("name") == args.tariff), None)
+        if tariff is None:
+            print(f"Error: no tariff named {args.tariff} in {TARIFFS_PATH}.")
+            exit(1)
+
+    start = time.perf_counter()
+    try:
+        rows = optimality_gaps(config, inputs, args.priorities, tariff, args.levels)
+    except ValueError as error:
+        print(f"Error: {error}.")
+        exit(1)
+    print_gaps(rows)
+    print(f"{len(inputs['solar'])} ticks compared in {time.perf_counter() - start:.2f} s")
@@ -1,86 +1,401 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 from pathlib import Path
+from log_buffer import iter_log_chunks
+from log_store import ColumnStore, HEADER_FILE
+import rollups
+import tariffs
 
 # Get the base directory where this script is located
 BASE_DIR = Path(__file__).resolve().parent
 
 LOG_FILE_PATH = BASE_DIR.joinpath("log.csv")
-LOG_JSON_PATH = BASE_DIR.joinpath("log.json")
+LOG_STORE_PATH = BASE_DIR.joinpath("log_store")
 LOG_SUMMARY_PATH = BASE_DIR.joinpath("log_summary.json")
 SOC_CHART_PATH = BASE_DIR.joinpath("report_soc.png")
 ENERGY_CHART_PATH = BASE_DIR.joinpath("report_energy.png")
 FINANCIAL_CHART_PATH = BASE_DIR.joinpath("report_financial.png")
+TARIFF_CHART_PATH = BASE_DIR.joinpath("report_tariffs.png")
+# Fingerprint of the data each chart was last drawn from
+REPORT_CACHE_PATH = BASE_DIR.joinpath("report_cache.json")
+
+# Rows read per chunk
+REPORT_CHUNK_SIZE = 50_000
+# Time series charts are 10 in wide at 100 dpi: longer series are cut to a min/max pair per pixel column
+CHART_BUCKETS = 1000
+
+HOURLY_COLUMNS = {
+    "total_solar": "Solar generation",
+    "total_load": "Load demand",
+    "total_import": "Grid import",
+    "total_export": "Grid export",
+    "total_revenue": "Revenue from exported energy",
+    "total_cost": "Cost of imported energy",
+    "unmet_count": "Unmet load",
+}
+DAILY_COLUMNS = {
+    "total_solar": "Daily solar generation",
+    "total_load": "Daily load",
+    "total_import": "Daily import",
+    "total_export": "Daily export",
+    "total_revenue": "Daily revenue",
+    "total_cost": "Daily cost",
+    "unmet_count": "Daily unmet load (count)",
+}
+# Series drawn on the energy balance chart
+PLOT_KEYS = {"Solar": "total_solar", "Load": "total_load", "Import": "total_import", "Export": "total_export"}
+ROLLUP_PLOT_COLUMNS = {"Solar": "Solar generation", "Load": "Load demand", "Import": "Grid import",
+                       "Export": "Grid export"}
+
+def file_fingerprint(path):
+    """Identifies one version of a file: every run rewrites its log, changing the timestamp"""
+    stat = path.stat()
+    return f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}"
+
+def open_log():
+    """Find the run's log; returns (is_hourly, function yielding chunks of the given columns, fingerprint)"""
+    # The column store is the primary log: columns are memory-mapped and only
+    # the ones a chart or metric needs are ever read
+    if ColumnStore.exists(LOG_STORE_PATH):
+        print("Opening simulation log from column store...")
+        store = ColumnStore(LOG_STORE_PATH)
+        config = store.metadata.get("config", {})
+        is_hourly = not config["LOG_FREQUENCY"] if "LOG_FREQUENCY" in config else len(store) > 60
+        # The header is rewritten with every chunk, so it changes whenever the log does
+        fingerprint = f"{file_fingerprint(LOG_STORE_PATH.joinpath(HEADER_FILE))}:{len(store)}"
+        return is_hourly, lambda columns: store.iter_chunks(REPORT_CHUNK_SIZE, columns), fingerprint
 
-def generate_report():
-    # Try to load JSON first, fall back to CSV
-    df = None
-    if LOG_JSON_PATH.exists():
-        print("Loading simulation log from JSON...")
-        try:
-            with open(LOG_JSON_PATH, 'r') as f:
-                log_data = json.load(f)
-            df = pd.DataFrame(log_data)
-            print("Successfully loaded JSON log.")
-        except Exception as e:
-            print(f"Error loading JSON: {e}")
-    
-    if df is None and LOG_FILE_PATH.exists():
+    if LOG_FILE_PATH.exists():
         print("Loading simulation log from CSV...")
-        df = pd.read_csv(LOG_FILE_PATH)
-        print("Successfully loaded CSV log.")
-    
-    if df is None:
+        # Detect Logic Frequency
+        # If the simulation is ~30 days, Daily logs will have ~30 rows. Hourly ~720 rows.
+        head = pd.read_csv(LOG_FILE_PATH, usecols=["Battery state of charge"], nrows=61)
+        is_hourly = len(head) > 60
+        return (is_hourly, lambda columns: iter_log_chunks(LOG_FILE_PATH, REPORT_CHUNK_SIZE, columns),
+                file_fingerprint(LOG_FILE_PATH))
+
+    return None, None, None
+
+def load_summary(summary_path=None):
+    """The run's log_summary.json (or another summary file), or None when there is none"""
+    summary_path = summary_path or LOG_SUMMARY_PATH
+    if not summary_path.exists():
+        return None
+    with open(summary_path, "r") as f:
+        return json.load(f)
+
+def report_from_summary(summary):
+    """Report figures taken straight from the online run summary, without scanning the log"""
+    energy = summary["energy"]
+    financial = summary["financial"]
+    failures_count = summary["inverter_down_ticks"]
+    # Older summaries have no "ticks"; at hourly steps total_hours is the same number
+    ticks = summary.get("ticks", summary["total_hours"])
+    return {
+        "avg_soc": summary["battery"]["avg_soc"],
+        "min_soc": summary["battery"]["min_soc"],
+        "max_soc": summary["battery"]["max_soc"],
+        "total_solar": energy["total_solar"],
+        "total_load": energy["total_load"],
+        "total_import": energy["total_grid_import"],
+        "total_export": energy["total_grid_export"],
+        "total_revenue": financial["total_revenue"],
+        "total_cost": financial["total_cost"],
+        "net_profit": financial["net_profit"],
+        "unmet_count": summary["unmet_load_count"],
+        "inverter_failures_ticks": failures_count,
+        "inverter_health": (1 - (failures_count / ticks)) * 100 if ticks else 100,
+    }
+
+def report_from_rollups(store):
+    """Report figures summed from a rollup level (the year level: a row per simulated year)"""
+    steps = store.column("Steps")
+    n_steps = int(steps.sum())
+    failures_count = int(store.column("Inverter down (count)").sum())
+    report_data = {key: float(store.column(column).sum()) for key, column in {
+        "total_solar": "Solar generation",
+        "total_load": "Load demand",
+        "total_import": "Grid import",
+        "total_export": "Grid export",
+        "total_revenue": "Revenue from exported energy",
+        "total_cost": "Cost of imported energy",
+    }.items()}
+    report_data.update({
+        "avg_soc": float((store.column("Battery state of charge (mean)") * steps).sum() / n_steps),
+        "min_soc": float(store.column("Battery state of charge (min)").min()),
+        "max_soc": float(store.column("Battery state of charge (max)").max()),
+        "net_profit": report_data["total_revenue"] - report_data["total_cost"],
+        "unmet_count": int(store.column("Unmet load (count)").sum()),
+        "inverter_failures_ticks": failures_count,
+        "inverter_health": (1 - (failures_count / n_steps)) * 100 if n_steps else 100,
+    })
+    return report_data
+
+def rollup_series(store, level):
+    """Chart series of a rollup level: each period's lowest and highest SOC, and its energy totals"""
+    steps = np.asarray(store.column("First step"))
+    return {
+        "steps": np.repeat(steps, 2),
+        "soc": np.stack((store.column("Battery state of charge (min)"),
+                         store.column("Battery state of charge (max)")), axis=1).ravel(),
+        "energy": {label: (steps, np.asarray(store.column(column))) for label, column in ROLLUP_PLOT_COLUMNS.items()},
+        "energy_label": f"Energy per {level} (kWh)",
+    }
+
+def scan_log(read_chunks, columns, with_totals):
+    """Read the chart series from the log, and the report figures too when with_totals"""
+    report_data = dict.fromkeys(columns, 0.0)
+    n_rows = 0
+    soc_sum, min_soc, max_soc = 0.0, float("inf"), float("-inf")
+    failures_count = 0
+    soc_series = []
+    energy_series = {label: [] for label in PLOT_KEYS}
+
+    needed = ["Battery state of charge", *(columns[key] for key in PLOT_KEYS.values())]
+    if with_totals:
+        needed = ["Battery state of charge", "Inverter status", *columns.values()]
+    for chunk in read_chunks(needed):
+        n_rows += len(chunk)
+        soc = chunk["Battery state of charge"]
+        soc_series.append(soc.to_numpy())
+        for label, key in PLOT_KEYS.items():
+            energy_series[label].append(chunk[columns[key]].to_numpy())
+        if not with_totals:
+            continue
+
+        # 1. State of Charge
+        soc_sum += soc.sum()
+        min_soc = min(min_soc, soc.min())
+        max_soc = max(max_soc, soc.max())
+
+        # 2. Energy Totals (hourly columns, or the daily accumulated ones)
+        for key, column in columns.items():
+            report_data[key] += chunk[column].sum()
+
+        # 3. Inverter Status
+        # Inverter status is boolean. 
+        failures_count += int(chunk["Inverter status"].sum())
+
+    if n_rows == 0:
+        return None, None
+    steps = np.arange(n_rows)
+    series = {
+        "steps": steps,
+        "soc": np.concatenate(soc_series),
+        "energy": {label: (steps, np.concatenate(parts)) for label, parts in energy_series.items()},
+        "energy_label": "Energy (kWh)",
+    }
+    if not with_totals:
+        return None, series
+
+    report_data["avg_soc"] = soc_sum / n_rows
+    report_data["min_soc"] = min_soc
+    report_data["max_soc"] = max_soc
+    report_data["unmet_count"] = int(report_data["unmet_count"])
+    report_data["net_profit"] = report_data["total_revenue"] - report_data["total_cost"]
+    report_data["inverter_failures_ticks"] = failures_count
+    report_data["inverter_health"] = (1 - (failures_count / n_rows)) * 100
+    return report_data, series
+
+def envelope(x, y, n_buckets=CHART_BUCKETS):
+    """Min/max envelope of a series: every bucket of consecutive points keeps its lowest and highest point
+
+    The two are kept in time order, so a line through them covers the same
+    pixels as the full series at n_buckets pixel columns.
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return x, y
+    size = -(-n // n_buckets)
+    n_full = -(-n // size)
+    # The last bucket is padded with its last point, which changes neither its min nor its max
+    padded = np.concatenate((y, np.full(n_full * size - n, y[-1]))).reshape(n_full, size)
+    offsets = np.arange(n_full) * size
+    low = offsets + padded.argmin(axis=1)
+    high = offsets + padded.argmax(axis=1)
+    index = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=1).ravel()
+    return x[index], y[index]
+
+def downsample(series):
+    """The chart series cut to CHART_BUCKETS min/max pairs each"""
+    return {
+        "soc": envelope(series["steps"], series["soc"]),
+        "energy": {label: envelope(steps, values) for label, (steps, values) in series["energy"].items()},
+        "energy_label": series["energy_label"],
+    }
+
+def pyplot():
+    """matplotlib.pyplot with the report theme
+
+    Imported on first use: plotting libraries take longer to load than a
+    short run takes, and a report whose charts are all cached needs none.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set_theme(style="whitegrid")
+    return plt
+
+def plot_soc(soc, path):
+    """State of charge chart from (steps, values)"""
+    plt = pyplot()
+    plt.figure(figsize=(10, 5))
+    plt.plot(*soc, label="SOC %", color="green")
+    plt.title("Battery State of Charge Over Time")
+    plt.xlabel("Time Step (Hour/Day)")
+    plt.ylabel("SOC (%)")
+    plt.axhline(y=0, color='r', linestyle='--')
+    plt.axhline(y=100, color='r', linestyle='--')
+    plt.legend()
+    plt.savefig(path)
+    plt.close()  # Close the figure to free memory
+
+def plot_energy(energy, ylabel, path):
+    """Energy balance chart from {label: (steps, values)}"""
+    plt = pyplot()
+    plt.figure(figsize=(10, 5))
+    for label, (steps, values) in energy.items():
+        plt.plot(steps, values, label=label, alpha=0.7 if label in ("Solar", "Load") else 0.5)
+
+    plt.title("Energy Balance Over Time")
+    plt.xlabel("Time Step")
+    plt.ylabel(ylabel)
+    plt.legend()
+    plt.savefig(path)
+    plt.close()  # Close the figure to free memory
+
+def plot_financial(revenue, cost, path):
+    """Revenue and cost bar chart"""
+    plt = pyplot()
+    plt.figure(figsize=(6, 6))
+    plt.bar(["Revenue", "Cost"], [revenue, cost], color=["green", "red"])
+    plt.title("Financial Overview")
+    plt.ylabel("Currency ($)")
+    plt.savefig(path)
+    plt.close()  # Close the figure to free memory
+
+def _render(plot, *args):
+    """Worker process entry point: draw one chart off screen"""
+    pyplot().switch_backend("Agg")
+    plot(*args)
+
+def render_charts(jobs):
+    """Draw charts given as (plot function, args ending with the output path), in parallel worker processes"""
+    workers = min(len(jobs), os.cpu_count() or 1)
+    if workers == 1:
+        # A single chart or core: worker processes would only add their start-up time
+        for plot, args in jobs:
+            plot(*args)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(_render, plot, *args) for plot, args in jobs]:
+                future.result()
+    for _, args in jobs:
+        print(f"Saved chart: {args[-1]}")
+
+def chart_key(*parts):
+    """Cache key of a chart: a hash of everything it is drawn from"""
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+def load_report_cache():
+    if not REPORT_CACHE_PATH.exists():
+        return {}
+    try:
+        with open(REPORT_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+def save_report_cache(cache):
+    # Write-then-rename so a reader never sees a half-written cache
+    tmp_path = REPORT_CACHE_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, REPORT_CACHE_PATH)
+
+def is_cached(cache, path, key):
+    return cache.get(str(path)) == key and path.exists()
+
+def report_tariffs():
+    """Re-price the logged run under every tariff in tariffs.json, print and chart the comparison"""
+    try:
+        comparison = tariffs.Repricer(LOG_STORE_PATH).compare(tariffs.load_tariffs())
+    except ValueError as error:
+        print(f"Skipping tariff comparison: {error}")
+        return
+    tariffs.print_comparison(comparison)
+
+    cache = load_report_cache()
+    key = chart_key("tariffs", comparison["tariff"].tolist(), comparison["net_profit"].tolist())
+    if is_cached(cache, TARIFF_CHART_PATH, key):
+        print(f"Figures unchanged; keeping {TARIFF_CHART_PATH.name}")
+        return
+
+    plt = pyplot()
+    plt.figure(figsize=(10, 5))
+    colors = ["green" if value >= 0 else "red" for value in comparison["net_profit"]]
+    plt.bar(comparison["tariff"], comparison["net_profit"], color=colors)
+    plt.axhline(y=0, color="black", linewidth=0.8)
+    plt.title("Net Profit by Tariff")
+    plt.ylabel("Currency ($)")
+    plt.xticks(rotation=20, ha="right")
+    plt.tight_layout()
+    plt.savefig(TARIFF_CHART_PATH)
+    print(f"Saved chart: {TARIFF_CHART_PATH}")
+    plt.close()  # Close the figure to free memory
+    save_report_cache({**cache, str(TARIFF_CHART_PATH): key})
+
+def generate_report(summary_path=None):
+    summary = load_summary(summary_path)
+    is_hourly, read_chunks, log_fingerprint = open_log()
+    if summary is not None and not summary.get("logged", True):
+        # Summary-only run: any log on disk belongs to an older run
+        read_chunks = None
+    # Runs from before the rollups existed have none (their summary says nothing)
+    has_rollups = summary.get("rollups", False) if summary is not None else rollups.exists()
+    if summary is None and read_chunks is None and not has_rollups:
         print(f"Error: No log files found. Please run the simulation first (main.py).")
         return
-    
-    # Detect Logic Frequency
-    # If the simulation is ~30 days, Daily logs will have ~30 rows. Hourly ~720 rows.
-    is_hourly = len(df) > 60 
-    freq_str = "HOURLY" if is_hourly else "DAILY"
-    print(f"Detected Log Frequency: {freq_str}")
 
     # --- Calculations ---
-    report_data = {}
-
-    # 1. State of Charge
-    report_data["avg_soc"] = df["Battery state of charge"].mean()
-    report_data["min_soc"] = df["Battery state of charge"].min()
-    report_data["max_soc"] = df["Battery state of charge"].max()
-
-    # 2. Energy Totals
-    if is_hourly:
-        # Summing hourly columns
-        report_data["total_solar"] = df["Solar generation"].sum()
-        report_data["total_load"] = df["Load demand"].sum()
-        report_data["total_import"] = df["Grid import"].sum()
-        report_data["total_export"] = df["Grid export"].sum()
-        report_data["total_revenue"] = df["Revenue from exported energy"].sum()
-        report_data["total_cost"] = df["Cost of imported energy"].sum()
-        report_data["unmet_count"] = df["Unmet load"].sum() # True=1, False=0
+    # The run summary already holds every figure; the log is only read for the charts
+    report_data = report_from_summary(summary) if summary is not None else None
+    cache = load_report_cache()
+    series_key = None
+    series_cached = False
+    series = None
+    if has_rollups:
+        # Each question is answered by the coarsest level that resolves it: the charts by the finest
+        # level short enough to draw without downsampling, the totals by the year level
+        level = rollups.finest_level(2 * CHART_BUCKETS)
+        store = rollups.open_level(level)
+        print(f"Charting the {level} rollups ({len(store)} rows)")
+        freq_str = f"{level.upper()} ROLLUPS"
+        header_path = rollups.ROLLUP_STORE_PATH.joinpath(level, HEADER_FILE)
+        series_key = chart_key("rollups", level, file_fingerprint(header_path))
+        series_cached = all(is_cached(cache, path, series_key) for path in (SOC_CHART_PATH, ENERGY_CHART_PATH))
+        report_data = report_data or report_from_rollups(rollups.open_level("year"))
+        if not series_cached:
+            series = rollup_series(store, level)
+    elif read_chunks is not None:
+        series_key = chart_key("series", log_fingerprint, CHART_BUCKETS)
+        series_cached = all(is_cached(cache, path, series_key) for path in (SOC_CHART_PATH, ENERGY_CHART_PATH))
+        freq_str = "HOURLY" if is_hourly else "DAILY"
+        print(f"Detected Log Frequency: {freq_str}")
+        columns = HOURLY_COLUMNS if is_hourly else DAILY_COLUMNS
+        # Charts already drawn from this very log are not read or drawn again
+        if report_data is None or not series_cached:
+            scanned, series = scan_log(read_chunks, columns, with_totals=report_data is None)
+            report_data = report_data or scanned
     else:
-        # Summing daily accumulated columns
-        report_data["total_solar"] = df["Daily solar generation"].sum()
-        report_data["total_load"] = df["Daily load"].sum()
-        report_data["total_import"] = df["Daily import"].sum()
-        report_data["total_export"] = df["Daily export"].sum()
-        report_data["total_revenue"] = df["Daily revenue"].sum()
-        report_data["total_cost"] = df["Daily cost"].sum()
-        report_data["unmet_count"] = df["Daily unmet load (count)"].sum()
+        freq_str = "SUMMARY ONLY"
 
-    report_data["net_profit"] = report_data["total_revenue"] - report_data["total_cost"]
-    
-    # 3. Inverter Status
-    # Inverter status is boolean. 
-    if "Inverter status" in df.columns:
-        failures_count = df["Inverter status"].sum()
-        report_data["inverter_failures_ticks"] = failures_count
-        report_data["inverter_health"] = (1 - (failures_count / len(df))) * 100
-    else:
-        report_data["inverter_failures_ticks"] = 0
-        report_data["inverter_health"] = 100
+    if report_data is None:
+        print(f"Error: Log file is empty. Please run the simulation first (main.py).")
+        return
 
     # --- PRINT TEXT REPORT ---
     print("\n" + "="*40)
@@ -104,50 +419,35 @@ def generate_report():
     print("="*40 + "\n")
 
     # --- VISUALIZATIONS ---
-    sns.set_theme(style="whitegrid")
-    
-    # 1. State of Charge Over Time
-    plt.figure(figsize=(10, 5))
-    plt.plot(df.index, df["Battery state of charge"], label="SOC %", color="green")
-    plt.title("Battery State of Charge Over Time")
-    plt.xlabel("Time Step (Hour/Day)")
-    plt.ylabel("SOC (%)")
-    plt.axhline(y=0, color='r', linestyle='--')
-    plt.axhline(y=100, color='r', linestyle='--')
-    plt.legend()
-    plt.savefig(SOC_CHART_PATH)
-    print(f"Saved chart: {SOC_CHART_PATH}")
-    plt.close()  # Close the figure to free memory
-    
-    # 2. Energy Balance (Line Chart)
-    plt.figure(figsize=(10, 5))
-    if is_hourly:
-        plt.plot(df.index, df["Solar generation"], label="Solar", alpha=0.7)
-        plt.plot(df.index, df["Load demand"], label="Load", alpha=0.7)
-        plt.plot(df.index, df["Grid import"], label="Import", alpha=0.5)
-        plt.plot(df.index, df["Grid export"], label="Export", alpha=0.5)
+    jobs = []
+    keys = {}
+
+    # 1. State of Charge and 2. Energy Balance (line charts, downsampled)
+    if series_key is None:
+        print("No per-tick log for this run (summary only); skipping time series charts.")
+    elif series_cached:
+        print(f"Log unchanged; keeping {SOC_CHART_PATH.name} and {ENERGY_CHART_PATH.name}")
     else:
-         plt.plot(df.index, df["Daily solar generation"], label="Solar", alpha=0.7)
-         plt.plot(df.index, df["Daily load"], label="Load", alpha=0.7)
-         plt.plot(df.index, df["Daily import"], label="Import", alpha=0.5)
-         plt.plot(df.index, df["Daily export"], label="Export", alpha=0.5)
-         
-    plt.title("Energy Balance Over Time")
-    plt.xlabel("Time Step")
-    plt.ylabel("Energy (kWh)")
-    plt.legend()
-    plt.savefig(ENERGY_CHART_PATH)
-    print(f"Saved chart: {ENERGY_CHART_PATH}")
-    plt.close()  # Close the figure to free memory
+        plotted = downsample(series)
+        jobs += [(plot_soc, (plotted["soc"], SOC_CHART_PATH)),
+                 (plot_energy, (plotted["energy"], plotted["energy_label"], ENERGY_CHART_PATH))]
+        keys[str(SOC_CHART_PATH)] = keys[str(ENERGY_CHART_PATH)] = series_key
 
     # 3. Financial Overview (Bar Chart)
-    plt.figure(figsize=(6, 6))
-    plt.bar(["Revenue", "Cost"], [report_data["total_revenue"], report_data["total_cost"]], color=["green", "red"])
-    plt.title("Financial Overview")
-    plt.ylabel("Currency ($)")
-    plt.savefig(FINANCIAL_CHART_PATH)
-    print(f"Saved chart: {FINANCIAL_CHART_PATH}")
-    plt.close()  # Close the figure to free memory
+    financial_key = chart_key("financial", report_data["total_revenue"], report_data["total_cost"])
+    if is_cached(cache, FINANCIAL_CHART_PATH, financial_key):
+        print(f"Figures unchanged; keeping {FINANCIAL_CHART_PATH.name}")
+    else:
+        jobs.append((plot_financial, (report_data["total_revenue"], report_data["total_cost"], FINANCIAL_CHART_PATH)))
+        keys[str(FINANCIAL_CHART_PATH)] = financial_key
+
+    render_charts(jobs)
+    if keys:
+        save_report_cache({**cache, **keys})
+
+    # 4. Tariff Comparison (re-priced from the logged grid flows)
+    if tariffs.TARIFFS_PATH.exists() and read_chunks is not None and ColumnStore.exists(LOG_STORE_PATH):
+        report_tariffs()
 
     print("\nReporting complete.")
 
@@ -0,0 +1,326 @@
+# results_store.py
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from log_buffer import LogBuffer
+from log_store import ColumnStore, save_column_store
+from simulator import resolve_random_values
+
+INDEX_FILE = "index.sqlite"
+PAYLOAD_DIR = "runs"
+
+# Modules whose code decides a run's results: editing any of them retires the stored runs
+RESULT_MODULES = ["main.py", "simulator.py", "vectorized.py", "strategies.py", "sharding.py", "sampling.py",
+                  "battery.py", "grid.py", "house_load.py", "inverter.py", "solar_panel.py", "utils.py",
+                  "run_stats.py", "log_buffer.py"]
+
+# Config keys that only change how a run is logged, saved or watched, not its results
+NON_RESULT_KEYS = ["ENGINE", "LOG_STREAMING", "LOG_CHUNK_SIZE", "LOG_EXPORT_FORMATS", "LOG_SUMMARY_ONLY",
+                   "PROFILE", "TRACE_RECORD", "CHECKPOINT_DIR", "CHECKPOINT_INTERVAL_DAYS",
+                   "RESULTS_STORE", "RESULTS_STORE_MAX_MB"]
+
+# Index columns a query can filter or sort on directly; other fields are config keys or summary paths
+RUN_COLUMNS = ["priority", "engine", "seed", "antithetic", "created", "last_used", "size_bytes"]
+QUERY_OPERATORS = ["=", "!=", "<", "<=", ">", ">="]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    antithetic INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    has_log INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+_engine_version = None
+
+def engine_version():
+    """Hash of the RESULT_MODULES sources, part of every run key"""
+    global _engine_version
+    if _engine_version is None:
+        digest = hashlib.sha256()
+        for name in RESULT_MODULES:
+            digest.update(Path(__file__).with_name(name).read_bytes())
+        _engine_version = digest.hexdigest()[:16]
+    return _engine_version
+
+def run_key(config, priority, engine, seed, antithetic=False):
+    """Content address of a seeded run: hash of its resolved config, strategy, engine and engine version"""
+    config = resolve_random_values(config, random.Random(seed))
+    identity = {
+        "config": {key: value for key, value in config.items() if key not in NON_RESULT_KEYS},
+        "priority": priority,
+        "engine": engine,
+        "engine_version": engine_version(),
+        "seed": seed,
+        "antithetic": antithetic,
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+def is_cacheable(config, seed):
+    """Only seeded runs that draw their own inputs can be looked up again"""
+    return seed is not None and not config.get("TRACE_REPLAY")
+
+def _directory_size(directory):
+    return sum(path.stat().st_size for path in directory.iterdir())
+
+
+class ResultsStore:
+    """Seeded runs' summaries and logs, stored by run_key
+
+    A SQLite index holds one row per run (config, summary, size, last use);
+    each logged run's rows are a column store under runs/<key>. Payloads are
+    written to a private directory and renamed into place, and the index is
+    in WAL mode, so worker processes can read and write the same store at
+    once. Past max_bytes the least recently used runs are evicted.
+    """
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        directory.joinpath(PAYLOAD_DIR).mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(directory.joinpath(INDEX_FILE), timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config, base_dir):
+        max_mb = config.get("RESULTS_STORE_MAX_MB")
+        return cls(base_dir.joinpath(config["RESULTS_STORE"]), max_mb * 1024 * 1024 if max_mb else None)
+
+    def close(self):
+        self._db.close()
+
+    def _payload(self, key):
+        return self.directory.joinpath(PAYLOAD_DIR, key)
+
+    def get(self, config, priority, engine, seed, with_log=True, antithetic=False):
+        """{"key", "summary", "log"} of a stored run, or None; log is a LogBuffer, or None when with_log is off"""
+        key = run_key(config, priority, engine, seed, antithetic)
+        row = self._db.execute("SELECT summary, has_log FROM runs WHERE key = ?", (key,)).fetchone()
+        if row is None or (with_log and not row[1]):
+            return None
+        log = None
+        if with_log:
+            try:
+                log = LogBuffer.from_columns(ColumnStore(self._payload(key)).read_columns())
+            except FileNotFoundError:  # Evicted by another process since the lookup
+                return None
+        with self._db:
+            self._db.execute("UPDATE runs SET last_used = ? WHERE key = ?", (time.time(), key))
+        return {"key": key, "summary": json.loads(row[0]), "log": log}
+
+    def put(self, config, priority, engine, seed, summary, log_columns=None, antithetic=False):
+        """Store a finished run's summary and, when given, its log (column name -> array); return its key"""
+        config = resolve_random_values(config, random.Random(seed))
+        key = run_key(config, priority, engine, seed, antithetic)
+        summary_json = json.dumps(summary)
+        size = len(summary_json)
+        if log_columns is not None:
+            payload = self._payload(key)
+            if not ColumnStore.exists(payload):
+                # Written under a private name, then renamed: readers never see a partial payload
+                tmp = self.directory.joinpath(PAYLOAD_DIR, f".{key}.{uuid.uuid4().hex}")
+                save_column_store(log_columns, tmp, {"config": config})
+                try:
+                    os.rename(tmp, payload)
+                except OSError:  # Another worker stored the same run first
+                    shutil.rmtree(tmp, ignore_errors=True)
+            size += _directory_size(payload)
+        with self._db:
+            # A run stored with its log is never replaced by the same run without one
+            self._db.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET has_log = MAX(has_log, excluded.has_log), "
+                "size_bytes = MAX(size_bytes, excluded.size_bytes), last_used = excluded.last_used",
+                # Seeds spawned by ensembles can exceed SQLite's 64-bit signed integers
+                (key, priority, engine, str(seed), int(antithetic), json.dumps(config), summary_json,
+                 int(log_columns is not None), size, datetime.now().isoformat(timespec="seconds"), time.time()),
+            )
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+        return key
+
+    def evict(self, max_bytes):
+        """Delete least recently used runs until the store holds at most max_bytes; return how many went"""
+        with self._db:
+            rows = self._db.execute("SELECT key, size_bytes FROM runs ORDER BY last_used DESC").fetchall()
+            kept = 0
+            evicted = []
+            for key, size in rows:
+                kept += size
+                if kept > max_bytes:
+                    evicted.append(key)
+            self._db.executemany("DELETE FROM runs WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            shutil.rmtree(self._payload(key), ignore_errors=True)
+        return len(evicted)
+
+    def query(self, where=(), order_by=None, descending=False, limit=None):
+        """Stored runs matching every (field, operator, value) in where, as dicts
+
+        A field is an index column (RUN_COLUMNS), a config key (e.g.
+        "BATTERY_SIZE") or a summary path (e.g. "financial.net_profit");
+        order_by takes the same fields.
+        """
+        clauses = []
+        params = []
+        for field, operator, value in where:
+            if operator not in QUERY_OPERATORS:
+                raise ValueError(f"Unknown operator: {operator}")
+            expression, field_params = self._field(field)
+            clauses.append(f"{expression} {operator} ?")
+            params += field_params + [value]
+        sql = "SELECT key, priority, engine, seed, antithetic, config, summary, has_log, size_bytes, created FROM runs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by is not None:
+            expression, field_params = self._field(order_by)
+            sql += f" ORDER BY {expression} {'DESC' if descending else 'ASC'}"
+            params += field_params
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            {"key": key, "priority": priority, "engine": engine, "seed": int(seed), "antithetic": bool(antithetic),
+             "config": json.loads(config), "summary": json.loads(summary), "has_log": bool(has_log),
+             "size_bytes": size, "created": created}
+            for key, priority, engine, seed, antithetic, config, summary, has_log, size, created
+            in self._db.execute(sql, params).fetchall()
+        ]
+
+    @staticmethod
+    def _field(field):
+        """SQL expression (and its parameters) for a query field"""
+        if field == "seed":
+            # Stored as text (see put) but compared and sorted as a number
+            return "CAST(seed AS NUMERIC)", []
+        if field in RUN_COLUMNS:
+            return field, []
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*", field):
+            raise ValueError(f"Invalid field: {field}")
+        # Config keys are upper case; anything else is looked up in the summary
+        column = "config" if field.isupper() else "summary"
+        return f"json_extract({column}, ?)", [f"$.{field}"]
+
+    def stats(self):
+        """Number of stored runs and their total size in bytes"""
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM runs").fetchone()
+        return {"runs": count, "size_bytes": size}
+
+
+def field_value(run, field):
+    """Value of a query field in a run returned by ResultsStore.query"""
+    if field in RUN_COLUMNS:
+        return run.get(field)
+    value = run["config"] if field.isupper() else run["summary"]
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def check_entry_points(config, priority, engine, seed):
+    """Run a seeded run as main and as an ensemble replication do; return its key and the two summaries
+
+    Both have the same run_key, so a store is only sound if they agree.
+    """
+    # Lazy imports: main and ensemble import this module
+    import main
+    import ensemble
+    from log_buffer import NullLog
+    from run_stats import RunStatistics
+    config = dict(config, RESULTS_STORE=None)
+    stats = RunStatistics.from_config(config)
+    main.run_simulation(config, priority, engine, seed, log=NullLog(), stats=stats)
+    main_summary = stats.summary()
+    del main_summary["statistics"]
+    return run_key(config, priority, engine, seed), main_summary, ensemble.run_replication(config, priority, engine, seed)
+
+def parse_condition(condition):
+    """"BATTERY_SIZE>10" -> ("BATTERY_SIZE", ">", 10)"""
+    match = re.fullmatch(r"\s*([\w.]+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*", condition)
+    if match is None:
+        raise ValueError(f"Invalid condition: {condition}")
+    field, operator, value = match.groups()
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:  # Bare words are strings, e.g. engine=vectorized
+        pass
+    return field, operator, value
+
+
+if __name__ == "__main__":
+    import main
+
+    parser = argparse.ArgumentParser(description="Query and maintain the results store")
+    parser.add_argument("--store", default=None,
+                        help="Store directory (defaults to the default config's RESULTS_STORE)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="List stored runs")
+    query_parser.add_argument("--where", action="append", default=[],
+                              help='Condition on a config key, summary path or run column, e.g. "BATTERY_SIZE>10"')
+    query_parser.add_argument("--sort", default="financial.net_profit", help="Field to sort by")
+    query_parser.add_argument("--desc", action="store_true", help="Sort in descending order")
+    query_parser.add_argument("--limit", type=int, default=20, help="Rows to show")
+    subparsers.add_parser("stats", help="Number of stored runs and their size")
+    evict_parser = subparsers.add_parser("evict", help="Drop least recently used runs")
+    evict_parser.add_argument("--max-mb", type=float, required=True, help="Size to shrink the store to")
+    check_parser = subparsers.add_parser(
+        "check", help="Check that main and the ensemble runner give the same summary for the same run key"
+    )
+    check_parser.add_argument("--seed", type=int, default=0, help="Seed of the run")
+    check_parser.add_argument("--priority", type=int, choices=sorted(main.PRIORITIES), default=0, help="Strategy")
+    check_parser.add_argument("--engine", choices=["simpy", "vectorized"], default=None,
+                              help="Simulation engine (defaults to the default config's ENGINE)")
+    args = parser.parse_args()
+
+    default_config = main.load_config_from_json(main.DEFAULT_CONFIG_PATH, resolve_random=False)
+    if args.command == "check":
+        engine = args.engine or default_config.get("ENGINE", "simpy")
+        key, main_summary, ensemble_summary = check_entry_points(default_config, args.priority, engine, args.seed)
+        if main_summary != ensemble_summary:
+            print(f"Error: run {key[:12]} differs between main and the ensemble runner.")
+            exit(1)
+        print(f"Run {key[:12]}: main and the ensemble runner agree "
+              f"(net profit {main_summary['financial']['net_profit']:.2f}).")
+        exit(0)
+    store_dir = args.store or default_config.get("RESULTS_STORE") or "results_store"
+    store = ResultsStore(main.BASE_DIR.joinpath(store_dir))
+
+    if args.command == "query":
+        try:
+            where = [parse_condition(condition) for condition in args.where]
+            runs = store.query(where, args.sort, args.desc, args.limit)
+        except (ValueError, sqlite3.Error) as e:
+            print(f"Error: {e}")
+            exit(1)
+        print(f"{'Key':<14} {'Strategy':>18} {'Engine':>10} {'Seed':>12} {'Days':>6} {'Battery':>8} "
+              f"{args.sort:>24} {'Net profit':>11}")
+        for run in runs:
+            sort_value = field_value(run, args.sort)
+            print(f"{run['key'][:12]:<14} {main.PRIORITIES.get(run['priority'], run['priority']):>18} "
+                  f"{run['engine']:>10} {run['seed']:>12} {run['config']['SIM_DURATION_DAY']:>6} "
+                  f"{run['config']['BATTERY_SIZE']:>8} {str(sort_value):>24} "
+                  f"{run['summary']['financial']['net_profit']:>11.2f}")
+    elif args.command == "stats":
+        stats = store.stats()
+        print(f"{stats['runs']} runs, {stats['size_bytes'] / 1024 / 1024:.1f} MB in {store.directory}")
+    else:
+        evicted = store.evict(int(args.max_mb * 1024 * 1024))
+        print(f"Evicted {evicted} runs")
+    store.close()
@@ -0,0 +1,245 @@
+# rollups.py
+import argparse
+import shutil
+import numpy as np
+from pathlib import Path
+from log_store import ColumnStore, save_column_store
+from utils import DAYS_PER_YEAR, MINUTES_PER_DAY, MONTH_START_DAYS
+
+BASE_DIR = Path(__file__).resolve().parent
+
+LOG_STORE_PATH = BASE_DIR.joinpath("log_store")
+ROLLUP_STORE_PATH = BASE_DIR.joinpath("log_rollups")
+
+# Finest first. Each level is rolled up from the one it names: weeks and months both from days
+LEVELS = {"hour": None, "day": "hour", "week": "day", "month": "day", "year": "month"}
+
+# Rollup row schema: column name -> dtype, as saved in each level's column store
+ROLLUP_COLUMNS = {
+    "First step": np.int64,
+    "Steps": np.int64,
+    "Battery state of charge (mean)": np.float64,
+    "Battery state of charge (min)": np.float64,
+    "Battery state of charge (max)": np.float64,
+    "Battery state of charge (end)": np.float64,
+    "Solar generation": np.float64,
+    "Load demand": np.float64,
+    "Grid import": np.float64,
+    "Grid export": np.float64,
+    "Revenue from exported energy": np.float64,
+    "Cost of imported energy": np.float64,
+    "Unmet load (count)": np.int64,
+    "Inverter down (count)": np.int64,
+}
+# How rows of a finer level combine; the mean is kept as a sum until the rows are saved
+SUM_COLUMNS = ["Steps", "Battery state of charge (sum)", "Solar generation", "Load demand", "Grid import",
+               "Grid export", "Revenue from exported energy", "Cost of imported energy", "Unmet load (count)",
+               "Inverter down (count)"]
+MIN_COLUMNS = ["Battery state of charge (min)"]
+MAX_COLUMNS = ["Battery state of charge (max)"]
+FIRST_COLUMNS = ["First step"]
+LAST_COLUMNS = ["Battery state of charge (end)"]
+
+# Rollup column fed by each RunStatistics series
+SERIES_COLUMNS = {
+    "solar": "Solar generation",
+    "load": "Load demand",
+    "grid_import": "Grid import",
+    "grid_export": "Grid export",
+    "revenue": "Revenue from exported energy",
+    "cost": "Cost of imported energy",
+}
+# Per-step log column each series is rebuilt from
+LOG_SERIES = {
+    "soc": "Battery state of charge",
+    "solar": "Solar generation",
+    "load": "Load demand",
+    "grid_import": "Grid import",
+    "grid_export": "Grid export",
+    "unmet": "Unmet load",
+    "revenue": "Revenue from exported energy",
+    "cost": "Cost of imported energy",
+}
+
+def period_ids(level, first_steps, config):
+    """Period of each row at one level, numbered from Jan 1st of the first simulated year"""
+    minutes = np.asarray(first_steps, dtype=np.int64) * config["TIME_STEP_MIN"]
+    if level == "hour":
+        return minutes // 60
+    day = config["SIM_START_DAY"] + minutes // MINUTES_PER_DAY
+    if level == "day":
+        return day
+    if level == "week":
+        # Days 0-4 of a week are weekdays, as in the load model
+        return day // 7
+    month = np.searchsorted(MONTH_START_DAYS, day % DAYS_PER_YEAR, side="right") - 1
+    if level == "month":
+        return (day // DAYS_PER_YEAR) * 12 + month
+    return day // DAYS_PER_YEAR
+
+def combine(rows, ids):
+    """Rows (column name -> array) merged into one row per run of equal ids"""
+    n_rows = len(ids)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    ends = np.append(starts[1:], n_rows) - 1
+    combined = {name: np.add.reduceat(rows[name], starts) for name in SUM_COLUMNS}
+    combined.update({name: np.minimum.reduceat(rows[name], starts) for name in MIN_COLUMNS})
+    combined.update({name: np.maximum.reduceat(rows[name], starts) for name in MAX_COLUMNS})
+    combined.update({name: rows[name][starts] for name in FIRST_COLUMNS})
+    combined.update({name: rows[name][ends] for name in LAST_COLUMNS})
+    return combined, ids[starts]
+
+
+class RollupLevel:
+    """Closed periods of one level, plus the open one still being added to"""
+    def __init__(self):
+        self._closed = []
+        self._ids = None
+        self._open = None
+
+    def add(self, rows, ids):
+        """Merge rows of this level's periods in, in time order"""
+        if self._open is not None:
+            rows = {name: np.concatenate((self._open[name], values)) for name, values in rows.items()}
+            ids = np.concatenate((self._ids, ids))
+        merged, merged_ids = combine(rows, ids)
+        if len(merged_ids) > 1:
+            self._closed.append({name: values[:-1] for name, values in merged.items()})
+        self._open = {name: values[-1:] for name, values in merged.items()}
+        self._ids = merged_ids[-1:]
+
+    def rows(self):
+        """Every period so far, the open one included, in the ROLLUP_COLUMNS layout"""
+        parts = self._closed + ([self._open] if self._open is not None else [])
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in ROLLUP_COLUMNS.items()}
+        rows = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        rows["Battery state of charge (mean)"] = rows.pop("Battery state of charge (sum)") / rows["Steps"]
+        return {name: rows[name].astype(dtype) for name, dtype in ROLLUP_COLUMNS.items()}
+
+    def snapshot(self):
+        if self._open is None:
+            return {"rows": None, "open_id": None}
+        parts = self._closed + [self._open]
+        return {
+            "rows": {name: np.concatenate([part[name] for part in parts]).tolist() for name in self._open},
+            "open_id": int(self._ids[0]),
+        }
+
+    def restore(self, state):
+        self._closed, self._ids, self._open = [], None, None
+        if state["rows"] is None:
+            return
+        rows = {name: np.array(values) for name, values in state["rows"].items()}
+        self._closed.append({name: values[:-1] for name, values in rows.items()})
+        self._open = {name: values[-1:] for name, values in rows.items()}
+        self._ids = np.array([state["open_id"]], dtype=np.int64)
+
+
+class Rollups:
+    """Hour, day, week, month and year totals of a run, built block by block as it goes
+
+    Each block of ticks is cut into hours, and only those hour rows are
+    rolled further up the pyramid, so a level costs a handful of array
+    operations per block whatever the run length. Any question about a
+    period can then be answered from the coarsest level that resolves it.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.ticks = 0
+        self.levels = {level: RollupLevel() for level in LEVELS}
+
+    @classmethod
+    def from_log(cls, config, columns):
+        """Rollups of a finished run rebuilt from its per-step log (column name -> array)"""
+        if config.get("LOG_FREQUENCY", True):
+            raise ValueError("Rollups are rebuilt from a per-step log (LOG_FREQUENCY false)")
+        rollups = cls(config)
+        series = {name: np.asarray(columns[column], dtype=np.float64) for name, column in LOG_SERIES.items()}
+        rollups.add(series, columns["Inverter status"])
+        return rollups
+
+    def add(self, series, inverter_down):
+        """Fold the next block of ticks in (series name -> array, as RunStatistics tracks them)"""
+        n_ticks = len(series["soc"])
+        if n_ticks == 0:
+            return
+        first_steps = np.arange(self.ticks, self.ticks + n_ticks, dtype=np.int64)
+        soc = np.asarray(series["soc"], dtype=np.float64)
+        rows = {name: np.asarray(series[key], dtype=np.float64) for key, name in SERIES_COLUMNS.items()}
+        rows.update({
+            "First step": first_steps,
+            "Steps": np.ones(n_ticks, dtype=np.int64),
+            "Battery state of charge (sum)": soc,
+            "Battery state of charge (min)": soc,
+            "Battery state of charge (max)": soc,
+            "Battery state of charge (end)": soc,
+            "Unmet load (count)": (np.asarray(series["unmet"]) > 0).astype(np.int64),
+            "Inverter down (count)": np.asarray(inverter_down, dtype=np.int64),
+        })
+        self.ticks += n_ticks
+
+        added = {}
+        for level, finer in LEVELS.items():
+            if finer is not None:
+                rows = added[finer]
+            added[level], ids = combine(rows, period_ids(level, rows["First step"], self.config))
+            self.levels[level].add(added[level], ids)
+
+    def rows(self, level):
+        return self.levels[level].rows()
+
+    def save(self, directory=ROLLUP_STORE_PATH):
+        """Write every level as a column store in its own subdirectory"""
+        if directory.exists():
+            shutil.rmtree(directory)
+        for level in LEVELS:
+            save_column_store(self.rows(level), directory.joinpath(level),
+                              {"config": self.config, "level": level}, ROLLUP_COLUMNS)
+
+    def snapshot(self):
+        return {"ticks": self.ticks, "levels": {level: rows.snapshot() for level, rows in self.levels.items()}}
+
+    def restore(self, state):
+        self.ticks = state["ticks"]
+        for level, rows in self.levels.items():
+            rows.restore(state["levels"][level])
+
+
+def exists(directory=ROLLUP_STORE_PATH):
+    return all(ColumnStore.exists(directory.joinpath(level)) for level in LEVELS)
+
+def open_level(level, directory=ROLLUP_STORE_PATH):
+    return ColumnStore(directory.joinpath(level))
+
+def finest_level(max_rows, directory=ROLLUP_STORE_PATH):
+    """The finest saved level with at most max_rows rows (the year level if none is that short)"""
+    for level in LEVELS:
+        if len(open_level(level, directory)) <= max_rows:
+            return level
+    return level
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show the hour/day/week/month/year rollups of the last run.")
+    parser.add_argument("level", nargs="?", choices=list(LEVELS), default="month", help="Level to print")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild the rollups from the per-step log in log_store first")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.rebuild:
+        if not ColumnStore.exists(LOG_STORE_PATH):
+            print(f"Error: no log in {LOG_STORE_PATH}.")
+            exit(1)
+        store = ColumnStore(LOG_STORE_PATH)
+        try:
+            Rollups.from_log(store.metadata.get("config", {}), store.read_columns()).save()
+        except ValueError as error:
+            print(f"Error: {error}.")
+            exit(1)
+        print(f"Rollups saved to: {ROLLUP_STORE_PATH}")
+    if not exists():
+        print("Error: no rollups found. Please run the simulation first (main.py).")
+        exit(1)
+    print(open_level(args.level).to_dataframe().to_string(index=False))
@@ -0,0 +1,191 @@
+# run_stats.py
+import numpy as np
+from rollups import Rollups
+
+# Per-tick series tracked by RunStatistics, in update() argument order
+TRACKED_SERIES = ["soc", "solar", "load", "grid_import", "grid_export", "unmet", "revenue", "cost"]
+
+class RunningStats:
+    """Count, sum, min, max and Welford mean/variance of one series"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add_block(self, values):
+        """Fold a block of values in (Chan et al. parallel form of Welford's update)"""
+        n = len(values)
+        if n == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        block_mean = values.mean()
+        block_m2 = ((values - block_mean) ** 2).sum()
+        count = self.count + n
+        delta = block_mean - self.mean
+        self.mean += delta * n / count
+        self._m2 += block_m2 + delta ** 2 * self.count * n / count
+        self.count = count
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def snapshot(self):
+        return {"count": int(self.count), "total": float(self.total), "min": float(self.min), "max": float(self.max),
+                "mean": float(self.mean), "m2": float(self._m2)}
+
+    def restore(self, state):
+        self.count = state["count"]
+        self.total = state["total"]
+        self.min = state["min"]
+        self.max = state["max"]
+        self.mean = state["mean"]
+        self._m2 = state["m2"]
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {
+            "mean": float(self.mean),
+            "variance": float(self.variance),
+            "std": float(np.sqrt(self.variance)),
+            "min": float(self.min) if self.count else 0.0,
+            "max": float(self.max) if self.count else 0.0,
+            "sum": float(self.total),
+        }
+
+
+class RunStatistics:
+    """Online summary of a run, updated by the dispatch loop every tick
+
+    Ticks are gathered into small blocks and folded into the running
+    statistics block by block, so memory stays constant for any run length
+    and the per-tick cost is a handful of list appends. Given Rollups, every
+    block is also folded into its hour/day/week/month/year totals.
+    """
+    def __init__(self, step_hours=1, block_size=4096, rollups=None):
+        self.step_hours = step_hours
+        self.rollups = rollups
+        self._block_size = block_size
+        self._series = {name: RunningStats() for name in TRACKED_SERIES}
+        self._pending = [[] for _ in TRACKED_SERIES]
+        self._pending_down = []
+        self.ticks = 0
+        self.unmet_events = 0
+        self.inverter_down_ticks = 0
+
+    @classmethod
+    def from_config(cls, config, rollups=False):
+        return cls(step_hours=config["TIME_STEP_MIN"] / 60, rollups=Rollups(config) if rollups else None)
+
+    def update(self, soc, solar, load, grid_import, grid_export, unmet, revenue, cost, inverter_down):
+        """Record one tick"""
+        pending = self._pending
+        pending[0].append(soc)
+        pending[1].append(solar)
+        pending[2].append(load)
+        pending[3].append(grid_import)
+        pending[4].append(grid_export)
+        pending[5].append(unmet)
+        pending[6].append(revenue)
+        pending[7].append(cost)
+        self._pending_down.append(inverter_down)
+        self.ticks += 1
+        if unmet > 0:
+            self.unmet_events += 1
+        if inverter_down:
+            self.inverter_down_ticks += 1
+        if len(pending[0]) >= self._block_size:
+            self._fold()
+
+    def update_many(self, series, inverter_down):
+        """Record many ticks at once (e.g. from the vectorized engine)"""
+        n_ticks = len(series["soc"])
+        if len(self._pending[0]) + n_ticks < self._block_size:
+            # A short span joins the pending block like that many update() calls
+            for name, values in zip(TRACKED_SERIES, self._pending):
+                values.extend(np.asarray(series[name], dtype=np.float64).tolist())
+            self._pending_down.extend(np.asarray(inverter_down, dtype=bool).tolist())
+        else:
+            self._fold()
+            for name in TRACKED_SERIES:
+                self._series[name].add_block(series[name])
+            if self.rollups is not None:
+                self.rollups.add(series, inverter_down)
+        self.ticks += n_ticks
+        self.unmet_events += int(np.count_nonzero(np.asarray(series["unmet"]) > 0))
+        self.inverter_down_ticks += int(np.count_nonzero(inverter_down))
+
+    def snapshot(self):
+        """Everything recorded so far, pending ticks included, as plain values"""
+        return {
+            "series": {name: stats.snapshot() for name, stats in self._series.items()},
+            "pending": [[float(value) for value in values] for values in self._pending],
+            "pending_down": [bool(down) for down in self._pending_down],
+            "rollups": self.rollups.snapshot() if self.rollups is not None else None,
+            "ticks": self.ticks,
+            "unmet_events": self.unmet_events,
+            "inverter_down_ticks": self.inverter_down_ticks,
+        }
+
+    def restore(self, state):
+        for name, stats in self._series.items():
+            stats.restore(state["series"][name])
+        self._pending = [list(values) for values in state["pending"]]
+        self._pending_down = list(state["pending_down"])
+        if self.rollups is not None and state["rollups"] is not None:
+            self.rollups.restore(state["rollups"])
+        self.ticks = state["ticks"]
+        self.unmet_events = state["unmet_events"]
+        self.inverter_down_ticks = state["inverter_down_ticks"]
+
+    def _fold(self):
+        if self.rollups is not None:
+            self.rollups.add(dict(zip(TRACKED_SERIES, self._pending)), self._pending_down)
+        for name, values in zip(TRACKED_SERIES, self._pending):
+            self._series[name].add_block(values)
+            values.clear()
+        self._pending_down.clear()
+
+    def summary(self):
+        """Summary in the log_summary.json layout, plus per-series statistics"""
+        self._fold()
+        s = self._series
+        soc = s["soc"].to_dict()
+        total_hours = self.ticks * self.step_hours
+        return {
+            "total_hours": total_hours,
+            "ticks": self.ticks,
+            "simulation_days": int(total_hours // 24) if total_hours > 24 else 1,
+            "battery": {
+                "avg_soc": soc["mean"],
+                "min_soc": soc["min"],
+                "max_soc": soc["max"]
+            },
+            "energy": {
+                "total_solar": float(s["solar"].total),
+                "total_load": float(s["load"].total),
+                "total_grid_import": float(s["grid_import"].total),
+                "total_grid_export": float(s["grid_export"].total),
+                "net_grid_import": float(s["grid_import"].total - s["grid_export"].total),
+                "total_unmet": float(s["unmet"].total),
+                # Energy in minus energy out of the house: what the battery absorbed, losses included
+                "battery_balance": float(
+                    s["solar"].total + s["grid_import"].total - s["grid_export"].total
+                    - (s["load"].total - s["unmet"].total)
+                )
+            },
+            "financial": {
+                "total_revenue": float(s["revenue"].total),
+                "total_cost": float(s["cost"].total),
+                "net_profit": float(s["revenue"].total - s["cost"].total)
+            },
+            "unmet_load_count": self.unmet_events,
+            "inverter_down_ticks": self.inverter_down_ticks,
+            "statistics": {name: stats.to_dict() for name, stats in s.items()}
+        }
+
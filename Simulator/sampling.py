@@ -0,0 +1,43 @@
+# sampling.py
+import numpy as np
+
+
+class AntitheticGenerator:
+    """Wraps a NumPy Generator and mirrors its uniform, normal and permutation draws (u -> 1 - u)
+
+    Seeded like the run it pairs with, it covers every draw the vectorized
+    engine makes, so the pair sees mirrored weather, load and outages and
+    much of their noise cancels in the pair's mean.
+    """
+    def __init__(self, rng):
+        self._rng = rng
+
+    def random(self, size=None):
+        return 1.0 - self._rng.random(size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return np.add(low, high) - self._rng.uniform(low, high, size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return 2 * np.asarray(loc) - self._rng.normal(loc, scale, size)
+
+    def permutation(self, n):
+        return n - 1 - self._rng.permutation(n)
+
+    def spawn(self, n_children):
+        return [AntitheticGenerator(child) for child in self._rng.spawn(n_children)]
+
+
+def stratified_uniforms(groups, rng):
+    """One uniform per element, stratified within each group of equal labels
+
+    The m elements of a group get one draw from each of the m equal slices
+    of [0, 1), in random order, so category frequencies within a group match
+    their probabilities up to one element instead of varying binomially.
+    """
+    u = np.empty(len(groups))
+    for label in np.unique(groups):
+        members = np.flatnonzero(groups == label)
+        m = len(members)
+        u[members] = (rng.permutation(m) + rng.random(m)) / m
+    return u
@@ -0,0 +1,113 @@
+# sharding.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vectorized
+from traces import TRACE_COLUMNS, Trace
+from utils import steps_per_day
+
+# Flows dispatch() returns for every tick
+FLOW_NAMES = ("soc", "grid_import", "grid_export", "unmet")
+
+
+def shard_days(config, days_per_shard):
+    """(first day, days) of each shard of the run, in order"""
+    n_days = config["SIM_DURATION_DAY"]
+    return [(start, min(days_per_shard, n_days - start)) for start in range(0, n_days, days_per_shard)]
+
+
+def run_shard(config, priority, first_day, n_days, rng, trace_dir=None, soc=100.0):
+    """Inputs and flows of one shard, dispatched from a guessed starting state of charge
+
+    The shard's inputs are drawn by its own generator, as a run of n_days
+    starting first_day into the run, or sliced from the trace in trace_dir.
+    """
+    if trace_dir is not None:
+        steps = steps_per_day(config["TIME_STEP_MIN"])
+        trace = Trace(trace_dir)
+        ticks = slice(first_day * steps, (first_day + n_days) * steps)
+        inputs = {
+            "cloud_base": np.array(trace.cloud_base[first_day:first_day + n_days]),
+            "solar": np.array(trace.solar[ticks]),
+            "load": np.array(trace.load[ticks]),
+            "inverter_down": np.array(trace.inverter_down[ticks]),
+        }
+    else:
+        shard_config = dict(config, SIM_START_DAY=config["SIM_START_DAY"] + first_day, SIM_DURATION_DAY=n_days)
+        inputs = vectorized.draw_inputs(shard_config, rng)
+    return inputs, vectorized.dispatch(priority, inputs["solar"], inputs["load"], config, soc)
+
+
+def redispatch(priority, solar, load, config, soc, old_soc, window):
+    """Dispatch from soc until the state of charge meets old_soc again; return the new flows up to there
+
+    The state of charge is the only state carried from one tick to the next,
+    so from the first tick where it matches the old run the rest of the old
+    run is exact. The inputs are dispatched window ticks at a time, doubling
+    the window, so a shard that meets its old run within a day costs a day.
+    """
+    parts = []
+    start = 0
+    n_ticks = len(solar)
+    while start < n_ticks:
+        end = min(n_ticks, start + window)
+        flows = vectorized.dispatch(priority, solar[start:end], load[start:end], config, soc)
+        matches = np.flatnonzero(flows["soc"] == old_soc[start:end])
+        if len(matches):
+            parts.append({name: values[:matches[0] + 1] for name, values in flows.items()})
+            break
+        parts.append(flows)
+        soc = flows["soc"][-1]
+        start = end
+        window *= 2
+    return {name: np.concatenate([part[name] for part in parts]) for name in FLOW_NAMES}
+
+
+def reconcile(priority, inputs, flows, bounds, config, soc=100.0):
+    """Stitch shard flows into the sequential run's flows, in place; return the ticks that were re-run
+
+    Every shard (start, end tick) was dispatched from soc. Walking the shards
+    in order, each one whose predecessor (already corrected) ended on another
+    state of charge is re-run from there until it meets its first run.
+    """
+    window = steps_per_day(config["TIME_STEP_MIN"])
+    rerun = 0
+    for start, end in bounds[1:]:
+        expected = flows["soc"][start - 1]
+        if expected == soc:
+            continue
+        new = redispatch(priority, inputs["solar"][start:end], inputs["load"][start:end], config, expected,
+                         flows["soc"][start:end], window)
+        for name, values in new.items():
+            flows[name][start:start + len(values)] = values
+        rerun += len(new["soc"])
+    return rerun
+
+
+def run(config, priority, rng, days_per_shard, trace=None, workers=None):
+    """Inputs and flows of the whole run, dispatched shard by shard in parallel worker processes
+
+    Every shard is dispatched from the run's initial state of charge and then
+    reconciled, so the flows are the ones a sequential dispatch of the same
+    inputs gives, bit for bit. Without a trace each shard draws its own inputs
+    from a generator spawned from rng; the result then depends on the shard
+    length but not on the number of workers.
+    """
+    shards = shard_days(config, days_per_shard)
+    rngs = rng.spawn(len(shards))
+    trace_dir = trace.directory if trace is not None else None
+    workers = min(len(shards), workers or os.cpu_count() or 1)
+    jobs = [(config, priority, first_day, n_days, shard_rng, trace_dir)
+            for (first_day, n_days), shard_rng in zip(shards, rngs)]
+    if workers == 1:
+        results = [run_shard(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_shard, *zip(*jobs)))
+
+    inputs = {name: np.concatenate([shard_inputs[name] for shard_inputs, _ in results]) for name in TRACE_COLUMNS}
+    flows = {name: np.concatenate([shard_flows[name] for _, shard_flows in results]) for name in FLOW_NAMES}
+    steps = steps_per_day(config["TIME_STEP_MIN"])
+    bounds = [(first_day * steps, (first_day + n_days) * steps) for first_day, n_days in shards]
+    rerun = reconcile(priority, inputs, flows, bounds, config)
+    return inputs, flows, rerun
@@ -0,0 +1,479 @@
+# simulator.py
+import math
+import random
+import numpy as np
+import battery
+import grid
+import house_load
+import inverter
+import solar_panel
+import vectorized
+from log_buffer import LogBuffer
+from rollups import Rollups
+from run_stats import RunStatistics
+from strategies import STRATEGIES
+from utils import (
+    hour_of_day,
+    day_of_year,
+    days_elapsed,
+    steps_per_day,
+    MINUTES_PER_DAY,
+    season_from_day,
+    daily_cloud_coverage,
+    SEASON_CLOUD_PROBS,
+)
+
+# Shorter dark spans run step by step: a batch has a fixed cost of about 20 steps
+MIN_SPAN_STEPS = 16
+
+# Simulator attributes saved by snapshot(), next to the clock, components, generators and statistics
+STATE_FIELDS = [
+    "tick", "current_day", "current_season", "daily_cloud_base",
+    "daily_solar", "daily_import", "daily_export", "daily_cost", "daily_unmet", "daily_revenue", "daily_load",
+]
+
+def resolve_random_values(config, rng=random):
+    """Return a copy of the config with values left to chance ("random") drawn from rng"""
+    config = dict(config)
+    if config.get("INVERTER_FAILURE_DURATION") == "random":
+        config["INVERTER_FAILURE_DURATION"] = rng.randint(4, 72)
+    return config
+
+def write_to_df(log, battery, solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                revenue_energy_exported, cost_energy_imported, daily_solar,
+                daily_revenue, daily_import, daily_export, daily_cost,
+                daily_unmet, daily_load, inverter_status):
+    """Write one row into the log buffer"""
+    unmet_bool = True if unmet > 0 else False
+    log.append((
+        battery.soc, solar_kwh, load_kwh,
+        grid_import, grid_export, unmet_bool,
+        revenue_energy_exported, cost_energy_imported,
+        daily_solar, daily_revenue, daily_import,
+        daily_export, daily_cost, daily_unmet,
+        daily_load, inverter_status
+    ))
+
+
+class Clock:
+    """Simulation time in minutes; all the components read from a SimPy environment is now"""
+    __slots__ = ("now",)
+
+    def __init__(self, now=0):
+        self.now = now
+
+
+class Simulator:
+    """One home, advanced a time step at a time by step() or run(), without SimPy or input()
+
+    The components and the strategy's dispatch kernel are the ones the SimPy
+    engine runs. step() can take measured telemetry in place of any modelled
+    input (solar_kw, load_kw, inverter_down), e.g. to drive the battery and
+    grid model from a live system. Rows go to log and every step is folded
+    into stats when they are given; a TraceRecorder collects the inputs used,
+    and a Trace replays recorded inputs instead of drawing them.
+
+    With EVENT_DRIVEN set in the config, inverter failures are drawn as
+    times to the next failure, and advance() runs each dark span (no sun:
+    after 18:00 or before 06:00) of MIN_SPAN_STEPS or more as one batch
+    instead of step by step. Calling step() where advance() would start a
+    span changes the run's random draws from there on.
+    """
+    def __init__(self, config, priority=0, rng=None, log=None, stats=None, recorder=None, trace=None):
+        if MINUTES_PER_DAY % config["TIME_STEP_MIN"]:
+            raise ValueError(f"TIME_STEP_MIN ({config['TIME_STEP_MIN']}) must divide a day evenly")
+        self.rng = rng if rng is not None else random
+        self.config = config = resolve_random_values(config, self.rng)
+        self.priority = priority
+        self.log = log
+        self.stats = stats
+        self.recorder = recorder
+        self.trace = trace
+
+        self.step_min = config["TIME_STEP_MIN"]
+        # Components return power (kW); each step delivers it for step_hours
+        self.step_hours = step_hours = self.step_min / 60
+        self.steps_per_day = steps_per_day(self.step_min)
+        self.total_steps = config["SIM_DURATION_DAY"] * self.steps_per_day
+        self.clock = Clock()
+        self.tick = 0
+        # Replayed inputs are already cheap, so a trace always runs step by step
+        self.event_driven = bool(config.get("EVENT_DRIVEN", False)) and trace is None
+        if self.event_driven:
+            # Dark spans draw their load noise and appliance starts in bulk
+            self._span_rng = np.random.default_rng(self.rng.getrandbits(64))
+            # Steps from midnight before the first one with sun (06:00 and later)
+            self._dawn_step = math.ceil(6 * 60 / self.step_min)
+
+        # INITIALIZING INSTANCES
+        self.battery = battery.Battery(
+            size_kwh=config["BATTERY_SIZE"],
+            efficiency=config["BATTERY_ROUND_TRIP_EFFICIENCY"]
+        )
+        self.panel = solar_panel.SolarPanel(
+            capacity=config["PEAK_SOLAR_GENERATION"],
+            rng=self.rng
+        )
+        self.load = house_load.HouseLoad(
+            base_load=config["ENERGY_BASE_LOAD"],
+            spikes_max=config["RANDOM_SPIKES_MAX"],
+            rng=self.rng,
+            step_hours=step_hours
+        )
+        self.inverter = inverter.Inverter(
+            output_limit=config["INVERTER_MAX_OUTPUT_LIMIT"],
+            failure_freq=config["INVERTER_FAILURE_FREQUENCY"],
+            failure_duration=config["INVERTER_FAILURE_DURATION"],
+            rng=self.rng,
+            step_hours=step_hours,
+            event_driven=self.event_driven
+        )
+        self.grid = grid.Grid(
+            grid_max_export_limit=config["GRID_MAX_EXPORT_LIMIT"],
+            is_zero_export=config["IS_ZERO_EXPORT"],
+            grid_max_import_limit=config["GRID_MAX_IMPORT_LIMIT"],
+            step_hours=step_hours
+        )
+        # The strategy's dispatch kernel, run on this home's Battery and Grid
+        self._dispatch = STRATEGIES[priority].step
+
+        if trace is not None:
+            # Plain Python values are much cheaper to index per step than memory-mapped arrays
+            self._trace_cloud_base = trace.cloud_base.tolist()
+            self._trace_solar = trace.solar.tolist()
+            self._trace_load = trace.load.tolist()
+            self._trace_inverter_down = trace.inverter_down.tolist()
+
+        self.current_day = -1
+        self.current_season = None
+        self.daily_cloud_base = 0.0
+        # Running totals written to the log; reset after each row of a daily log
+        self.daily_solar = 0.0
+        self.daily_import = 0.0
+        self.daily_export = 0.0
+        self.daily_cost = 0.0
+        self.daily_unmet = 0.0
+        self.daily_revenue = 0.0
+        self.daily_load = 0.0
+
+    def step(self, inputs=None):
+        """Advance one time step; inputs may hold measured solar_kw, load_kw and inverter_down
+
+        Returns the step's energy flows (kWh), battery state of charge,
+        revenue and cost.
+        """
+        config = self.config
+        clock = self.clock
+        start_day = config["SIM_START_DAY"]
+        hour = hour_of_day(clock)
+        day = day_of_year(clock, start_day)
+        # Calculate day of week (0=Monday, 6=Sunday)
+        # Assuming day 0 is Jan 1st, 2024 (which was a Monday)
+        day_of_week = days_elapsed(clock, start_day) % 7
+
+        if day != self.current_day:
+            self._start_day(day)
+
+        step_hours = self.step_hours
+        if self.trace is not None:
+            k = self.tick
+            inverter_down = self._trace_inverter_down[k]
+            solar_kwh = self._trace_solar[k]
+            load_kwh = self._trace_load[k]
+        elif inputs is None:
+            inverter_down = self.inverter.is_down(clock)
+            # Pass daily_cloud_base for hourly cloud variation
+            solar_kw = self.panel.generate(hour, self.daily_cloud_base, config["INVERTER_MAX_OUTPUT_LIMIT"],
+                                           inverter_down)
+            # Pass day_of_week and season to demand
+            load_kw = self.load.demand(hour, day_of_week, self.current_season)
+            solar_kwh = solar_kw * step_hours
+            load_kwh = load_kw * step_hours
+        else:
+            # Measured values replace the models; anything not measured is still modelled
+            inverter_down = inputs.get("inverter_down")
+            if inverter_down is None:
+                inverter_down = self.inverter.is_down(clock)
+            solar_kw = inputs.get("solar_kw")
+            if solar_kw is None:
+                solar_kw = self.panel.generate(hour, self.daily_cloud_base, config["INVERTER_MAX_OUTPUT_LIMIT"],
+                                               inverter_down)
+            load_kw = inputs.get("load_kw")
+            if load_kw is None:
+                load_kw = self.load.demand(hour, day_of_week, self.current_season)
+            solar_kwh = solar_kw * step_hours
+            load_kwh = load_kw * step_hours
+        if self.recorder is not None:
+            self.recorder.record(solar_kwh, load_kwh, inverter_down)
+
+        grid_import, grid_export, unmet = self._dispatch(solar_kwh, load_kwh, self.battery, self.grid)
+
+        revenue_energy_exported = grid_export * config["COST_ENERGY_EXPORTED"]
+        cost_energy_imported = grid_import * config["COST_ENERGY_IMPORTED"]
+        total_revenue = revenue_energy_exported - cost_energy_imported
+        soc = self.battery.soc
+
+        if self.stats is not None:
+            self.stats.update(soc, solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                              revenue_energy_exported, cost_energy_imported, inverter_down)
+
+        if self.log is not None:
+            self.daily_solar += solar_kwh
+            self.daily_import += grid_import
+            self.daily_export += grid_export
+            self.daily_revenue += total_revenue
+            self.daily_cost += cost_energy_imported
+            self.daily_unmet += 1 if unmet > 0 else 0
+            self.daily_load += load_kwh
+
+            log_freq = config["LOG_FREQUENCY"]
+            if not log_freq:
+                self._write_row(solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                                revenue_energy_exported, cost_energy_imported, inverter_down)
+            elif self.tick % self.steps_per_day == self.steps_per_day - 1:
+                self._write_row(solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                                revenue_energy_exported, cost_energy_imported, inverter_down)
+                # Reset accumulators after logging daily values
+                self.daily_solar = 0.0
+                self.daily_import = 0.0
+                self.daily_export = 0.0
+                self.daily_cost = 0.0
+                self.daily_revenue = 0.0
+                self.daily_unmet = 0.0
+                self.daily_load = 0.0
+
+        self.tick += 1
+        clock.now += self.step_min
+        return {
+            "soc": soc,
+            "solar": solar_kwh,
+            "load": load_kwh,
+            "grid_import": grid_import,
+            "grid_export": grid_export,
+            "unmet": unmet,
+            "revenue": revenue_energy_exported,
+            "cost": cost_energy_imported,
+            "inverter_down": inverter_down,
+        }
+
+    def _start_day(self, day):
+        """First step of a day: new season and daily cloud base"""
+        self.current_day = day
+        self.current_season = season_from_day(day)
+        if self.trace is not None:
+            self.daily_cloud_base = self._trace_cloud_base[self.tick // self.steps_per_day]
+        else:
+            self.daily_cloud_base = daily_cloud_coverage(SEASON_CLOUD_PROBS[self.current_season], self.rng)
+        if self.recorder is not None:
+            self.recorder.record_day(self.daily_cloud_base)
+
+    def dark_steps(self):
+        """Steps from here to the end of the current dark span (0 if the sun may be up)
+
+        Dark spans stop at midnight (the day, weekday and season change) and
+        at the end of the run.
+        """
+        j = self.tick % self.steps_per_day
+        hour = j * self.step_min / 60
+        if hour < 6:
+            n_steps = self._dawn_step - j
+        elif hour > 18:
+            n_steps = self.steps_per_day - j
+        else:
+            return 0
+        if self.tick < self.total_steps:
+            n_steps = min(n_steps, self.total_steps - self.tick)
+        return n_steps
+
+    def advance(self):
+        """Run the next step, or in event-driven mode the whole dark span starting here; returns the steps run"""
+        if self.event_driven:
+            n_steps = self.dark_steps()
+            if n_steps >= MIN_SPAN_STEPS:
+                self.step_span(n_steps)
+                return n_steps
+        self.step()
+        return 1
+
+    def step_span(self, n_steps):
+        """Run n_steps dark steps at once: no solar, batch-drawn load and outages, one dispatch call
+
+        The result is distributed exactly like n_steps calls of step();
+        only the random draws differ.
+        """
+        config = self.config
+        clock = self.clock
+        start_day = config["SIM_START_DAY"]
+        day = day_of_year(clock, start_day)
+        day_of_week = days_elapsed(clock, start_day) % 7
+        if day != self.current_day:
+            self._start_day(day)
+
+        step_hours = self.step_hours
+        times = clock.now + np.arange(n_steps, dtype=np.int64) * self.step_min
+        hours = (times / 60) % 24
+        inverter_down = self.inverter.down_span(times)
+        load_kwh = self.load.demand_span(hours, day_of_week, self.current_season, self._span_rng) * step_hours
+        solar_kwh = np.zeros(n_steps)
+        if self.recorder is not None:
+            self.recorder.record_span(solar_kwh, load_kwh, inverter_down)
+
+        flows = vectorized.dispatch(self.priority, solar_kwh, load_kwh, config, self.battery.soc, self.battery.floor)
+        self.battery.soc = float(flows["soc"][-1])
+        grid_import = flows["grid_import"]
+        grid_export = flows["grid_export"]
+        unmet = flows["unmet"]
+        revenue = grid_export * config["COST_ENERGY_EXPORTED"]
+        cost = grid_import * config["COST_ENERGY_IMPORTED"]
+
+        if self.stats is not None:
+            self.stats.update_many({
+                "soc": flows["soc"],
+                "solar": solar_kwh,
+                "load": load_kwh,
+                "grid_import": grid_import,
+                "grid_export": grid_export,
+                "unmet": unmet,
+                "revenue": revenue,
+                "cost": cost,
+            }, inverter_down)
+
+        if self.log is not None:
+            self._log_span(flows["soc"], solar_kwh, load_kwh, grid_import, grid_export, unmet, revenue, cost,
+                           inverter_down)
+
+        self.tick += n_steps
+        clock.now += n_steps * self.step_min
+
+    def _log_span(self, soc, solar_kwh, load_kwh, grid_import, grid_export, unmet, revenue, cost, inverter_down):
+        """The log rows (or daily totals) of a span, as step() would have written them"""
+        accumulated = {
+            "daily_solar": solar_kwh,
+            "daily_import": grid_import,
+            "daily_export": grid_export,
+            "daily_revenue": revenue - cost,
+            "daily_cost": cost,
+            "daily_unmet": (unmet > 0).astype(np.float64),
+            "daily_load": load_kwh,
+        }
+        if not self.config["LOG_FREQUENCY"]:
+            # Every row carries the running totals up to its step
+            running = {name: getattr(self, name) + np.cumsum(values) for name, values in accumulated.items()}
+            self.log.append_columns({
+                "Battery state of charge": soc,
+                "Solar generation": solar_kwh,
+                "Load demand": load_kwh,
+                "Grid import": grid_import,
+                "Grid export": grid_export,
+                "Unmet load": unmet > 0,
+                "Revenue from exported energy": revenue,
+                "Cost of imported energy": cost,
+                "Daily solar generation": running["daily_solar"],
+                "Daily revenue": running["daily_revenue"],
+                "Daily import": running["daily_import"],
+                "Daily export": running["daily_export"],
+                "Daily cost": running["daily_cost"],
+                "Daily unmet load (count)": running["daily_unmet"],
+                "Daily load": running["daily_load"],
+                "Inverter status": inverter_down,
+            })
+            for name, values in running.items():
+                setattr(self, name, float(values[-1]))
+            return
+
+        for name, values in accumulated.items():
+            setattr(self, name, getattr(self, name) + float(values.sum()))
+        last = len(soc) - 1
+        if (self.tick + last) % self.steps_per_day == self.steps_per_day - 1:
+            write_to_df(self.log, self.battery, float(solar_kwh[last]), float(load_kwh[last]),
+                        float(grid_import[last]), float(grid_export[last]), float(unmet[last]),
+                        float(revenue[last]), float(cost[last]), self.daily_solar,
+                        self.daily_revenue, self.daily_import, self.daily_export, self.daily_cost,
+                        self.daily_unmet, self.daily_load, bool(inverter_down[last]))
+            # Reset accumulators after logging daily values
+            self.daily_solar = 0.0
+            self.daily_import = 0.0
+            self.daily_export = 0.0
+            self.daily_cost = 0.0
+            self.daily_revenue = 0.0
+            self.daily_unmet = 0.0
+            self.daily_load = 0.0
+
+    def _write_row(self, solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                   revenue_energy_exported, cost_energy_imported, inverter_down):
+        write_to_df(self.log, self.battery, solar_kwh, load_kwh, grid_import, grid_export, unmet,
+                    revenue_energy_exported, cost_energy_imported, self.daily_solar,
+                    self.daily_revenue, self.daily_import, self.daily_export, self.daily_cost,
+                    self.daily_unmet, self.daily_load, inverter_down)
+
+    def run(self, n_steps=None):
+        """Run n_steps steps (default: the rest of SIM_DURATION_DAY) and return the log
+
+        In event-driven mode a dark span's draws depend on its length, so a
+        span is never cut: one that starts within the n_steps is run to its
+        end, and run(k) followed by run() gives the same run as run() alone.
+        """
+        if n_steps is None:
+            n_steps = self.total_steps - self.tick
+        end = self.tick + n_steps
+        advance = self.advance
+        while self.tick < end:
+            advance()
+        return self.log
+
+    def snapshot(self):
+        """The state of the run between two steps, as plain (JSON-serializable) values
+
+        Covers the clock, the day's season and cloud base, the daily
+        accumulators, every component, the random generators and the
+        statistics. Log rows belong to the log sink and are not included;
+        log_rows records how many there were.
+        """
+        state = {name: getattr(self, name) for name in STATE_FIELDS}
+        state["now"] = self.clock.now
+        state["rng"] = self.rng.getstate()
+        state["span_rng"] = self._span_rng.bit_generator.state if self.event_driven else None
+        state["battery"] = self.battery.snapshot()
+        state["panel"] = self.panel.snapshot()
+        state["load"] = self.load.snapshot()
+        state["inverter"] = self.inverter.snapshot()
+        state["stats"] = self.stats.snapshot() if self.stats is not None else None
+        state["log_rows"] = len(self.log) if self.log is not None else 0
+        return state
+
+    def restore(self, state):
+        """Continue from a snapshot() of a run with the same config; the log is left as it is"""
+        for name in STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.clock.now = state["now"]
+        # JSON turns the generator's state tuple into lists
+        version, internal_state, gauss_next = state["rng"]
+        self.rng.setstate((version, tuple(internal_state), gauss_next))
+        if self.event_driven:
+            self._span_rng.bit_generator.state = state["span_rng"]
+        self.battery.restore(state["battery"])
+        self.panel.restore(state["panel"])
+        self.load.restore(state["load"])
+        self.inverter.restore(state["inverter"])
+        if self.stats is not None and state["stats"] is not None:
+            self.stats.restore(state["stats"])
+
+    def fork(self, priority=None, log=None, stats=None):
+        """An independent copy of the run from this step on, optionally with another strategy
+
+        The fork continues from the same state and random streams, so it sees
+        the same weather, load and outages as this run would (event-driven
+        runs included, as run() only stops between dark spans). It starts with
+        a copy of this run's statistics and, for a LogBuffer, of its rows;
+        any other log given only receives the rows after the fork.
+        """
+        state = self.snapshot()
+        if log is None and isinstance(self.log, LogBuffer):
+            log = self.log.copy()
+        if stats is None and self.stats is not None:
+            rollups = Rollups(self.config) if self.stats.rollups is not None else None
+            stats = RunStatistics(self.stats.step_hours, rollups=rollups)
+        forked = Simulator(self.config, self.priority if priority is None else priority, random.Random(),
+                           log, stats, trace=self.trace)
+        forked.restore(state)
+        return forked
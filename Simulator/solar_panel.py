@@ -3,26 +3,44 @@ import math
 import random
 
 class SolarPanel:
-    def __init__(self, capacity):
+    def __init__(self, capacity, rng=None):
         self._capacity = capacity
+        self._rng = rng if rng is not None else random
         self._generation = 0.0
-        self._hourly_cloud = 0.0
+        self._hourly_cloud = None
+        self._clock_hour = None
 
     def generate(self, hour, daily_cloud_base, inverter_limit, inverter_down):
+        # Sub-hourly steps share their clock hour's cloud cover
+        if int(hour) != self._clock_hour:
+            self._clock_hour = int(hour)
+            self._hourly_cloud = None
+
         if inverter_down or hour < 6 or hour > 18:
             self._generation = 0.0
             return 0.0
         
-        # Hourly cloud variation
-        cloud_variation = random.uniform(-0.3, 0.3)
-        hourly_cloud = max(0.0, min(0.95, daily_cloud_base + cloud_variation))
-        
-        # Possibility of brief heavy cloud coverage (10% chance per hour)
-        if random.random() < 0.1:
-            hourly_cloud = min(0.95, hourly_cloud + random.uniform(0.2, 0.5))
+        if self._hourly_cloud is None:
+            # Hourly cloud variation
+            cloud_variation = self._rng.uniform(-0.3, 0.3)
+            hourly_cloud = max(0.0, min(0.95, daily_cloud_base + cloud_variation))
+            
+            # Possibility of brief heavy cloud coverage (10% chance per hour)
+            if self._rng.random() < 0.1:
+                hourly_cloud = min(0.95, hourly_cloud + self._rng.uniform(0.2, 0.5))
+            self._hourly_cloud = hourly_cloud
         
         sun_angle = (hour - 6) * (math.pi / 12)
         raw = self._capacity * math.sin(sun_angle)
         clipped = min(raw, inverter_limit)
-        self._generation = clipped * (1 - hourly_cloud)
+        self._generation = clipped * (1 - self._hourly_cloud)
         return self._generation
+
+    def snapshot(self):
+        hourly_cloud = float(self._hourly_cloud) if self._hourly_cloud is not None else None
+        return {"generation": float(self._generation), "hourly_cloud": hourly_cloud, "clock_hour": self._clock_hour}
+
+    def restore(self, state):
+        self._generation = state["generation"]
+        self._hourly_cloud = state["hourly_cloud"]
+        self._clock_hour = state["clock_hour"]
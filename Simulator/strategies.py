@@ -0,0 +1,124 @@
+# strategies.py
+import numpy as np
+import battery
+import grid
+
+# priority -> Strategy, in menu order
+STRATEGIES = {}
+
+
+class Strategy:
+    """A named dispatch kernel: step(solar, load, battery, grid) -> (grid_import, grid_export, unmet)
+
+    A kernel only talks to the battery and grid through their methods, so
+    the same code runs on one home (Battery, Grid and floats) or on a whole
+    batch (BatteryBank, CommunityGrid and arrays, one element per battery).
+    """
+    __slots__ = ("name", "step")
+
+    def __init__(self, name, step):
+        self.name = name
+        self.step = step
+
+
+def register_strategy(priority, name):
+    """Decorator adding a dispatch kernel to the strategy menu under priority"""
+    def register(step):
+        STRATEGIES[priority] = Strategy(name, step)
+        return step
+    return register
+
+
+def positive(x):
+    """max(x, 0) of a float, or elementwise of an array"""
+    if isinstance(x, np.ndarray):
+        return np.maximum(x, 0.0)
+    return x if x > 0 else 0.0
+
+
+@register_strategy(0, "LOAD_PRIORITY")
+def load_priority(solar, load, battery, grid):
+    """Power the house first, store the surplus, spill the rest to the grid"""
+    net = solar - load
+    surplus = positive(net)
+    charged = battery.charge(surplus)
+    grid_export = positive(surplus - charged)
+    if grid.is_zero_export:
+        # Nothing is exported once the battery is full
+        grid_export = grid_export * (battery.soc != 100)
+    grid_export = grid.export_surplus(grid_export)
+    shortfall = positive(-net)
+    deficit = positive(shortfall - battery.discharge(shortfall))
+    grid_import = grid.import_energy(deficit)
+    return grid_import, grid_export, deficit - grid_import
+
+
+@register_strategy(1, "CHARGE_PRIORITY")
+def charge_priority(solar, load, battery, grid):
+    """Fill the battery first, then power the house; it never discharges"""
+    net_after_battery = solar - battery.charge(solar) - load
+    grid_export = grid.export(positive(net_after_battery))
+    shortfall = positive(-net_after_battery)
+    grid_import = grid.import_energy(shortfall)
+    return grid_import, grid_export, shortfall - grid_import
+
+
+@register_strategy(2, "PRODUCE_PRIORITY")
+def produce_priority(solar, load, battery, grid):
+    """Export first, store what the grid does not take, cover the load from the battery"""
+    grid_export = grid.export(solar)
+    remainder = solar - grid_export
+    charged = battery.charge(remainder)
+    net_deficit = positive(load - (remainder - charged))
+    still_needed = net_deficit - battery.discharge(net_deficit)
+    grid_import = grid.import_energy(still_needed)
+    return grid_import, grid_export, still_needed - grid_import
+
+
+def run_series(priority, solar, load, config, soc=100.0, floor=5.0):
+    """Run one strategy tick by tick over solar/load series for a single home"""
+    step = STRATEGIES[priority].step
+    step_hours = config["TIME_STEP_MIN"] / 60
+    bat = battery.Battery(config["BATTERY_SIZE"], config["BATTERY_ROUND_TRIP_EFFICIENCY"], floor, soc)
+    grd = grid.Grid(config["GRID_MAX_EXPORT_LIMIT"], config["IS_ZERO_EXPORT"], config["GRID_MAX_IMPORT_LIMIT"],
+                    step_hours)
+    n_ticks = len(solar)
+    flows = {name: np.empty(n_ticks) for name in ("soc", "grid_import", "grid_export", "unmet")}
+    # Plain floats are much cheaper than NumPy scalars in a per-tick loop
+    for k, (solar_k, load_k) in enumerate(zip(np.asarray(solar).tolist(), np.asarray(load).tolist())):
+        grid_import, grid_export, unmet = step(solar_k, load_k, bat, grd)
+        flows["soc"][k] = bat.soc
+        flows["grid_import"][k] = grid_import
+        flows["grid_export"][k] = grid_export
+        flows["unmet"][k] = unmet
+    return flows
+
+
+def dispatch_batch(priorities, solar, load, config, soc=100.0, floor=5.0):
+    """Run several strategies over the same inputs in one pass over time
+
+    solar and load are (ticks,) or (ticks, batch) arrays; every strategy
+    gets its own bank of batteries, one per column. Returns priority ->
+    flows, each flow a (ticks, batch) array.
+    """
+    solar = np.asarray(solar, dtype=np.float64).reshape(len(solar), -1)
+    load = np.broadcast_to(np.asarray(load, dtype=np.float64).reshape(len(load), -1), solar.shape)
+    n_ticks, n_batch = solar.shape
+    step_hours = config["TIME_STEP_MIN"] / 60
+    runs = []
+    for priority in priorities:
+        bank = battery.BatteryBank(
+            np.full(n_batch, float(config["BATTERY_SIZE"])), config["BATTERY_ROUND_TRIP_EFFICIENCY"], floor, soc
+        )
+        grd = grid.CommunityGrid(
+            n_batch, config["GRID_MAX_EXPORT_LIMIT"], config["GRID_MAX_IMPORT_LIMIT"], config["IS_ZERO_EXPORT"],
+            step_hours=step_hours,
+        )
+        flows = {name: np.empty((n_ticks, n_batch)) for name in ("soc", "grid_import", "grid_export", "unmet")}
+        runs.append((priority, STRATEGIES[priority].step, bank, grd, flows))
+
+    for k in range(n_ticks):
+        for _, step, bank, grd, flows in runs:
+            flows["grid_import"][k], flows["grid_export"][k], flows["unmet"][k] = step(solar[k], load[k], bank, grd)
+            flows["soc"][k] = bank.soc
+    return {priority: flows for priority, _, _, _, flows in runs}
@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import main
+import optimal
+import vectorized
+from pathlib import Path
+from ensemble import flatten_summary, replication_seeds
+from run_stats import RunStatistics
+from traces import Trace
+
+SWEEP_RESULTS_PATH = main.BASE_DIR.joinpath("sweep_results.csv")
+
+def grid_points(grid):
+    """Every combination of a {key: [values]} grid, as a list of config overrides"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def parse_grid(specs):
+    """["BATTERY_SIZE=5,10", ...] -> {"BATTERY_SIZE": [5, 10], ...}, values read as JSON where possible"""
+    grid = {}
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        parsed = []
+        for value in values.split(","):
+            try:
+                parsed.append(json.loads(value))
+            except json.JSONDecodeError:
+                parsed.append(value)
+        grid[key.strip()] = parsed
+    return grid
+
+def trace_key(config):
+    """The settings a point's random traces depend on: points sharing them share traces"""
+    return tuple(config[key] for key in vectorized.TRACE_KEYS)
+
+def run_point(config, priority, inputs):
+    """Dispatch one configuration over already drawn inputs and return its summary metrics"""
+    flows = vectorized.dispatch(priority, inputs["solar"], inputs["load"], config)
+    stats = RunStatistics.from_config(config)
+    stats.update_many({
+        "soc": flows["soc"],
+        "solar": inputs["solar"],
+        "load": inputs["load"],
+        "grid_import": flows["grid_import"],
+        "grid_export": flows["grid_export"],
+        "unmet": flows["unmet"],
+        "revenue": flows["grid_export"] * config["COST_ENERGY_EXPORTED"],
+        "cost": flows["grid_import"] * config["COST_ENERGY_IMPORTED"],
+    }, inputs["inverter_down"])
+    summary = stats.summary()
+    del summary["statistics"]
+    return flatten_summary(summary)
+
+def run_group(config, tasks, seed, swept_keys, trace_dir=None, optimal_levels=None):
+    """Run points that share one seed and trace key: the traces are drawn once for all of them
+
+    With trace_dir, every point replays that recorded trace instead. With
+    optimal_levels, every row also gets the point's perfect-foresight
+    optimum (solved on that many state of charge levels) and the gap to it.
+    """
+    if trace_dir is not None:
+        trace = Trace(trace_dir)
+        inputs = trace.inputs()
+    else:
+        # Same generators as main.run_simulation, so a point's result matches a single vectorized run
+        resolved = main.resolve_random_values(config, random.Random(seed))
+        traces = vectorized.draw_traces(resolved, np.random.default_rng(seed))
+    rows = []
+    optima = {}
+    for point_id, overrides, priority in tasks:
+        point_config = dict(config, **overrides)
+        if trace_dir is not None:
+            point_config = trace.apply(point_config)
+            point_inputs = inputs
+        else:
+            point_config = main.resolve_random_values(point_config, random.Random(seed))
+            point_inputs = vectorized.inputs_from_traces(point_config, traces)
+        metrics = run_point(point_config, priority, point_inputs)
+        if optimal_levels is not None:
+            # Strategies of a point share its optimum, unless they follow another export rule
+            key = (point_id, optimal.follows_export_limit(priority))
+            if key not in optima:
+                optima[key] = optimal.optimal_net_profit(point_config, point_inputs, key[1],
+                                                         levels=optimal_levels)[0]
+            metrics["optimal_net_profit"] = optima[key]
+            metrics["optimality_gap"] = optima[key] - metrics["financial.net_profit"]
+        # Every swept setting's effective value, also where this point left it at the base config
+        settings = {key: point_config[key] for key in swept_keys}
+        rows.append({"point": point_id, **settings, "priority": main.PRIORITIES[priority], "seed": seed, **metrics})
+    return rows
+
+def run_sweep(config, points, priorities=(0,), n_seeds=1, seed=None, workers=None, trace_dir=None,
+              optimal_levels=None):
+    """Run every config override in points for every strategy and seed, in parallel
+
+    Points are grouped by the settings their random traces depend on, so
+    each group draws its traces once per seed and every point in it sees
+    the same weather, load and outages (common random numbers). Returns
+    one row per point, strategy and seed. With trace_dir, every point
+    replays that recorded trace (see traces.py) and there are no seeds.
+    With optimal_levels, each row gets its optimality gap (see run_group).
+    """
+    if trace_dir is not None:
+        # Points may only change what the recorded inputs do not depend on
+        trace = Trace(trace_dir)
+        for overrides in points:
+            trace.apply(dict(config, **overrides))
+        seeds = [None]
+    else:
+        seeds = replication_seeds(seed, n_seeds)
+    workers = workers or os.cpu_count()
+    swept_keys = list(dict.fromkeys(key for overrides in points for key in overrides))
+    groups = {}
+    for point_id, overrides in enumerate(points):
+        key = trace_key(dict(config, **overrides))
+        for priority in priorities:
+            groups.setdefault(key, []).append((point_id, overrides, priority))
+
+    # Split large groups so every worker has something to do; each part redraws the same traces
+    n_parts = max(1, workers // (len(groups) * len(seeds)))
+    jobs = []
+    for tasks in groups.values():
+        group_config = dict(config, **tasks[0][1])
+        for part in np.array_split(np.arange(len(tasks)), min(n_parts, len(tasks))):
+            for run_seed in seeds:
+                jobs.append((group_config, [tasks[i] for i in part], run_seed, swept_keys, trace_dir,
+                             optimal_levels))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(run_group, *zip(*jobs))
+        rows = [row for group_rows in results for row in group_rows]
+    return pd.DataFrame(rows).sort_values(["point", "priority", "seed"], ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a configuration sweep with shared random traces")
+    parser.add_argument("--config", default=str(main.DEFAULT_CONFIG_PATH), help="Base configuration JSON file")
+    parser.add_argument("--grid", nargs="+", default=[], metavar="KEY=V1,V2",
+                        help="Swept values, e.g. BATTERY_SIZE=5,10,13.5 (all combinations are run)")
+    parser.add_argument("--points", default=None, help="JSON file with a list of config overrides to run")
+    parser.add_argument("--priorities", type=int, nargs="+", choices=sorted(main.PRIORITIES), default=[0],
+                        help="Strategies: " + ", ".join(f"{k}={v}" for k, v in main.PRIORITIES.items()))
+    parser.add_argument("--seeds", type=int, default=1, help="Replications per point")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed (random if omitted)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--trace", default=None, help="Replay this recorded trace instead of drawing traces")
+    parser.add_argument("--output", default=str(SWEEP_RESULTS_PATH), help="Results CSV file")
+    parser.add_argument("--optimal", action="store_true",
+                        help="Also solve every point's perfect-foresight optimum and report each strategy's gap")
+    parser.add_argument("--optimal-levels", type=int, default=optimal.OPTIMAL_LEVELS,
+                        help="State of charge grid points of the optimum")
+    args = parser.parse_args()
+
+    config = main.load_config_from_json(args.config, resolve_random=False)
+    if config is None:
+        exit(1)
+
+    points = grid_points(parse_grid(args.grid)) if args.grid else []
+    if args.points:
+        with open(args.points, "r") as f:
+            points += json.load(f)
+    if not points:
+        points = [{}]
+
+    print(f"Sweeping {len(points)} points x {len(args.priorities)} strategies x {args.seeds} seeds...")
+    trace_dir = Path(args.trace) if args.trace else None
+    try:
+        results = run_sweep(config, points, args.priorities, args.seeds, args.seed, args.workers, trace_dir,
+                            args.optimal_levels if args.optimal else None)
+    except ValueError as error:
+        print(f"Error: {error}")
+        exit(1)
+    results.to_csv(args.output, index=False)
+    print(f"Sweep results saved to: {args.output}")
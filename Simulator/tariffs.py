@@ -0,0 +1,202 @@
+# tariffs.py
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from log_store import ColumnStore, HEADER_FILE
+from utils import MINUTES_PER_DAY, DAYS_PER_YEAR, MONTH_START_DAYS
+
+BASE_DIR = Path(__file__).resolve().parent
+
+LOG_STORE_PATH = BASE_DIR.joinpath("log_store")
+TARIFFS_PATH = BASE_DIR.joinpath("tariffs.json")
+# Kept inside the log store, next to the log it prices
+TARIFF_CACHE_FILE = "tariff_cache.json"
+
+def log_clock(config, n_rows):
+    """Hour of day, weekend flag and billing month of every row of a per-step log, and the days covered
+
+    Billing periods are calendar months.
+    """
+    now = np.arange(n_rows, dtype=np.int64) * config["TIME_STEP_MIN"]
+    hour = (now % MINUTES_PER_DAY) / 60
+    day = config["SIM_START_DAY"] + now // MINUTES_PER_DAY
+    weekend = (day % 7) >= 5
+    month = np.searchsorted(MONTH_START_DAYS, day % DAYS_PER_YEAR, side="right") - 1
+    period = (day // DAYS_PER_YEAR) * 12 + month
+    n_days = int(day[-1] - day[0]) + 1 if n_rows else 0
+    return {"hour": hour, "weekend": weekend, "period": period, "n_days": n_days}
+
+def period_starts(period):
+    """Row index where each billing period begins (period is non-decreasing)"""
+    return np.concatenate(([0], np.flatnonzero(np.diff(period)) + 1))
+
+def time_of_use_rates(schedule, clock):
+    """Rate of every row: the base rate, overridden by each matching period in order"""
+    rates = np.full(len(clock["hour"]), float(schedule.get("rate", 0.0)))
+    for window in schedule.get("periods", []):
+        start, end = window["start"], window["end"]
+        if start <= end:
+            mask = (clock["hour"] >= start) & (clock["hour"] < end)
+        else:
+            # Windows past midnight, e.g. 22 -> 6
+            mask = (clock["hour"] >= start) | (clock["hour"] < end)
+        days = window.get("days", "all")
+        if days == "weekday":
+            mask &= ~clock["weekend"]
+        elif days == "weekend":
+            mask &= clock["weekend"]
+        rates[mask] = window["rate"]
+    return rates
+
+def tiered_charge(tiers, energy, period):
+    """Charge for energy billed in blocks of kWh per billing month (last tier's up_to may be None)"""
+    starts = period_starts(period)
+    cumulative = np.cumsum(energy)
+    # Energy billed so far this month, after and before each row
+    offset = np.concatenate(([0.0], cumulative))[starts]
+    after = cumulative - np.repeat(offset, np.diff(np.append(starts, len(energy))))
+    before = after - energy
+    charge = 0.0
+    low = 0.0
+    for tier in tiers:
+        high = np.inf if tier.get("up_to") is None else float(tier["up_to"])
+        in_tier = np.clip(after, low, high) - np.clip(before, low, high)
+        charge += tier["rate"] * in_tier.sum()
+        low = high
+    return float(charge)
+
+def schedule_charge(schedule, energy, clock):
+    """Price energy per row under a rate schedule: flat {"rate"}, time of use {"rate", "periods"} or {"tiers"}"""
+    if isinstance(schedule, (int, float)):
+        return float(schedule * energy.sum())
+    if "tiers" in schedule:
+        if "periods" in schedule:
+            raise ValueError("A rate schedule is either tiered or time of use, not both")
+        return tiered_charge(schedule["tiers"], energy, clock["period"])
+    if "periods" in schedule:
+        return float(energy @ time_of_use_rates(schedule, clock))
+    return float(schedule.get("rate", 0.0) * energy.sum())
+
+def price(tariff, grid_import, grid_export, clock, step_hours):
+    """Bill one run's per-step grid flows (kWh) under a tariff; returns the charges and net profit"""
+    import_cost = schedule_charge(tariff.get("import", 0.0), grid_import, clock)
+
+    export = tariff.get("export", 0.0)
+    paid_export = grid_export
+    if isinstance(export, dict) and export.get("cap_kw") is not None:
+        # Energy exported above the cap is still delivered, but not paid for
+        paid_export = np.minimum(grid_export, export["cap_kw"] * step_hours)
+    export_revenue = schedule_charge(export, paid_export, clock)
+
+    demand_charge = 0.0
+    if tariff.get("demand_charge"):
+        # Peak import power (kW) of each billing month
+        peaks = np.maximum.reduceat(grid_import, period_starts(clock["period"])) / step_hours
+        demand_charge = float(tariff["demand_charge"] * peaks.sum())
+
+    daily_charge = float(tariff.get("daily_charge", 0.0) * clock["n_days"])
+
+    total_cost = import_cost + demand_charge + daily_charge
+    return {
+        "tariff": tariff.get("name", "unnamed"),
+        "import_cost": import_cost,
+        "export_revenue": export_revenue,
+        "unpaid_export_kwh": float(grid_export.sum() - paid_export.sum()),
+        "demand_charge": demand_charge,
+        "daily_charge": daily_charge,
+        "total_cost": total_cost,
+        "net_profit": export_revenue - total_cost,
+    }
+
+def tariff_key(tariff):
+    """Stable cache key of a tariff definition"""
+    return hashlib.sha256(json.dumps(tariff, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_tariffs(path=TARIFFS_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class Repricer:
+    """Prices one logged run under any number of tariffs without re-simulating it
+
+    Only the Grid import and Grid export columns are read (memory-mapped,
+    on the first tariff that is not cached). Results are cached per
+    (log, tariff) in the log store, so a rewritten log invalidates them.
+    """
+    def __init__(self, store_dir=LOG_STORE_PATH):
+        self._store = ColumnStore(store_dir)
+        self._config = self._store.metadata.get("config", {})
+        if self._config.get("LOG_FREQUENCY", True):
+            raise ValueError("Re-pricing needs a per-step log (LOG_FREQUENCY false)")
+        self._step_hours = self._config["TIME_STEP_MIN"] / 60
+        self._flows = None
+
+        # The header is rewritten with every log, so its timestamp identifies the run
+        header_stat = store_dir.joinpath(HEADER_FILE).stat()
+        self._log_id = f"{header_stat.st_mtime_ns}-{len(self._store)}"
+        self._cache_path = store_dir.joinpath(TARIFF_CACHE_FILE)
+        self._cache = {}
+        if self._cache_path.exists():
+            with open(self._cache_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("log") == self._log_id:
+                self._cache = cached["results"]
+
+    def _load_flows(self):
+        if self._flows is None:
+            n_rows = len(self._store)
+            self._flows = (
+                np.asarray(self._store.column("Grid import"), dtype=np.float64),
+                np.asarray(self._store.column("Grid export"), dtype=np.float64),
+                log_clock(self._config, n_rows),
+            )
+        return self._flows
+
+    def price(self, tariff):
+        key = tariff_key(tariff)
+        if key not in self._cache:
+            grid_import, grid_export, clock = self._load_flows()
+            self._cache[key] = price(tariff, grid_import, grid_export, clock, self._step_hours)
+            self._save_cache()
+        return self._cache[key]
+
+    def compare(self, tariffs):
+        """One row per tariff"""
+        return pd.DataFrame([self.price(tariff) for tariff in tariffs])
+
+    def _save_cache(self):
+        # Write-then-rename so a reader never sees a half-written cache
+        tmp_path = self._cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"log": self._log_id, "results": self._cache}, f, indent=2)
+        os.replace(tmp_path, self._cache_path)
+
+
+def print_comparison(comparison):
+    print("\n" + "="*86)
+    print("   TARIFF COMPARISON")
+    print("="*86)
+    print(f"{'Tariff':<28} {'Import':>10} {'Demand':>10} {'Fixed':>10} {'Export':>10} {'Net profit':>14}")
+    for row in comparison.itertuples():
+        print(f"{row.tariff:<28} {row.import_cost:>10.2f} {row.demand_charge:>10.2f} {row.daily_charge:>10.2f} "
+              f"{row.export_revenue:>10.2f} {row.net_profit:>14.2f}")
+    print("="*86 + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-price a logged run under different tariffs")
+    parser.add_argument("--tariffs", default=str(TARIFFS_PATH), help="JSON file with a list of tariffs")
+    parser.add_argument("--log", default=str(LOG_STORE_PATH), help="Log column store of the run")
+    args = parser.parse_args()
+
+    try:
+        repricer = Repricer(Path(args.log))
+    except (FileNotFoundError, ValueError) as error:
+        print(f"Error: {error}")
+        exit(1)
+    print_comparison(repricer.compare(load_tariffs(args.tariffs)))
@@ -0,0 +1,124 @@
+# traces.py
+import argparse
+import json
+import os
+import numpy as np
+import vectorized
+
+HEADER_FILE = "header.json"
+TRACE_VERSION = 1
+
+# Per-day and per-tick series of a trace, with their on-disk dtypes
+TRACE_COLUMNS = {
+    "cloud_base": np.float64,     # Daily cloud base, one per day
+    "solar": np.float64,          # Solar energy per tick (kWh)
+    "load": np.float64,           # House load per tick (kWh)
+    "inverter_down": np.bool_,    # Inverter outage flag per tick
+}
+
+# Config keys the recorded inputs depend on: a trace only replays under the same values
+INPUT_KEYS = vectorized.TRACE_KEYS + ["PEAK_SOLAR_GENERATION", "INVERTER_MAX_OUTPUT_LIMIT",
+                                      "ENERGY_BASE_LOAD", "RANDOM_SPIKES_MAX"]
+
+
+class TraceRecorder:
+    """Collects the exogenous inputs of one run (weather, load, inverter outages) for saving as a trace"""
+    def __init__(self):
+        self._columns = {name: [] for name in TRACE_COLUMNS}
+        # The run's config with "random" values resolved, set by main.run_simulation
+        self.config = None
+
+    def record_day(self, cloud_base):
+        self._columns["cloud_base"].append(cloud_base)
+
+    def record(self, solar, load, inverter_down):
+        """Append one tick's inputs"""
+        self._columns["solar"].append(solar)
+        self._columns["load"].append(load)
+        self._columns["inverter_down"].append(inverter_down)
+
+    def record_span(self, solar, load, inverter_down):
+        """Append the inputs of several consecutive ticks"""
+        self._columns["solar"].extend(solar.tolist())
+        self._columns["load"].extend(load.tolist())
+        self._columns["inverter_down"].extend(inverter_down.tolist())
+
+    def record_inputs(self, inputs):
+        """Take a whole run's inputs at once (the vectorized engine's draw_inputs result)"""
+        for name in TRACE_COLUMNS:
+            self._columns[name] = inputs[name]
+
+    def save(self, directory):
+        save_trace(directory, self._columns, self.config)
+
+
+def save_trace(directory, columns, config):
+    """Write trace columns as .npy files plus a header with the settings they were drawn under"""
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, dtype in TRACE_COLUMNS.items():
+        np.save(directory.joinpath(f"{name}.npy"), np.asarray(columns[name], dtype=dtype))
+    header = {
+        "version": TRACE_VERSION,
+        "n_days": len(columns["cloud_base"]),
+        "n_ticks": len(columns["solar"]),
+        "settings": {key: config[key] for key in INPUT_KEYS},
+        "config": config,
+    }
+    # Write-then-rename so readers never see a half-written header
+    tmp_path = directory.joinpath(HEADER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_path, directory.joinpath(HEADER_FILE))
+
+
+class Trace:
+    """A saved trace; its series are memory-mapped, so only the pages actually read are loaded"""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(directory.joinpath(HEADER_FILE), "r") as f:
+            self.header = json.load(f)
+        self.settings = self.header["settings"]
+        self.n_ticks = self.header["n_ticks"]
+        for name in TRACE_COLUMNS:
+            setattr(self, name, np.load(directory.joinpath(f"{name}.npy"), mmap_mode="r"))
+
+    def mismatched_keys(self, config):
+        """Input settings where config differs from the trace ("random" matches anything)"""
+        return [key for key in INPUT_KEYS if config[key] != "random" and config[key] != self.settings[key]]
+
+    def apply(self, config):
+        """config with the trace's input settings, or ValueError if it asks for different inputs"""
+        mismatched = self.mismatched_keys(config)
+        if mismatched:
+            details = ", ".join(f"{key}={config[key]} (trace: {self.settings[key]})" for key in mismatched)
+            raise ValueError(f"Trace {self.directory} was recorded with different settings: {details}")
+        return dict(config, **self.settings)
+
+    def inputs(self):
+        """The trace in the vectorized engine's inputs form"""
+        return {name: np.asarray(getattr(self, name)) for name in TRACE_COLUMNS}
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    import main
+    from log_buffer import NullLog
+
+    parser = argparse.ArgumentParser(description="Record the exogenous inputs of one run as a replayable trace")
+    parser.add_argument("--config", default=str(main.DEFAULT_CONFIG_PATH), help="Configuration JSON file")
+    parser.add_argument("--engine", choices=["simpy", "vectorized"], default=None,
+                        help="Simulation engine (defaults to the config's ENGINE)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed (random if omitted)")
+    parser.add_argument("--output", default=str(main.TRACE_PATH), help="Trace directory")
+    args = parser.parse_args()
+
+    config = main.load_config_from_json(args.config, resolve_random=False)
+    if config is None:
+        exit(1)
+    engine = args.engine or config.get("ENGINE", "simpy")
+
+    recorder = TraceRecorder()
+    # Only the inputs are wanted, so no log rows are kept; the strategy does not affect them
+    main.run_simulation(config, 0, engine, args.seed, log=NullLog(), recorder=recorder)
+    recorder.save(Path(args.output))
+    print(f"Trace saved to: {args.output}")
@@ -1,13 +1,40 @@
 # utils.py
-import math
 import random
-from datetime import date, timedelta
+
+# Cloud coverage ranges for the four daily weather categories (clear to overcast)
+CLOUD_CATEGORIES = [(0.0, 0.2), (0.2, 0.6), (0.6, 0.8), (0.8, 0.9)]
+
+SEASON_CLOUD_PROBS = {
+    "Spring": [0.1, 0.3, 0.4, 0.2],
+    "Summer": [0.05, 0.15, 0.3, 0.5],
+    "Fall": [0.2, 0.4, 0.3, 0.1],
+    "Winter": [0.3, 0.4, 0.2, 0.1],
+}
+
+MINUTES_PER_DAY = 24 * 60
+DAYS_PER_YEAR = 365
+# Day of year each month starts on
+MONTH_START_DAYS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+def steps_per_day(step_min):
+    """Ticks in one simulated day of TIME_STEP_MIN-minute steps"""
+    return MINUTES_PER_DAY // step_min
+
+def step_probability(hourly_prob, step_hours):
+    """Chance per step of an event given as a chance per hour"""
+    if step_hours == 1:
+        return hourly_prob
+    return 1 - (1 - hourly_prob) ** step_hours
 
 def hour_of_day(env):
     return (env.now / 60) % 24
 
+def days_elapsed(env, start_day):
+    """Days since Jan 1st of the first simulated year (keeps counting past the year end)"""
+    return start_day + int(env.now / MINUTES_PER_DAY)
+
 def day_of_year(env, start_day):
-    return start_day + int(env.now / (60 * 24))
+    return days_elapsed(env, start_day) % DAYS_PER_YEAR
 
 def season_from_day(day):
     if 80 <= day < 172:
@@ -18,11 +45,6 @@ def season_from_day(day):
         return "Fall"
     return "Winter"
 
-def daily_cloud_coverage(season_probs):
-    categories = [
-        random.uniform(0.0, 0.2),
-        random.uniform(0.2, 0.6),
-        random.uniform(0.6, 0.8),
-        random.uniform(0.8, 0.9),
-    ]
-    return random.choices(categories, weights=season_probs, k=1)[0]
+def daily_cloud_coverage(season_probs, rng=random):
+    categories = [rng.uniform(low, high) for low, high in CLOUD_CATEGORIES]
+    return rng.choices(categories, weights=season_probs, k=1)[0]
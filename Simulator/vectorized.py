@@ -0,0 +1,388 @@
+# vectorized.py
+import math
+import numpy as np
+import profiling
+import strategies
+from house_load import APPLIANCES
+from log_buffer import LogBuffer
+from sampling import stratified_uniforms
+from utils import CLOUD_CATEGORIES, SEASON_CLOUD_PROBS, DAYS_PER_YEAR, MINUTES_PER_DAY, steps_per_day, step_probability
+
+SEASONS = ["Spring", "Summer", "Fall", "Winter"]
+
+def tick_times(config):
+    """Simulation clock (minutes) at every tick the SimPy engine visits"""
+    n_ticks = config["SIM_DURATION_DAY"] * steps_per_day(config["TIME_STEP_MIN"])
+    return np.arange(n_ticks, dtype=np.int64) * config["TIME_STEP_MIN"]
+
+def season_index(days):
+    """Vectorized utils.season_from_day, as an index into SEASONS"""
+    return np.select(
+        [(days >= 80) & (days < 172), (days >= 172) & (days < 264), (days >= 264) & (days < 355)],
+        [0, 1, 2],
+        default=3,
+    )
+
+def draw_cloud_bases(seasons, rng, stratified=False):
+    """One daily_cloud_coverage draw per day, given each day's season index
+
+    Stratified, each season's days pick their weather category from
+    stratified uniforms, so the run has each category's expected share of days.
+    """
+    probs = np.array([SEASON_CLOUD_PROBS[name] for name in SEASONS])
+    cumulative = np.cumsum(probs, axis=1)[seasons]
+    u = stratified_uniforms(seasons, rng) if stratified else rng.random(len(seasons))
+    u = u[:, None]
+    category = np.minimum((u >= cumulative).sum(axis=1), len(CLOUD_CATEGORIES) - 1)
+    bounds = np.array(CLOUD_CATEGORIES)[category]
+    return rng.uniform(bounds[:, 0], bounds[:, 1])
+
+def draw_inverter_down(now, failure_freq, failure_duration, step_hours, rng):
+    """Inverter.is_down for every tick: failures start a window of failure_duration hours"""
+    down = np.zeros(len(now), dtype=bool)
+    down_until = -1
+    failure_prob = step_probability(failure_freq / 24, step_hours)
+    # Failures are rare, so only the ticks that drew a failure are visited
+    for k in np.flatnonzero(rng.random(len(now)) < failure_prob):
+        if now[k] < down_until:
+            continue
+        down_until = now[k] + failure_duration * 60
+        end = np.searchsorted(now, down_until, side="left")
+        down[k:end] = True
+    return down
+
+def draw_appliance_load(weekend, step_hours, rng):
+    """HouseLoad._get_appliance_load for every tick
+
+    Each start is drawn as an exponential wait on the ticks' cumulative
+    hazard -log(1 - p): the same distribution as a coin flip per tick, from
+    one draw per start. The draws come as a fixed-size block, so a mirrored
+    (antithetic) run stays in step with its partner's stream.
+    """
+    n_ticks = len(weekend)
+    total = np.zeros(n_ticks)
+    # Weekend and weekday ticks up to and including each tick
+    weekend_ticks = np.cumsum(weekend)
+    weekday_ticks = np.arange(1, n_ticks + 1) - weekend_ticks
+    for power, duration, prob in APPLIANCES.values():
+        # An appliance stays on for ceil(duration / step) ticks and cannot restart while running
+        length = math.ceil(duration / step_hours)
+        prob = step_probability(prob, step_hours)
+        hazard = -math.log1p(-prob) * weekday_ticks - math.log1p(-prob * 1.5) * weekend_ticks
+        waits = -np.log1p(-rng.random(n_ticks // length + 1))
+        starts = []
+        elapsed = 0.0
+        for wait in waits.tolist():
+            k = int(np.searchsorted(hazard, elapsed + wait, side="right"))
+            if k >= n_ticks:
+                break
+            starts.append(k)
+            if k + length >= n_ticks:
+                break
+            # The wait for the next start begins once this run is over
+            elapsed = hazard[k + length - 1]
+        # Mark each run as +power at its start and -power after its end, then integrate
+        edges = np.zeros(n_ticks + length)
+        starts = np.array(starts, dtype=np.int64)
+        edges[starts] += power
+        edges[starts + length] -= power
+        total += np.cumsum(edges)[:n_ticks]
+    return total
+
+# Config keys that shape the random traces; everything else (sizes, limits,
+# tariffs, base load, spike size) only scales or dispatches them
+TRACE_KEYS = ["TIME_STEP_MIN", "SIM_DURATION_DAY", "SIM_START_DAY",
+              "INVERTER_FAILURE_FREQUENCY", "INVERTER_FAILURE_DURATION"]
+
+def _clock(config):
+    """Hour of day, day index, clock hour index, weekend flag and season index of every tick"""
+    now = tick_times(config)
+    # Integer clock arithmetic is much cheaper than float modulo over the whole horizon
+    hour = (now % MINUTES_PER_DAY) / 60
+    day_idx = now // MINUTES_PER_DAY
+    # Clock hour since the start of the run: sub-hourly ticks share its weather and spikes
+    hour_idx = now // 60
+    day = config["SIM_START_DAY"] + day_idx
+    weekend = (day % 7) >= 5
+    seasons = season_index(day % DAYS_PER_YEAR)
+    return now, hour, day_idx, hour_idx, weekend, seasons
+
+def draw_traces(config, rng):
+    """Draw the whole horizon's random inputs in a form that does not depend on sizes, limits or tariffs
+
+    Only the TRACE_KEYS settings are used, so one set of traces can be
+    turned into inputs for many configurations (see inputs_from_traces).
+    """
+    now, hour, day_idx, hour_idx, weekend, seasons = _clock(config)
+    n_ticks = len(now)
+    n_hours = int(hour_idx[-1]) + 1
+    step_hours = config["TIME_STEP_MIN"] / 60
+
+    # Daily cloud base, redrawn whenever the day changes
+    days = config["SIM_START_DAY"] + np.arange(day_idx[-1] + 1)
+    cloud_base = draw_cloud_bases(season_index(days % DAYS_PER_YEAR), rng, config.get("CLOUD_STRATIFIED", False))
+
+    inverter_down = draw_inverter_down(
+        now, config["INVERTER_FAILURE_FREQUENCY"], config["INVERTER_FAILURE_DURATION"], step_hours, rng
+    )
+
+    # Hourly cloud variation and brief heavy clouds
+    cloud_variation = rng.uniform(-0.3, 0.3, n_hours)[hour_idx]
+    hourly_cloud = np.clip(cloud_base[day_idx] + cloud_variation, 0.0, 0.95)
+    heavy = (rng.random(n_hours) < 0.1)[hour_idx]
+    heavy_extra = rng.uniform(0.2, 0.5, n_hours)[hour_idx]
+    hourly_cloud = np.where(heavy, np.minimum(0.95, hourly_cloud + heavy_extra), hourly_cloud)
+
+    # Load noise, evening spikes (size as a 0-1 fraction of the spike range) and appliances
+    noise = np.maximum(0.0, rng.normal(0.0, 0.1, n_ticks))
+    # By clock hour, as in HouseLoad.demand: the 21:00 spike holds for all of 21:xx
+    clock_hour = hour_idx % 24
+    evening = (clock_hour >= 18) & (clock_hour <= 21)
+    spike = evening & (rng.random(n_hours)[hour_idx] < np.where(weekend, 0.6, 0.4))
+    spike_size = rng.random(n_hours)[hour_idx]
+    appliance_load = draw_appliance_load(weekend, step_hours, rng)
+
+    return {
+        "cloud_base": cloud_base,
+        "hourly_cloud": hourly_cloud,
+        "inverter_down": inverter_down,
+        "noise": noise,
+        "spike": spike,
+        "spike_size": spike_size,
+        "appliance_load": appliance_load,
+    }
+
+def inputs_from_traces(config, traces):
+    """Solar and load energy per tick for this configuration, from traces drawn by draw_traces"""
+    _, hour, _, _, weekend, seasons = _clock(config)
+    step_hours = config["TIME_STEP_MIN"] / 60
+
+    # Solar generation
+    raw = config["PEAK_SOLAR_GENERATION"] * np.sin((hour - 6) * (math.pi / 12))
+    clipped = np.minimum(raw, config["INVERTER_MAX_OUTPUT_LIMIT"])
+    daylight = (hour >= 6) & (hour <= 18) & ~traces["inverter_down"]
+    # kW -> kWh delivered over each step
+    solar = np.where(daylight, clipped * (1 - traces["hourly_cloud"]), 0.0) * step_hours
+
+    # House load: weekend and seasonal factors, noise, evening spikes and appliances
+    load = np.full(len(hour), float(config["ENERGY_BASE_LOAD"]))
+    load[weekend] *= 1.3
+    load[seasons == 1] *= 1.5
+    load[seasons == 3] *= 1.6
+    load += traces["noise"]
+    spike_low = 0.5
+    spike_high = config["RANDOM_SPIKES_MAX"]
+    load += np.where(traces["spike"], spike_low + (spike_high - spike_low) * traces["spike_size"], 0.0)
+    load += traces["appliance_load"]
+    load *= step_hours
+
+    return {
+        "cloud_base": traces["cloud_base"],
+        "solar": solar,
+        "load": load,
+        "inverter_down": traces["inverter_down"],
+    }
+
+def draw_inputs(config, rng):
+    """Draw the whole horizon's exogenous inputs (solar, load, inverter outages) in one batch"""
+    return inputs_from_traces(config, draw_traces(config, rng))
+
+def _dispatch_kernel(priority, solar, load, soc, size, eff, floor,
+                     zero_export, export_limit, import_limit,
+                     out_soc, out_import, out_export, out_unmet):
+    """Built-in strategies (see strategies.py) over a whole series, Battery/Grid calls inlined so it can be compiled"""
+    n_ticks = len(solar)
+    if priority == 0:  # Load Priority
+        for k in range(n_ticks):
+            net = solar[k] - load[k]
+            grid_import = grid_export = unmet = 0.0
+            if net >= 0:
+                charged = min(net * eff, size * (100 - soc) / 100)
+                soc += 100 * charged / size
+                if zero_export and soc == 100:
+                    grid_export = 0.0
+                else:
+                    grid_export = max(0.0, net - charged)
+            else:
+                supplied = min(-net / eff, size * (soc - floor) / 100)
+                soc -= 100 * supplied / size
+                deficit = -net - supplied
+                if deficit > 0:
+                    grid_import = min(deficit, import_limit)
+                    unmet = deficit - grid_import
+            out_soc[k] = soc
+            out_import[k] = grid_import
+            out_export[k] = grid_export
+            out_unmet[k] = unmet
+
+    elif priority == 1:  # Charge Priority
+        for k in range(n_ticks):
+            charged = min(solar[k] * eff, size * (100 - soc) / 100)
+            soc += 100 * charged / size
+            net_after_battery = solar[k] - charged - load[k]
+            grid_import = grid_export = unmet = 0.0
+            if net_after_battery >= 0:
+                if zero_export:
+                    grid_export = 0.0
+                else:
+                    grid_export = min(net_after_battery, export_limit)
+            else:
+                grid_import = min(-net_after_battery, import_limit)
+                unmet = -net_after_battery - grid_import
+            out_soc[k] = soc
+            out_import[k] = grid_import
+            out_export[k] = grid_export
+            out_unmet[k] = unmet
+
+    elif priority == 2:  # Produce Priority
+        for k in range(n_ticks):
+            if zero_export:
+                grid_export = 0.0
+            else:
+                grid_export = min(solar[k], export_limit)
+            remainder = solar[k] - grid_export
+            charged = min(remainder * eff, size * (100 - soc) / 100)
+            soc += 100 * charged / size
+            net_deficit = max(0.0, load[k] - (remainder - charged))
+            provided = min(net_deficit / eff, size * (soc - floor) / 100)
+            soc -= 100 * provided / size
+            still_needed = net_deficit - provided
+            grid_import = min(still_needed, import_limit)
+            out_soc[k] = soc
+            out_import[k] = grid_import
+            out_export[k] = grid_export
+            out_unmet[k] = still_needed - grid_import
+
+# Compiled once per process when numba is installed; False once numba turned out to be missing
+_compiled_kernel = None
+
+def compiled_kernel():
+    """_dispatch_kernel compiled by numba, or None without numba
+
+    numba takes a quarter of a second to import, so it is only loaded by
+    the first dispatch() call; later processes load the compiled kernel
+    from numba's on-disk cache.
+    """
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        try:
+            from numba import njit
+        except ImportError:  # numba is optional, the dispatch kernel then runs as plain Python
+            _compiled_kernel = False
+        else:
+            _compiled_kernel = njit(cache=True)(_dispatch_kernel)
+    return _compiled_kernel or None
+
+# Strategies _dispatch_kernel implements; others run their strategies.py kernel tick by tick
+KERNEL_PRIORITIES = (0, 1, 2)
+
+def dispatch(priority, solar, load, config, soc=100.0, floor=5.0):
+    """Run the dispatch strategy over whole solar/load arrays, return per-tick flows"""
+    if priority not in KERNEL_PRIORITIES:
+        return strategies.run_series(priority, solar, load, config, soc, floor)
+    n_ticks = len(solar)
+    # Grid limits are power (kW); per tick they cap the energy moved in one step
+    step_hours = config["TIME_STEP_MIN"] / 60
+    params = (
+        float(soc), float(config["BATTERY_SIZE"]), float(config["BATTERY_ROUND_TRIP_EFFICIENCY"]), float(floor),
+        bool(config["IS_ZERO_EXPORT"]),
+        float(config["GRID_MAX_EXPORT_LIMIT"]) * step_hours, float(config["GRID_MAX_IMPORT_LIMIT"]) * step_hours,
+    )
+    kernel = compiled_kernel()
+    if kernel is not None:
+        outputs = [np.empty(n_ticks) for _ in range(4)]
+        kernel(priority, np.asarray(solar, dtype=np.float64), np.asarray(load, dtype=np.float64),
+               *params, *outputs)
+    else:
+        # Plain lists index much faster than NumPy arrays from pure-Python loops
+        outputs = [[0.0] * n_ticks for _ in range(4)]
+        _dispatch_kernel(priority, solar.tolist(), load.tolist(), *params, *outputs)
+        outputs = [np.array(values) for values in outputs]
+    out_soc, out_import, out_export, out_unmet = outputs
+    return {
+        "soc": out_soc,
+        "grid_import": out_import,
+        "grid_export": out_export,
+        "unmet": out_unmet,
+    }
+
+def build_log(config, inputs, flows, log=None):
+    """Turn per-tick inputs and flows into the same log rows the SimPy engine writes"""
+    revenue = flows["grid_export"] * config["COST_ENERGY_EXPORTED"]
+    cost = flows["grid_import"] * config["COST_ENERGY_IMPORTED"]
+    unmet = flows["unmet"] > 0
+    per_tick = {
+        "Battery state of charge": flows["soc"],
+        "Solar generation": inputs["solar"],
+        "Load demand": inputs["load"],
+        "Grid import": flows["grid_import"],
+        "Grid export": flows["grid_export"],
+        "Unmet load": unmet,
+        "Revenue from exported energy": revenue,
+        "Cost of imported energy": cost,
+        "Inverter status": inputs["inverter_down"],
+    }
+    accumulated = {
+        "Daily solar generation": inputs["solar"],
+        "Daily revenue": revenue - cost,
+        "Daily import": flows["grid_import"],
+        "Daily export": flows["grid_export"],
+        "Daily cost": cost,
+        "Daily unmet load (count)": unmet.astype(np.float64),
+        "Daily load": inputs["load"],
+    }
+
+    if config["LOG_FREQUENCY"]:
+        # One row per day: the day's last tick plus that day's totals
+        steps = steps_per_day(config["TIME_STEP_MIN"])
+        columns = {name: values[steps - 1::steps] for name, values in per_tick.items()}
+        for name, values in accumulated.items():
+            columns[name] = values.reshape(-1, steps).sum(axis=1)
+    else:
+        # Hourly rows carry accumulators that are never reset during the run
+        columns = dict(per_tick)
+        for name, values in accumulated.items():
+            columns[name] = np.cumsum(values)
+
+    if log is None:
+        return LogBuffer.from_columns(columns)
+    log.append_columns(columns)
+    return log
+
+def run(config, priority, rng=None, log=None, stats=None, profiler=None, recorder=None, trace=None):
+    """Vectorized engine: batch-draw all inputs (or take them from a trace), then run only the dispatch loop per tick
+
+    With SHARD_DAYS set, the run is split into shards of that many days that
+    are drawn and dispatched in parallel, then stitched (see sharding.run).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if config.get("SHARD_DAYS"):
+        # Lazy import: sharding builds on this module
+        import sharding
+        with profiling.phase(profiler, "vectorized.shards"):
+            inputs, flows, _ = sharding.run(config, priority, rng, config["SHARD_DAYS"], trace)
+    else:
+        if trace is not None:
+            inputs = trace.inputs()
+        else:
+            with profiling.phase(profiler, "vectorized.draw_inputs"):
+                inputs = draw_inputs(config, rng)
+        with profiling.phase(profiler, "vectorized.dispatch"):
+            flows = dispatch(priority, inputs["solar"], inputs["load"], config)
+    if recorder is not None:
+        recorder.record_inputs(inputs)
+    if stats is not None:
+        with profiling.phase(profiler, "vectorized.statistics"):
+            stats.update_many({
+                "soc": flows["soc"],
+                "solar": inputs["solar"],
+                "load": inputs["load"],
+                "grid_import": flows["grid_import"],
+                "grid_export": flows["grid_export"],
+                "unmet": flows["unmet"],
+                "revenue": flows["grid_export"] * config["COST_ENERGY_EXPORTED"],
+                "cost": flows["grid_import"] * config["COST_ENERGY_IMPORTED"],
+            }, inputs["inverter_down"])
+    with profiling.phase(profiler, "vectorized.build_log"):
+        return build_log(config, inputs, flows, log)